@@ -4,3 +4,20 @@ from django.apps import AppConfig
 class LibraryapiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'LibraryAPI'
+
+    # connect the signal receivers once the app registry is ready
+    # https://docs.djangoproject.com/en/5.1/topics/signals/#connecting-receiver-functions
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        from django.conf import settings
+        from django.db.backends.signals import connection_created
+
+        # count the queries of the actions with a query budget (see query_budget.py)
+        from .query_budget import install_budget_counter
+        connection_created.connect(install_budget_counter)
+
+        # count & time the queries of each request when the request metrics are on (see metrics.py)
+        if settings.LIBRARY_METRICS:
+            from .metrics import install_query_recorder
+            connection_created.connect(install_query_recorder)
@@ -0,0 +1,347 @@
+# import json to encode streamed rows
+import json
+
+# import itertools to read the exported lines in chunks
+import itertools
+
+# import the helpers that move between async & sync code
+# https://docs.djangoproject.com/en/5.1/topics/async/#async-adapter-functions
+from asgiref.sync import sync_to_async, iscoroutinefunction, markcoroutinefunction
+
+# import settings to find the session cookie
+from django.conf import settings
+
+# import the errors raised by the ORM for missing books, bad ids & duplicate books
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError
+
+# import action to add extra routes to the viewset
+from rest_framework.decorators import action
+
+# import the JSON parser & the NDJSON parser for bulk requests
+from rest_framework.parsers import JSONParser
+from .parsers import NDJSONParser
+
+# import Response to return API responses in correct format
+from rest_framework.response import Response
+
+# import status for HTTP status codes
+from rest_framework import status
+
+# import DRF's not found exception
+from rest_framework.exceptions import NotFound
+
+# import the browsable API renderer, whose forms may query the database while rendering
+from rest_framework.renderers import BrowsableAPIRenderer
+
+# import DRF's encoder so streamed rows are encoded like the rest of the API
+from rest_framework.utils.encoders import JSONEncoder
+
+# import models
+from .models import Book
+
+# import serializers
+from .serializers import BookReadSerializer
+
+
+# import the full text search
+from .search import search_books
+
+# import the response cache
+from .caching import cache_book_response, abump_catalogue_generation
+
+# import the chunk size of the export
+from .transfer import EXPORT_CHUNK_SIZE
+
+# import timed to record the time of the rate limit check in the request metrics
+from .metrics import timed
+
+# import the query budgets of the actions
+from .query_budget import query_budget
+
+# import the Idempotency-Key handling of the creates
+from .idempotency import idempotent
+
+# import the read replica routing
+from .db_routers import astart_replica_reads, apin_to_primary
+
+# import the synchronous viewset to reuse its configuration, query building & envelopes
+from .views import BookViewSet
+
+########################################################################
+
+# define a DRF response that is rendered on the event loop
+# Django renders every response with deferred rendering after the view returns,
+# in a thread unless render() is a coroutine function, so a plain Response would cost a thread hop per request
+class EventLoopResponse(Response):
+    async def render(self):
+        if isinstance(self.accepted_renderer, BrowsableAPIRenderer):
+            return await sync_to_async(super().render)()
+        return super().render()
+
+
+# define a native async version of BookViewSet for ASGI servers (e.g. uvicorn LibraryManagement.asgi:application)
+# under ASGI, Django runs a sync view in a worker thread (sync_to_async) for every request
+# this viewset runs on the event loop instead, so a waiting request does not hold a thread:
+# - list, retrieve, create, update & destroy use the async ORM (aget, acreate, asave, adelete, async for)
+# - the throttle & the response cache use the cache's async methods
+# - the query building, filters, pagination cursor, serializers & envelopes are the same as BookViewSet's
+# DRF views are synchronous, so dispatch() & initial() are re-implemented here as coroutines
+# the URLs use this viewset when LIBRARY_ASYNC_VIEWS is on, which asgi.py turns on by default
+# note: Django's SQLite backend still runs each query on its single database thread,
+# so the gain is in concurrency (idle connections cost no threads), not in faster queries
+# https://docs.djangoproject.com/en/5.1/topics/async/#queries-the-orm
+class AsyncBookViewSet(BookViewSet):
+
+    # mark the view function returned for the router as a coroutine function,
+    # so Django awaits it directly instead of running it in a thread
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        return markcoroutinefunction(view)
+
+    # the same steps as APIView.dispatch(), awaiting the async parts
+    # https://www.django-rest-framework.org/api-guide/views/#dispatch-methods
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+
+            # get the appropriate handler method
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            # run handlers that have no async version (e.g. OPTIONS) in a thread, as they may query the database
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    # add the rate limit headers & render the response on the event loop
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if type(response) is Response:
+            response.__class__ = EventLoopResponse
+        return response
+
+    # the same steps as APIView.initial()
+    async def ainitial(self, request, *args, **kwargs):
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+
+        # perform content negotiation and store the accepted info on the request
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+
+        # determine the API version
+        version, scheme = self.determine_version(request, *args, **kwargs)
+        request.version, request.versioning_scheme = version, scheme
+
+        # anonymous requests are authenticated without touching the database,
+        # only a session cookie or an Authorization header needs a query
+        if 'HTTP_AUTHORIZATION' in request.META or settings.SESSION_COOKIE_NAME in request.COOKIES:
+            await sync_to_async(self.perform_authentication)(request)
+        else:
+            self.perform_authentication(request)
+
+        self.check_permissions(request)
+        await self.acheck_throttles(request)
+
+        # send the reads of list, retrieve & fetch to a read replica (see BookViewSet.initial)
+        if self.action in ('list', 'retrieve', 'fetch'):
+            self.replica_token = await astart_replica_reads(self.get_client_ident(request))
+
+    # the same as APIView.check_throttles(), using the async check of throttles that have one
+    async def acheck_throttles(self, request):
+        throttle_durations = []
+        with timed('throttle'):
+            for throttle in self.get_throttles():
+                if hasattr(throttle, 'aallow_request'):
+                    allowed = await throttle.aallow_request(request, self)
+                else:
+                    allowed = await sync_to_async(throttle.allow_request)(request, self)
+                if not allowed:
+                    throttle_durations.append(throttle.wait())
+
+        if throttle_durations:
+            durations = [duration for duration in throttle_durations if duration is not None]
+            self.throttled(request, max(durations, default=None))
+
+    # the same as GenericAPIView.get_object(), fetching the book with aget()
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            instance = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (Book.DoesNotExist, TypeError, ValueError, DjangoValidationError):
+            raise NotFound()
+
+        self.check_object_permissions(self.request, instance)
+        return instance
+
+    # return a page of books (see BookViewSet.list)
+    @cache_book_response
+    @query_budget(1)
+    async def list(self, request, *args, **kwargs):
+        if self.is_multi_get():
+            ids = self.get_multi_get_ids()
+            return self.get_multi_get_response(ids, [row async for row in self.get_multi_get_rows(ids)])
+
+        queryset = self.filter_queryset(self.get_queryset())
+
+        if request.query_params.get('stream') in ('1', 'true'):
+            return self.stream_list(request, queryset)
+
+        if 'q' in request.query_params:
+            # raw FTS5 queries have no async iteration, so run the search in the database thread
+            books = await sync_to_async(search_books)(**self.get_search_params(request), queryset=queryset)
+            return self.get_search_response(books)
+
+        page = await self.paginator.apaginate_queryset(
+            queryset.values(*self.get_query_columns()), request, view=self
+        )
+        return self.get_list_response(page)
+
+    # yield one JSON encoded book per line, reading the rows with async iteration
+    # StreamingHttpResponse sends an async generator without a thread under ASGI
+    async def generate_ndjson(self, queryset):
+        serializer = BookReadSerializer(self.get_requested_fields())
+        rows = queryset.values(*self.get_query_columns())
+        async for row in rows.aiterator(chunk_size=self.stream_chunk_size):
+            yield json.dumps(
+                serializer.to_representation(row),
+                cls=JSONEncoder,
+                ensure_ascii=False,
+                separators=(',', ':'),
+                ) + '\n'
+
+    # return a single book (see BookViewSet.retrieve)
+    @cache_book_response
+    @query_budget(1)
+    async def retrieve(self, request, *args, **kwargs):
+        try:
+            instance = await self.aget_object()
+        except NotFound:
+            return Response(
+                {
+                    "status": "error",
+                    "code": 404,
+                    "message": "No Book matches the given query",
+                    "data": None,
+                },
+                status=status.HTTP_404_NOT_FOUND,
+                )
+
+        return self.get_book_response(instance)
+
+    # add a book (see BookViewSet.create)
+    # - the serializer has no UniqueTogetherValidator (see BookViewSet.get_serializer_class),
+    #   the unique constraint rejects a duplicate in the INSERT
+    @idempotent
+    @query_budget(1)
+    async def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            serializer.instance = await Book.objects.acreate(**serializer.validated_data)
+        except IntegrityError as error:
+            self.raise_duplicate(error)
+        await abump_catalogue_generation()
+        await apin_to_primary(self.get_client_ident(request))
+
+        return Response(
+            {
+                "status": "success",
+                "code": 201,
+                "message": "Successfully added Book",
+                "data": serializer.data,
+            },
+            status=status.HTTP_201_CREATED,
+            headers=self.get_success_headers(serializer.data),
+            )
+
+    # update a book with PUT or PATCH (see BookViewSet.update)
+    @query_budget(2)
+    async def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = await self.aget_object()
+
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+
+        for field, value in serializer.validated_data.items():
+            setattr(instance, field, value)
+        try:
+            await instance.asave()
+        except IntegrityError as error:
+            self.raise_duplicate(error)
+        await abump_catalogue_generation()
+        await apin_to_primary(self.get_client_ident(request))
+
+        return Response(
+            {
+                "status": "success",
+                "code": 200,
+                "message": "Successfully updated Book",
+                "data": serializer.data,
+            },
+            status=status.HTTP_200_OK,
+            headers=self.get_success_headers(serializer.data),
+            )
+
+    async def partial_update(self, request, *args, **kwargs):
+        kwargs['partial'] = True
+        return await self.update(request, *args, **kwargs)
+
+    # delete a book (see BookViewSet.destroy)
+    # QuerySet.adelete() runs the delete in the database thread anyway, so run delete_object() there
+    @query_budget(3)
+    async def destroy(self, request, *args, **kwargs):
+        if not await sync_to_async(self.delete_object)():
+            raise NotFound()
+        await abump_catalogue_generation()
+        await apin_to_primary(self.get_client_ident(request))
+
+        return Response(
+            {
+                "status": "success",
+                "code": 204,
+                "message": "Successfully deleted Book",
+            },
+            status=status.HTTP_204_NO_CONTENT,
+            )
+
+    # return many books by id (see BookViewSet.fetch)
+    @action(detail=False, methods=['post'], url_path='fetch')
+    @query_budget(1)
+    async def fetch(self, request, *args, **kwargs):
+        ids = self.get_multi_get_ids()
+        return self.get_multi_get_response(ids, [row async for row in self.get_multi_get_rows(ids)])
+
+    # bulk requests validate & write in chunked transactions with several queries each,
+    # so run the whole batch in the database thread in one go (see BookViewSet.bulk)
+    @action(detail=False, methods=['post', 'put', 'patch', 'delete'], url_path='bulk',
+            parser_classes=[JSONParser, NDJSONParser])
+    async def bulk(self, request, *args, **kwargs):
+        return await sync_to_async(super().bulk)(request, *args, **kwargs)
+
+    # the export reads its rows in the database thread (see BookViewSet.export),
+    # but its content must be an async generator: under ASGI Django reads a sync iterator into a list before sending it
+    async def get_export_content(self, lines):
+        lines = (line for _, line in lines)
+        read_chunk = sync_to_async(lambda: ''.join(itertools.islice(lines, EXPORT_CHUNK_SIZE)))
+        while chunk := await read_chunk():
+            yield chunk
@@ -0,0 +1,327 @@
+# import json to read the request mixes & responses, & to store the baselines
+import json
+
+# import os, platform & shutil to copy the catalogues & describe the environment
+import os
+import platform
+import shutil
+
+# import random to build the same catalogue & the same request sequence on every run
+import random
+
+# import re to fill the placeholders of the mix
+import re
+
+# import time to measure latency
+import time
+
+# import contextmanager to switch the API to the benchmark database & cache
+from contextlib import contextmanager
+
+# import date & timedelta to build synthetic books
+from datetime import date, timedelta
+
+# import django & DRF to record their versions with the results
+import django
+import rest_framework
+
+# import settings & connection to switch to the benchmark database
+from django.conf import settings
+from django.db import connection, transaction
+
+# import the test client to send requests through the whole middleware stack without a network
+# & override_settings to use a scratch cache
+from django.test import Client, override_settings
+
+# import models
+from .models import Book
+
+# import the throttle to raise its rate during the benchmark
+from .throttling import SlidingWindowAnonRateThrottle
+
+#########################################################################################################
+
+# benchmark suite for the books API, used by the seed_books & bench_api commands
+# - seed_catalogue() builds the same synthetic catalogue for a given size & seed on every machine
+# - a request mix is a JSONL file with one weighted request per line (see benchmarks/default.jsonl), e.g.
+#   {"name": "retrieve", "weight": 30, "method": "GET", "path": "/api/v1/books/{id}/"}
+#   {"name": "create", "weight": 5, "method": "POST", "path": "/api/v1/books/", "body": {"title": "Bench {n}", ...}}
+# - replay() sends a seeded random sequence of the mix's requests through django's test client
+#   & returns the latency of each request by name
+# - baselines are JSON files with the results & the versions they were measured with
+# the placeholders of paths & bodies are filled for each request:
+# {id} a seeded book, {created_id} a book created by this run (the request is skipped if there is none),
+# {n} a number unique to this run, {author}, {genre} & {word} a seeded author, genre & title word
+
+# the words the synthetic books are made of
+TITLE_WORDS = (
+    'Shadow', 'River', 'Garden', 'Empire', 'Winter', 'Secret', 'Silver', 'Night', 'Storm', 'Island',
+    'Crown', 'Forest', 'Mirror', 'Letter', 'Voyage', 'Harbour', 'Glass', 'Tower', 'Song', 'Fire',
+)
+FIRST_NAMES = ('Ada', 'Ben', 'Chloe', 'David', 'Elena', 'Farah', 'George', 'Hana', 'Ivan', 'Jade',
+               'Kofi', 'Lena', 'Mateo', 'Nia', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sipho', 'Tara')
+LAST_NAMES = ('Adams', 'Banda', 'Chen', 'Dlamini', 'Evans', 'Fischer', 'Garcia', 'Hughes', 'Ito', 'Jones',
+              'Khan', 'Lopez', 'Mokoena', 'Nakamura', 'Okafor', 'Patel', 'Rossi', 'Smith', 'Tanaka', 'Walsh')
+AUTHORS = tuple(f'{first} {last}' for first in FIRST_NAMES for last in LAST_NAMES)
+GENRES = ('Fantasy', 'Science Fiction', 'Mystery', 'Romance', 'History', 'Biography',
+          'Poetry', 'Horror', 'Thriller', 'Drama', 'Travel', 'Philosophy')
+
+# the number of books in a seeded catalogue can be written as 1k, 100k or 1M
+COUNT_SUFFIXES = {'k': 1000, 'm': 1000000}
+
+# where the seeded catalogues are kept between runs (they are rebuilt if missing)
+CATALOGUE_DIR = os.path.join(settings.BASE_DIR, 'benchmarks', 'catalogues')
+
+# the latencies compared with a baseline
+# - the p99 of a single kind of request rests on a handful of samples, so it is only compared for all requests
+# - kinds of request with fewer than MIN_COMPARED_REQUESTS samples are not compared
+LATENCY_METRICS = ('p50_ms', 'p95_ms')
+TAIL_METRICS = ('p99_ms',)
+MIN_COMPARED_REQUESTS = 100
+
+
+# return a number of books from e.g. '1000', '100k' or '1M'
+def parse_count(value):
+    value = str(value).strip().lower()
+    multiplier = COUNT_SUFFIXES.get(value[-1:], 1)
+    if multiplier != 1:
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
+
+# return the synthetic book number `i` of the catalogue seeded with `seed`
+def make_book(rng, i):
+    return Book(
+        title=f'The {rng.choice(TITLE_WORDS)} {rng.choice(TITLE_WORDS)} #{i}',
+        author=rng.choice(AUTHORS),
+        edition=str(rng.randint(1, 5)),
+        published_date=date(1950, 1, 1) + timedelta(days=rng.randrange(27000)),
+        genre=rng.choice(GENRES),
+        summary=' '.join(rng.choice(TITLE_WORDS).lower() for _ in range(rng.randint(8, 30))) + '.',
+        availability=rng.random() < 0.8,
+    )
+
+
+# add `count` synthetic books numbered from `start`, yielding the number added after each batch
+# - the same count, seed & start always give the same books
+def seed_catalogue(count, seed=0, start=0, batch_size=5000):
+    rng = random.Random(f'{seed}-{start}')
+    added = 0
+    while added < count:
+        size = min(batch_size, count - added)
+        with transaction.atomic():
+            Book.objects.bulk_create([make_book(rng, start + added + i) for i in range(size)])
+        added += size
+        yield added
+
+
+# switch the default database to a SQLite file, migrating it if needed (like the test runner's keepdb mode)
+@contextmanager
+def use_database(path):
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    previous_test_name = test_settings.get('NAME')
+    test_settings['NAME'] = path
+    old_name = connection.creation.create_test_db(verbosity=0, serialize=False, keepdb=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=True)
+        test_settings['NAME'] = previous_test_name
+
+
+# return the path of the catalogue of `count` books seeded with `seed`, seeding it the first time
+def get_catalogue(count, seed=0, progress=None):
+    os.makedirs(CATALOGUE_DIR, exist_ok=True)
+    path = os.path.join(CATALOGUE_DIR, f'books-{count}-{seed}.sqlite3')
+    with use_database(path):
+        if Book.objects.count() != count:
+            # start again from an empty table (an interrupted seeding leaves part of the books behind)
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {Book._meta.db_table}')
+            for added in seed_catalogue(count, seed=seed):
+                if progress is not None:
+                    progress(added)
+        # leave a single file behind, so it can be copied
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    return path
+
+
+# run the API with a scratch response cache in `directory`
+# - the rate limit is raised so no request is throttled, but it is still checked like in production
+# - replicas are not used, every read goes to the default database
+@contextmanager
+def api_sandbox(directory):
+    cache_settings = {'default': {**settings.CACHES['default'], 'LOCATION': os.path.join(directory, 'cache.sqlite3')}}
+    rates = SlidingWindowAnonRateThrottle.THROTTLE_RATES
+    SlidingWindowAnonRateThrottle.THROTTLE_RATES = {**rates, 'anon': '1000000000/min'}
+    try:
+        with override_settings(CACHES=cache_settings, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                               DATABASE_REPLICAS=[]):
+            yield
+    finally:
+        SlidingWindowAnonRateThrottle.THROTTLE_RATES = rates
+
+
+# run the API against a copy of a catalogue (see api_sandbox)
+@contextmanager
+def bench_environment(catalogue, directory):
+    path = os.path.join(directory, 'bench.sqlite3')
+    shutil.copyfile(catalogue, path)
+
+    with api_sandbox(directory), use_database(path):
+        yield
+
+
+# return the requests of a JSONL mix file
+def load_mix(path):
+    mix = []
+    with open(path, encoding='utf-8') as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            entry = json.loads(line)
+            if 'path' not in entry:
+                raise ValueError(f"{path}:{number}: a request needs a path")
+            mix.append({
+                'name': entry.get('name', f"{entry.get('method', 'GET')} {entry['path']}"),
+                'weight': entry.get('weight', 1),
+                'method': entry.get('method', 'GET').upper(),
+                'path': entry['path'],
+                'body': entry.get('body'),
+            })
+    return mix
+
+
+# fill the placeholders of a path or body, returns None if a placeholder has no value
+def fill(template, values):
+    if isinstance(template, dict):
+        filled = {key: fill(value, values) for key, value in template.items()}
+        return None if None in filled.values() else filled
+    if not isinstance(template, str):
+        return template
+
+    missing = []
+
+    def replace(match):
+        value = values(match.group(1))
+        if value is None:
+            missing.append(match.group(1))
+            return ''
+        return str(value)
+
+    filled = re.sub(r'\{(\w+)\}', replace, template)
+    return None if missing else filled
+
+
+# send `total` requests picked from the mix (after `warmup` untimed ones) & return {name: {latencies, errors, skipped}}
+# - the sequence of requests & placeholder values only depends on the seed, so every run sends the same requests
+def replay(mix, books, total, warmup=0, seed=0):
+    rng = random.Random(seed)
+    client = Client()
+    weights = [entry['weight'] for entry in mix]
+    created = []
+    counter = iter(range(1, 10 ** 12))
+
+    def values(name):
+        if name == 'id':
+            return rng.randint(1, books)
+        if name == 'created_id':
+            return created.pop() if created else None
+        if name == 'n':
+            return next(counter)
+        if name == 'author':
+            return rng.choice(AUTHORS)
+        if name == 'genre':
+            return rng.choice(GENRES)
+        if name == 'word':
+            return rng.choice(TITLE_WORDS).lower()
+        raise ValueError(f"Unknown placeholder {{{name}}}")
+
+    results = {entry['name']: {'latencies': [], 'errors': 0, 'skipped': 0} for entry in mix}
+    for number in range(warmup + total):
+        entry = rng.choices(mix, weights)[0]
+        result = results[entry['name']]
+        path = fill(entry['path'], values)
+        body = fill(entry['body'], values) if entry['body'] is not None else None
+        if path is None or (entry['body'] is not None and body is None):
+            result['skipped'] += 1
+            continue
+
+        data = json.dumps(body) if body is not None else ''
+        start = time.perf_counter()
+        response = client.generic(entry['method'], path, data, content_type='application/json')
+        elapsed = time.perf_counter() - start
+
+        # keep the ids of the created books for {created_id}
+        if response.status_code == 201:
+            created.append(json.loads(response.content)['data']['id'])
+        if number < warmup:
+            continue
+        result['latencies'].append(elapsed)
+        if response.status_code >= 400:
+            result['errors'] += 1
+    return results
+
+
+# return the value below which `share` of the sorted latencies fall
+def percentile(latencies, share):
+    if not latencies:
+        return 0.0
+    return latencies[min(int(len(latencies) * share), len(latencies) - 1)]
+
+
+# return the throughput & latency percentiles of each request name & of all of them ('all')
+# the client sends one request at a time, so the throughput is requests / time spent waiting for responses
+def summarize(results):
+    summary = {}
+    everything = {'latencies': [], 'errors': 0, 'skipped': 0}
+    for name, result in results.items():
+        everything['latencies'].extend(result['latencies'])
+        everything['errors'] += result['errors']
+        everything['skipped'] += result['skipped']
+    for name, result in [*results.items(), ('all', everything)]:
+        latencies = sorted(result['latencies'])
+        if not latencies:
+            continue
+        summary[name] = {
+            'requests': len(latencies),
+            'rps': len(latencies) / sum(latencies),
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'errors': result['errors'],
+            'skipped': result['skipped'],
+        }
+    return summary
+
+
+# return what a result depends on, stored with a baseline
+def describe_environment(books, total, mix_path):
+    return {
+        'books': books,
+        'requests': total,
+        'mix': os.path.basename(mix_path),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'djangorestframework': rest_framework.VERSION,
+        'sqlite_profile': os.getenv('SQLITE_PROFILE', 'tuned'),
+        'machine': platform.node(),
+    }
+
+
+# compare a summary with a baseline, returns a list of (name, metric, baseline, current, change) that got worse
+# - a latency regresses when it grows by more than `tolerance` (e.g. 0.2 for 20%), the throughput when it drops by more
+def find_regressions(summary, baseline, tolerance):
+    regressions = []
+    for name, before in baseline.items():
+        after = summary.get(name)
+        if after is None or (name != 'all' and after['requests'] < MIN_COMPARED_REQUESTS):
+            continue
+        for metric in (*LATENCY_METRICS, *TAIL_METRICS) if name == 'all' else LATENCY_METRICS:
+            if before[metric] and after[metric] > before[metric] * (1 + tolerance):
+                regressions.append((name, metric, before[metric], after[metric], after[metric] / before[metric] - 1))
+        if after['rps'] < before['rps'] * (1 - tolerance):
+            regressions.append((name, 'rps', before['rps'], after['rps'], after['rps'] / before['rps'] - 1))
+    return regressions
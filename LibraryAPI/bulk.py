@@ -0,0 +1,211 @@
+# import itertools to split any iterable into chunks
+import itertools
+
+# import transaction to write each chunk in a single transaction
+# https://docs.djangoproject.com/en/5.1/topics/db/transactions/
+from django.db import transaction, IntegrityError
+
+# import timezone to set the time of the updates
+from django.utils import timezone
+
+# import ValidationError & the helper that formats it like serializer.errors
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+# import models
+from .models import Book
+
+# import serializers
+from .serializers import BookSerializer
+
+#########################################################################################################
+
+# number of books validated & written per transaction
+BULK_CHUNK_SIZE = 500
+
+# the message used by BookSerializer's UniqueTogetherValidator
+DUPLICATE_MESSAGE = BookSerializer.Meta.validators[0].message
+
+# the text of the errors the database raises for a duplicate title & author:
+# the name of the unique constraint (PostgreSQL, MySQL) or its columns (SQLite)
+DUPLICATE_CONSTRAINT = 'unique_book_title_author'
+DUPLICATE_ERRORS = (
+    DUPLICATE_CONSTRAINT,
+    f'UNIQUE constraint failed: {Book._meta.db_table}.title, {Book._meta.db_table}.author',
+)
+
+
+# check if an IntegrityError comes from the title & author unique constraint (& not e.g. a NOT NULL column)
+def is_duplicate_error(error):
+    return any(text in str(error) for text in DUPLICATE_ERRORS)
+
+
+# define a serializer for items in a batch
+# - it keeps all of BookSerializer's field rules
+# - but drops the UniqueTogetherValidator, which runs 1 query per book, since the batch is checked with 1 query per chunk
+class BulkBookSerializer(BookSerializer):
+    class Meta(BookSerializer.Meta):
+        validators = []
+
+
+# split a list (or any iterable, e.g. the records of an import) into chunks of BULK_CHUNK_SIZE items,
+# keeping the index of each item in the request
+def chunked(items, size=BULK_CHUNK_SIZE, start=0):
+    iterator = iter(items)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield list(enumerate(chunk, start))
+        start += len(chunk)
+
+
+# return the result of an item that failed
+def error_result(index, errors):
+    return {"index": index, "status": "error", "errors": errors}
+
+
+# return the ids of the books that already use each (title, author) pair in `pairs`
+# - fetched with a single IN query for the whole chunk
+def find_existing_pairs(pairs):
+    existing = {}
+    if not pairs:
+        return existing
+
+    titles = {title for title, _ in pairs}
+    authors = {author for _, author in pairs}
+    rows = Book.objects.filter(title__in=titles, author__in=authors).values_list('id', 'title', 'author')
+    for book_id, title, author in rows:
+        if (title, author) in pairs:
+            existing.setdefault((title, author), set()).add(book_id)
+    return existing
+
+
+# validate a chunk of items with BulkBookSerializer & check title/author uniqueness for the whole chunk
+# - a single serializer validates every item, like DRF's ListSerializer does with its child,
+#   so the fields are only built once instead of once per book
+# returns (results for the invalid items, list of (index, instance, validated data) for the valid items)
+def validate_chunk(chunk, instances=None, partial=False):
+    serializer = BulkBookSerializer(partial=partial)
+
+    errors = []
+    valid = []
+    for index, item in chunk:
+        if not isinstance(item, dict):
+            errors.append(error_result(index, {"non_field_errors": ["Expected a JSON object."]}))
+            continue
+
+        instance = None
+        if instances is not None:
+            instance = instances.get(item.get('id'))
+            if instance is None:
+                errors.append(error_result(index, {"id": ["No Book matches the given id."]}))
+                continue
+
+        serializer.instance = instance
+        try:
+            valid.append((index, instance, serializer.run_validation(item)))
+        except ValidationError as exc:
+            errors.append(error_result(index, as_serializer_error(exc)))
+
+    # work out the (title, author) pair each valid item will end up with
+    pairs = {}
+    for index, instance, data in valid:
+        title = data.get('title', getattr(instance, 'title', None))
+        author = data.get('author', getattr(instance, 'author', None))
+        pairs[index] = ((title, author), getattr(instance, 'id', None))
+
+    # check every pair against the table with 1 query
+    existing = find_existing_pairs({pair for pair, _ in pairs.values()})
+
+    # reject pairs used by another book, or that appear more than once in the batch
+    # - a book being updated does not clash with itself
+    unique = []
+    seen = set()
+    for index, instance, data in valid:
+        pair, book_id = pairs[index]
+        if existing.get(pair, set()) - {book_id} or pair in seen:
+            errors.append(error_result(index, {"non_field_errors": [DUPLICATE_MESSAGE]}))
+        else:
+            seen.add(pair)
+            unique.append((index, instance, data))
+    return errors, unique
+
+
+# write a chunk in its own transaction
+# - if the chunk conflicts with a concurrent write, every item in it is reported as failed
+def write_chunk(write, valid, results):
+    try:
+        with transaction.atomic():
+            results.extend(write(valid))
+    except IntegrityError as error:
+        results.extend(error_result(index, {"non_field_errors": [str(error)]}) for index, _, _ in valid)
+
+
+# validate & create the books of one chunk with bulk_create, returning the result of each item
+def create_chunk(chunk):
+    def write(valid):
+        books = Book.objects.bulk_create([Book(**data) for _, _, data in valid])
+        return [{"index": index, "status": "created", "id": book.id} for (index, _, _), book in zip(valid, books)]
+
+    results, valid = validate_chunk(chunk)
+    if valid:
+        write_chunk(write, valid, results)
+    return results
+
+
+# create books from a list of dicts using bulk_create
+def bulk_create_books(items):
+    results = []
+    for chunk in chunked(items):
+        results.extend(create_chunk(chunk))
+    return sorted(results, key=lambda result: result["index"])
+
+
+# update books from a list of dicts that each contain an "id" using bulk_update
+def bulk_update_books(items, partial=False):
+    # bulk_update does not set auto_now fields, so set updated_at like save() does
+    def write(valid):
+        fields = set()
+        books = []
+        now = timezone.now()
+        for _, instance, data in valid:
+            for field, value in data.items():
+                setattr(instance, field, value)
+                fields.add(field)
+            instance.updated_at = now
+            books.append(instance)
+        if fields:
+            Book.objects.bulk_update(books, sorted(fields | {'updated_at'}))
+        return [{"index": index, "status": "updated", "id": instance.id} for index, instance, _ in valid]
+
+    results = []
+    for chunk in chunked(items):
+        # fetch every book in the chunk with 1 query
+        ids = [item.get('id') for _, item in chunk if isinstance(item, dict)]
+        instances = Book.objects.in_bulk([book_id for book_id in ids if isinstance(book_id, int)])
+
+        errors, valid = validate_chunk(chunk, instances=instances, partial=partial)
+        results.extend(errors)
+        if valid:
+            write_chunk(write, valid, results)
+    return sorted(results, key=lambda result: result["index"])
+
+
+# delete books from a list of ids (or dicts with an "id")
+def bulk_delete_books(items):
+    results = []
+    for chunk in chunked(items):
+        ids = {
+            index: item.get('id') if isinstance(item, dict) else item
+            for index, item in chunk
+        }
+
+        with transaction.atomic():
+            queryset = Book.objects.filter(id__in=[book_id for book_id in ids.values() if isinstance(book_id, int)])
+            existing = set(queryset.values_list('id', flat=True))
+            queryset.delete()
+
+        for index, book_id in ids.items():
+            if book_id in existing:
+                results.append({"index": index, "status": "deleted", "id": book_id})
+            else:
+                results.append(error_result(index, {"id": ["No Book matches the given id."]}))
+    return results
@@ -0,0 +1,281 @@
+# import os to detect when a worker process has been forked
+import os
+
+# import pickle to store values that are not integers
+import pickle
+
+# import sqlite3 to keep the cache in a local file that every worker process can share
+import sqlite3
+
+# import threading to give each thread its own connection
+import threading
+
+# import time for expiry & last access times
+import time
+
+# import the base class of django's cache backends
+# https://docs.djangoproject.com/en/5.1/topics/cache/#cache-arguments
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+#########################################################################################################
+
+# define a cache backend stored in a SQLite database in WAL mode
+# LocMemCache keeps a separate cache in every worker process, so with N gunicorn workers:
+# - each worker throttles on its own, making the real limit N x 100/hour
+# - & nothing cached by one worker can be read by another
+# this backend shares one file between all the processes on the machine without needing a cache server
+# - WAL lets readers run alongside the single writer
+# - integers are stored as SQLite integers so incr() is a single atomic UPDATE
+# - entries expire after their timeout & the least recently used entries are evicted above MAX_ENTRIES
+# https://www.sqlite.org/wal.html
+#
+# configure it in settings.CACHES with:
+# 'BACKEND': 'LibraryAPI.cache_backends.SQLiteCache', 'LOCATION': '/path/to/cache.sqlite3'
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    # run the (amortised) expiry & eviction check once every `cull_every` writes instead of counting rows on every set
+    cull_every = 100
+
+    # only rewrite an entry's last access time when it is this many seconds old, so most reads stay read-only
+    access_resolution = 1.0
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._location = str(location)
+        self._local = threading.local()
+        self._writes = 0
+
+        # read the backend specific options
+        options = params.get('OPTIONS', {})
+        self._busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self.access_resolution = options.get('ACCESS_RESOLUTION', self.access_resolution)
+
+    # return a connection for the current thread, opening a new one after a fork
+    # - SQLite connections must not be shared between processes
+    @property
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._connect()
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    # open the cache database & create the table if it does not exist
+    def _connect(self):
+        # isolation_level=None runs every statement in its own transaction, so each one is atomic on its own
+        connection = sqlite3.connect(self._location, timeout=self._busy_timeout, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL NOT NULL'
+            ') WITHOUT ROWID'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+        return connection
+
+    # store integers as they are so they can be incremented in SQL, pickle everything else
+    def _encode(self, value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _decode(self, value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version)
+        now = time.time()
+        # insert the entry, or replace it only if the existing one has expired
+        cursor = self._connection.execute(
+            'INSERT INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value=excluded.value, expires=excluded.expires, accessed=excluded.accessed '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (key, self._encode(value), self.get_backend_timeout(timeout), now, now),
+        )
+        self._maybe_cull()
+        return cursor.rowcount == 1
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version)
+        now = time.time()
+        row = self._connection.execute(
+            'SELECT value, accessed FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, now)
+        ).fetchone()
+        if row is None:
+            return default
+
+        # refresh the entry's position in the LRU order
+        if row[1] < now - self.access_resolution:
+            self._connection.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version): key for key in keys}
+        if not key_map:
+            return {}
+
+        placeholders = ', '.join('?' * len(key_map))
+        rows = self._connection.execute(
+            f'SELECT key, value FROM cache WHERE key IN ({placeholders}) AND (expires IS NULL OR expires > ?)',
+            (*key_map, time.time()),
+        ).fetchall()
+        return {key_map[key]: self._decode(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version)
+        self._connection.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+            (key, self._encode(value), self.get_backend_timeout(timeout), time.time()),
+        )
+        self._maybe_cull()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = [
+            (self.make_and_validate_key(key, version), self._encode(value), expires, now)
+            for key, value in data.items()
+        ]
+        with self._connection:
+            self._connection.execute('BEGIN IMMEDIATE')
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)', rows
+            )
+        self._maybe_cull()
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version)
+        now = time.time()
+        cursor = self._connection.execute(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), now, key, now),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version)
+        cursor = self._connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+        return cursor.rowcount == 1
+
+    # delete an entry only if it still holds `value`, in a single DELETE
+    # - e.g. a lock is released only by the request that took it, not once it has expired & been taken by another
+    def delete_if(self, key, value, version=None):
+        key = self.make_and_validate_key(key, version)
+        cursor = self._connection.execute(
+            'DELETE FROM cache WHERE key = ? AND value = ?', (key, self._encode(value))
+        )
+        return cursor.rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version) for key in keys]
+        if keys:
+            placeholders = ', '.join('?' * len(keys))
+            self._connection.execute(f'DELETE FROM cache WHERE key IN ({placeholders})', keys)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version)
+        row = self._connection.execute(
+            'SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    # increment an integer in a single UPDATE, so concurrent processes never lose an increment
+    # https://www.sqlite.org/lang_returning.html
+    def incr(self, key, delta=1, version=None):
+        validated_key = self.make_and_validate_key(key, version)
+        now = time.time()
+        row = self._connection.execute(
+            "UPDATE cache SET value = value + ?, accessed = ? "
+            "WHERE key = ? AND typeof(value) = 'integer' AND (expires IS NULL OR expires > ?) "
+            "RETURNING value",
+            (delta, now, validated_key, now),
+        ).fetchone()
+        if row is None:
+            raise ValueError("Key '%s' not found" % key)
+        return row[0]
+
+    # count a request in a sliding window (see throttling.py) in one transaction: read the counters of the current
+    # & previous windows & add 1 to the current one only if the estimate stays within `limit`
+    # - the write lock is taken before the read, so concurrent processes never admit more requests than the limit
+    # - returns (allowed, current count, previous count), the current count including this request if it was allowed
+    def incr_window(self, key, previous_key, previous_weight, limit, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version)
+        previous_key = self.make_and_validate_key(previous_key, version)
+        now = time.time()
+        connection = self._connection
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            counts = dict(connection.execute(
+                "SELECT key, value FROM cache WHERE key IN (?, ?) AND typeof(value) = 'integer' "
+                "AND (expires IS NULL OR expires > ?)",
+                (key, previous_key, now),
+            ).fetchall())
+            current = counts.get(key, 0)
+            previous = counts.get(previous_key, 0)
+
+            allowed = previous * previous_weight + current + 1 <= limit
+            if allowed:
+                current += 1
+                connection.execute(
+                    'INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+                    (key, current, self.get_backend_timeout(timeout), now),
+                )
+        if allowed:
+            self._maybe_cull()
+        return allowed, current, previous
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache')
+
+    # run the async methods used by the async views directly on the event loop's thread
+    # BaseCache's async methods send every call to a worker thread with sync_to_async, which costs more than the
+    # call itself: each statement here is a single indexed read or write on a local file that takes microseconds
+    # - the event loop's thread gets its own connection like any other thread
+    # - a write only blocks the loop while another process holds the write lock (at most BUSY_TIMEOUT)
+    # https://docs.djangoproject.com/en/5.1/topics/cache/#asynchronous-support
+    async def aadd(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.add(key, value, timeout, version)
+
+    async def aget(self, key, default=None, version=None):
+        return self.get(key, default, version)
+
+    async def aget_many(self, keys, version=None):
+        return self.get_many(keys, version)
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.set(key, value, timeout, version)
+
+    async def adelete(self, key, version=None):
+        return self.delete(key, version)
+
+    async def adelete_if(self, key, value, version=None):
+        return self.delete_if(key, value, version)
+
+    async def ahas_key(self, key, version=None):
+        return self.has_key(key, version)
+
+    async def aincr(self, key, delta=1, version=None):
+        return self.incr(key, delta, version)
+
+    async def aincr_window(self, key, previous_key, previous_weight, limit, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.incr_window(key, previous_key, previous_weight, limit, timeout, version)
+
+    # remove expired entries, then the least recently used ones while there are more than MAX_ENTRIES
+    def _maybe_cull(self):
+        self._writes += 1
+        if self._writes % self.cull_every:
+            return
+
+        connection = self._connection
+        connection.execute('DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+        excess = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self._max_entries
+        if excess > 0:
+            connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)', (excess,)
+            )
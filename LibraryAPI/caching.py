@@ -0,0 +1,196 @@
+# import functools to keep the wrapped action's name
+import functools
+
+# import hashlib to shorten the cache key
+import hashlib
+
+# import time to seed the generation counter
+import time
+
+# import iscoroutinefunction to tell async actions apart
+from asgiref.sync import iscoroutinefunction
+
+# import cache (the shared SQLite cache configured in settings)
+from django.core.cache import cache
+
+# import parse_http_date_safe to read the If-Modified-Since & Last-Modified dates
+from django.utils.http import parse_http_date_safe
+
+# import the check for reads from a replica that is behind the primary
+from .db_routers import reading_stale_replica
+
+# import timed to record the time spent in the cache in the request metrics
+from .metrics import timed
+
+# import Response & status to answer from the cache
+from rest_framework.response import Response
+from rest_framework import status
+
+#########################################################################################################
+
+# cache key of the catalogue generation counter
+# - it is bumped after every write to the Book table, so cached responses from older generations are never read again
+GENERATION_KEY = 'books_generation'
+
+# number of seconds a cached response is kept (it is invalidated by the generation long before this when books change)
+RESPONSE_CACHE_TIMEOUT = 60 * 60
+
+# the version of the cached entries & ETags, changed when what is cached or the responses change
+# - 2: the envelope is cached with its headers, & books have an updated_at field
+# - 3: the rank of the search results is a JSONFloat (see renderers.py)
+# - 4: the highlighted text of the search results is HTML escaped
+RESPONSE_CACHE_VERSION = 4
+
+# the headers of a response that are cached with its envelope
+CACHED_HEADERS = ('Last-Modified',)
+
+
+# return the current catalogue generation
+def get_catalogue_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # start from the current time in ms, so a counter that was evicted never goes back to an old value
+        cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+# move the catalogue to a new generation, invalidating every cached book response
+# called from BookViewSet.perform_create/perform_update/perform_destroy & the Book signals (admin edits)
+def bump_catalogue_generation():
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        get_catalogue_generation()
+        return cache.incr(GENERATION_KEY)
+
+
+# the same for the async views, using the cache's async methods
+async def aget_catalogue_generation():
+    generation = await cache.aget(GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(GENERATION_KEY, int(time.time() * 1000), None)
+        generation = await cache.aget(GENERATION_KEY)
+    return generation
+
+
+async def abump_catalogue_generation():
+    try:
+        return await cache.aincr(GENERATION_KEY)
+    except ValueError:
+        await aget_catalogue_generation()
+        return await cache.aincr(GENERATION_KEY)
+
+
+# build the key & ETag of a cacheable request from:
+# - the API version, the host & path, the sorted query parameters & the negotiated format
+# - the catalogue generation
+def get_response_cache_key(request, generation):
+    query = sorted(request.query_params.lists())
+    renderer = getattr(request, 'accepted_renderer', None)
+    fingerprint = repr((RESPONSE_CACHE_VERSION, request.version, request.get_host(), request.path, query,
+                        getattr(renderer, 'format', None)))
+    digest = hashlib.md5(fingerprint.encode('utf-8'), usedforsecurity=False).hexdigest()
+
+    key = f'books_response_{generation}_{digest}'
+    etag = f'"{generation}-{digest[:16]}"'
+    return key, etag
+
+
+# check if a response can be cached for the current generation
+# - a replica that is behind the primary may not have every write of the generation yet, so its answers are not cached
+def is_cacheable(response):
+    if response.status_code != status.HTTP_200_OK or getattr(response, 'data', None) is None:
+        return False
+    return not reading_stale_replica()
+
+
+# return the headers of a response that are cached with it
+def get_cached_headers(response):
+    return {header: response[header] for header in CACHED_HEADERS if response.has_header(header)}
+
+
+# check if the client's copy, dated by If-Modified-Since, is as recent as the response's Last-Modified date
+# - If-None-Match takes precedence when both are sent, like django's ConditionalGetMiddleware
+# https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/If-Modified-Since
+def not_modified_since(request, headers):
+    if 'If-None-Match' in request.headers:
+        return False
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    last_modified = parse_http_date_safe(headers.get('Last-Modified', ''))
+    return since is not None and last_modified is not None and last_modified <= since
+
+
+# return the response to a request that was answered during the current generation (or by the action):
+# an empty 304 if the client's copy is recent enough, else the envelope
+def cached_response(request, data, headers, etag):
+    if not_modified_since(request, headers):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag, **headers})
+    return Response(data, status=status.HTTP_200_OK, headers={'ETag': etag, **headers})
+
+
+# decorate a read-only BookViewSet action to cache its successful responses
+# - the cached envelope is reused until the catalogue generation changes
+# - clients that send the ETag back in If-None-Match get an empty 304 response while nothing has changed,
+#   & so do clients that send back the Last-Modified date of a book in If-Modified-Since while the book has not changed
+# - async actions (AsyncBookViewSet) get an async wrapper that uses the cache's async methods
+# - the cache reads & writes are recorded as the 'cache' phase of the request metrics
+# https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/If-None-Match
+def cache_book_response(action):
+    if iscoroutinefunction(action):
+        return acache_book_response(action)
+
+    @functools.wraps(action)
+    def wrapper(view, request, *args, **kwargs):
+        with timed('cache'):
+            key, etag = get_response_cache_key(request, get_catalogue_generation())
+
+            # the client already has the current version
+            if etag in request.headers.get('If-None-Match', ''):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+            # return the cached envelope if this request was answered during the current generation
+            cached = cache.get(key)
+        if cached is not None:
+            return cached_response(request, *cached, etag)
+
+        response = action(view, request, *args, **kwargs)
+
+        # only cache successful envelopes (streamed responses have no data to cache)
+        if is_cacheable(response):
+            headers = get_cached_headers(response)
+            with timed('cache'):
+                cache.set(key, (response.data, headers), RESPONSE_CACHE_TIMEOUT)
+            if not_modified_since(request, headers):
+                return cached_response(request, response.data, headers, etag)
+            response['ETag'] = etag
+        return response
+
+    return wrapper
+
+
+def acache_book_response(action):
+    @functools.wraps(action)
+    async def wrapper(view, request, *args, **kwargs):
+        with timed('cache'):
+            key, etag = get_response_cache_key(request, await aget_catalogue_generation())
+
+            if etag in request.headers.get('If-None-Match', ''):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+            cached = await cache.aget(key)
+        if cached is not None:
+            return cached_response(request, *cached, etag)
+
+        response = await action(view, request, *args, **kwargs)
+
+        if is_cacheable(response):
+            headers = get_cached_headers(response)
+            with timed('cache'):
+                await cache.aset(key, (response.data, headers), RESPONSE_CACHE_TIMEOUT)
+            if not_modified_since(request, headers):
+                return cached_response(request, response.data, headers, etag)
+            response['ETag'] = etag
+        return response
+
+    return wrapper
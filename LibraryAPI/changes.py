@@ -0,0 +1,107 @@
+# import connection to create the change triggers
+from django.db import connection
+
+# import models
+from .models import Book, BookChange
+
+# import the fast read serializer to format the changed books like the API
+from .serializers import BookReadSerializer
+
+#########################################################################################################
+
+# the change feed of the catalogue at /books/changes/?since=<revision>, for clients that keep a copy of the books
+# - every insert, update & delete of a book replaces the book's BookChange row with a new revision (see models.py)
+# - a client sends the revision of its last sync & gets the books changed & the ids deleted since then,
+#   in revision order, one page at a time, with the revision to send next time
+# - the first sync (since=0) gets every book & no tombstones on its first page, its next pages may list books
+#   deleted before the client had them, which it can ignore
+# - a page is a single query on the BookChange primary key, joined to the books, however big the catalogue is
+# the triggers are created by the 0004 migration, which keeps a frozen copy of their SQL: changing them here needs a new
+# migration, & migrations that rebuild the Book table (SQLite drops its triggers) must create them again
+# https://www.sqlite.org/lang_createtrigger.html
+# https://www.sqlite.org/autoinc.html
+
+BOOK_TABLE = Book._meta.db_table
+CHANGE_TABLE = BookChange._meta.db_table
+
+# number of changes per page, unless ?page_size= asks for another number (up to CHANGES_MAX_PAGE_SIZE)
+CHANGES_PAGE_SIZE = 100
+CHANGES_MAX_PAGE_SIZE = 1000
+
+# the time of a deletion, in the format django reads back as a datetime (UTC)
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# REPLACE deletes the book's previous row (book_id is unique) & inserts one with the next revision
+CREATE_CHANGE_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS "{CHANGE_TABLE}_insert" AFTER INSERT ON "{BOOK_TABLE}" BEGIN
+        INSERT OR REPLACE INTO "{CHANGE_TABLE}" (book_id, deleted_at) VALUES (new.id, NULL);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS "{CHANGE_TABLE}_update" AFTER UPDATE ON "{BOOK_TABLE}" BEGIN
+        INSERT OR REPLACE INTO "{CHANGE_TABLE}" (book_id, deleted_at) SELECT old.id, {NOW} WHERE old.id != new.id;
+        INSERT OR REPLACE INTO "{CHANGE_TABLE}" (book_id, deleted_at) VALUES (new.id, NULL);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS "{CHANGE_TABLE}_delete" AFTER DELETE ON "{BOOK_TABLE}" BEGIN
+        INSERT OR REPLACE INTO "{CHANGE_TABLE}" (book_id, deleted_at) VALUES (old.id, {NOW});
+    END
+    ''',
+]
+
+DROP_CHANGE_TRIGGERS = [
+    f'DROP TRIGGER IF EXISTS "{CHANGE_TABLE}_insert"',
+    f'DROP TRIGGER IF EXISTS "{CHANGE_TABLE}_update"',
+    f'DROP TRIGGER IF EXISTS "{CHANGE_TABLE}_delete"',
+]
+
+
+# check if the change triggers can be used on a database connection
+def changes_supported(using_connection=connection):
+    return using_connection.vendor == 'sqlite'
+
+
+# create the change triggers if they do not exist
+def create_change_triggers(using_connection=connection):
+    if not changes_supported(using_connection):
+        return
+    with using_connection.cursor() as cursor:
+        for statement in CREATE_CHANGE_TRIGGERS:
+            cursor.execute(statement)
+
+
+# give every book without a change a revision, in id order (used when the triggers are first created)
+def record_existing_books(using_connection=connection):
+    with using_connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO "{CHANGE_TABLE}" (book_id) SELECT id FROM "{BOOK_TABLE}" '
+            f'WHERE id NOT IN (SELECT book_id FROM "{CHANGE_TABLE}") ORDER BY id'
+        )
+
+
+# return up to `limit` changes after revision `since`, in revision order:
+# (representations of the changed books, ids of the deleted books, last revision returned, whether there are more)
+# - each book has a single row & book ids are never reused (AUTOINCREMENT), so an id is only in one of the lists
+def get_changes(since, limit):
+    serializer = BookReadSerializer()
+    columns = [f'book__{field}' for field in serializer.fields if field != 'id']
+    changes = BookChange.objects.filter(revision__gt=since).order_by('revision')
+    if not since:
+        # a first sync has no books to delete
+        changes = changes.filter(deleted_at__isnull=True)
+    rows = list(changes.values('revision', 'book_id', 'deleted_at', *columns)[:limit + 1])
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    updated = []
+    deleted = []
+    for row in rows:
+        if row['deleted_at'] is not None:
+            deleted.append(row['book_id'])
+        else:
+            book = {field: row[f'book__{field}'] for field in serializer.fields if field != 'id'}
+            updated.append(serializer.to_representation({'id': row['book_id'], **book}))
+    return updated, deleted, rows[-1]['revision'] if rows else since, has_more
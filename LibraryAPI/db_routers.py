@@ -0,0 +1,138 @@
+# import random to spread the reads over the replicas
+import random
+
+# import time to work out the replication lag
+import time
+
+# import ContextVar to remember the replica chosen for the current request (works in threads & async tasks)
+from contextvars import ContextVar
+
+# import settings to read the replica configuration
+from django.conf import settings
+
+# import cache (the shared SQLite cache configured in settings)
+from django.core.cache import cache
+
+# import the response cache module for the catalogue generation, which tells if a replica has every write
+# (the module is imported rather than the key because caching.py imports this module too)
+from . import caching
+
+#########################################################################################################
+
+# read replicas for the book list & book details
+# - settings.DATABASE_REPLICAS lists the replica aliases in settings.DATABASES (see DB_REPLICAS in settings.py)
+# - BookViewSet turns replica reads on for list & retrieve, every other query (& every write) uses the primary
+# - a client that wrote is pinned to the primary for REPLICA_PIN_SECONDS, so it always reads its own writes
+# - a replica is only used while its lag is at most REPLICA_MAX_LAG seconds
+# the replicas are filled by `python manage.py sync_replica`, which records in the cache:
+# - the catalogue generation it copied (the replica is "behind" once the generation moves on)
+# - & when it copied it (the lag of a replica that is behind is the time since then)
+# https://docs.djangoproject.com/en/5.1/topics/db/multi-db/#automatic-database-routing
+
+# cache key of the sync state of a replica
+REPLICA_STATE_KEY = 'replica_state_%s'
+
+# cache key that pins a client to the primary after it writes
+PIN_KEY = 'replica_pin_%s'
+
+# the replica used for the reads of the current request: (alias, lag in seconds, behind the primary) or None
+current_replica = ContextVar('current_replica', default=None)
+
+
+# return the cache keys needed to choose a replica for a client
+def get_routing_keys(ident):
+    return [PIN_KEY % ident, caching.GENERATION_KEY, *(REPLICA_STATE_KEY % alias for alias in settings.DATABASE_REPLICAS)]
+
+
+# choose a replica from the cached values of get_routing_keys(), or None to read from the primary
+def choose_replica(values, ident):
+    if values.get(PIN_KEY % ident):
+        return None
+
+    now = time.time()
+    generation = values.get(caching.GENERATION_KEY)
+    fresh = []
+    for alias in settings.DATABASE_REPLICAS:
+        state = values.get(REPLICA_STATE_KEY % alias)
+        # skip replicas that have never been synced
+        if state is None:
+            continue
+        behind = state['generation'] != generation
+        lag = now - state['synced_at'] if behind else 0.0
+        if lag <= settings.REPLICA_MAX_LAG:
+            fresh.append((alias, lag, behind))
+    return random.choice(fresh) if fresh else None
+
+
+# send the reads of the current request to a replica, returns a token for end_replica_reads()
+def start_replica_reads(ident):
+    if not settings.DATABASE_REPLICAS:
+        return None
+    return current_replica.set(choose_replica(cache.get_many(get_routing_keys(ident)), ident))
+
+
+async def astart_replica_reads(ident):
+    if not settings.DATABASE_REPLICAS:
+        return None
+    return current_replica.set(choose_replica(await cache.aget_many(get_routing_keys(ident)), ident))
+
+
+# send the reads back to the primary
+def end_replica_reads(token):
+    if token is not None:
+        current_replica.reset(token)
+
+
+# check if the current request reads from a replica that does not have the latest writes
+def reading_stale_replica():
+    replica = current_replica.get()
+    return replica is not None and replica[2]
+
+
+# read from the primary for the next REPLICA_PIN_SECONDS after a client writes
+def pin_to_primary(ident):
+    if settings.DATABASE_REPLICAS:
+        cache.set(PIN_KEY % ident, True, settings.REPLICA_PIN_SECONDS)
+
+
+async def apin_to_primary(ident):
+    if settings.DATABASE_REPLICAS:
+        await cache.aset(PIN_KEY % ident, True, settings.REPLICA_PIN_SECONDS)
+
+
+# return the sync state & lag of every replica
+def get_replica_status():
+    values = cache.get_many([caching.GENERATION_KEY, *(REPLICA_STATE_KEY % alias for alias in settings.DATABASE_REPLICAS)])
+    now = time.time()
+    status = {}
+    for alias in settings.DATABASE_REPLICAS:
+        state = values.get(REPLICA_STATE_KEY % alias)
+        if state is None:
+            status[alias] = None
+            continue
+        behind = state['generation'] != values.get(caching.GENERATION_KEY)
+        status[alias] = {
+            **state,
+            "behind": behind,
+            "lag": now - state['synced_at'] if behind else 0.0,
+        }
+    return status
+
+
+# define a router that sends the LibraryAPI reads of a request to its replica
+# - writes always go to the primary (None means 'default')
+# - the replicas are copies of the primary, so nothing is migrated on them
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = current_replica.get()
+        if replica is not None and model._meta.app_label == 'LibraryAPI':
+            return replica[0]
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,70 @@
+# import serializers to reuse DRF's field parsing & error messages for the query parameters
+from rest_framework import serializers
+
+# import DRF's filter backend base class
+# https://www.django-rest-framework.org/api-guide/filtering/#custom-generic-filtering
+from rest_framework.filters import BaseFilterBackend
+
+#########################################################################################################
+
+# define the filters & sort keys of the book list, e.g.
+# /api/v1/books/?genre=Fantasy&available=true&published_after=2000-01-01&ordering=-published_date
+# each request compiles to a single query on the Book indexes:
+# - author, genre & availability each have an index followed by published_date
+# - published_date & created_at have their own indexes
+class BookFilterBackend(BaseFilterBackend):
+    # query parameter -> (model lookup, field that parses & validates the value)
+    # filter booleans with __in: filter(availability=True) compiles to a bare "WHERE availability" that skips the index
+    filters = {
+        'author': ('author', serializers.CharField()),
+        'genre': ('genre', serializers.CharField()),
+        'available': ('availability__in', serializers.BooleanField()),
+        'published_after': ('published_date__gte', serializers.DateField()),
+        'published_before': ('published_date__lte', serializers.DateField()),
+    }
+
+    # query parameter used to sort the list
+    ordering_param = 'ordering'
+
+    # sort keys that are backed by an index, others are rejected instead of sorting the whole table
+    # - prefix a key with '-' to sort in descending order
+    ordering_fields = ('id', 'published_date', 'created_at')
+
+    # the default sort order (the same as the pagination's)
+    default_ordering = ('id',)
+
+    # filter the queryset with the query parameters
+    def filter_queryset(self, request, queryset, view):
+        lookups = {}
+        errors = {}
+        for param, (lookup, field) in self.filters.items():
+            if param not in request.query_params:
+                continue
+
+            # parse the value, collecting the errors so they are all returned together
+            try:
+                value = field.run_validation(request.query_params[param])
+            except serializers.ValidationError as exc:
+                errors[param] = exc.detail
+                continue
+
+            lookups[lookup] = [value] if lookup.endswith('__in') else value
+
+        if errors:
+            raise serializers.ValidationError(errors)
+        return queryset.filter(**lookups)
+
+    # return the requested sort order, which the keyset pagination uses for its cursor
+    # https://www.django-rest-framework.org/api-guide/pagination/#cursorpagination
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get(self.ordering_param)
+        if not ordering:
+            return self.default_ordering
+
+        # only 1 sort key is supported: the pagination adds the id as a tie breaker
+        if ordering.lstrip('-') not in self.ordering_fields:
+            allowed = ', '.join(self.ordering_fields)
+            raise serializers.ValidationError(
+                {self.ordering_param: [f"Cannot sort by '{ordering}'. Sort by one of: {allowed} (prefix with '-' for descending)."]}
+            )
+        return (ordering,)
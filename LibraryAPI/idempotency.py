@@ -0,0 +1,230 @@
+# import asyncio & time to wait for a duplicate request to finish
+import asyncio
+import time
+
+# import functools to keep the wrapped action's name
+import functools
+
+# import hashlib to shorten the keys & fingerprint the request bodies
+import hashlib
+
+# import json to fingerprint the request bodies
+import json
+
+# import uuid to tell the lock of each request apart
+import uuid
+
+# import iscoroutinefunction to tell async actions apart
+from asgiref.sync import iscoroutinefunction
+
+# import cache (the shared SQLite cache configured in settings)
+from django.core.cache import cache
+
+# import DRF's encoder to fingerprint any parsed body (dates, decimals...)
+from rest_framework.utils.encoders import JSONEncoder
+
+# import Response & status to replay the stored responses
+from rest_framework.response import Response
+from rest_framework import status
+
+#########################################################################################################
+
+# idempotency keys for POST /books: a client that retries a request after a timeout gets the first response again
+# - the client sends a unique Idempotency-Key header with the request, & the same key with each retry
+# - the first successful response is stored in the shared cache for IDEMPOTENCY_TIMEOUT seconds, so a retry
+#   is answered from the cache (with an Idempotent-Replayed header) without validating or inserting the book again
+# - the cache is bounded (MAX_ENTRIES) & evicts expired & least recently used keys first (see cache_backends.py)
+# - a lock in the cache lets a single request with a key run at a time, across every worker process:
+#   a duplicate that arrives while the first one runs waits for its response instead of inserting the book too
+# - each request holds the lock with its own token & only releases the lock if it still holds that token, so a
+#   request that outlived IDEMPOTENCY_LOCK_TIMEOUT does not release the lock a retry took after it expired
+# - keys are scoped to the client (like the throttle) & to the path, & a key sent again with another body is rejected
+# - errors are not stored, so a request that failed validation can be fixed & retried with the same key
+# https://datatracker.ietf.org/doc/draft-ietf-httpapi-idempotency-key-header/
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+# the longest key accepted (UUIDs are 36 characters)
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# number of seconds a response is kept for the retries
+IDEMPOTENCY_TIMEOUT = 60 * 60 * 24
+
+# number of seconds a lock is held at most, in case its request never finishes (e.g. the worker was killed)
+# - longer than the database's busy timeout, so a slow insert keeps its lock
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+
+# number of seconds a duplicate waits for the first request, & how often it checks
+IDEMPOTENCY_WAIT = 10
+IDEMPOTENCY_POLL_INTERVAL = 0.05
+
+
+# return the cache keys of the stored response & of the lock for a request's key,
+# or None if the request has no key
+def get_idempotency_keys(view, request):
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if key is None:
+        return None
+    scope = repr((view.get_client_ident(request), request.path, key))
+    digest = hashlib.sha256(scope.encode('utf-8')).hexdigest()
+    return f'idempotency_response_{digest}', f'idempotency_lock_{digest}'
+
+
+# return a fingerprint of the request's body, to tell a retry from another request reusing its key
+def get_request_fingerprint(request):
+    body = json.dumps(request.data, cls=JSONEncoder, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+# release a lock taken with `token`, unless it expired & another request has taken it since
+# - the SQLite cache compares & deletes in one statement (SQLiteCache.delete_if), other caches check first
+def release_lock(lock_key, token):
+    if hasattr(cache, 'delete_if'):
+        cache.delete_if(lock_key, token)
+    elif cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+async def arelease_lock(lock_key, token):
+    if hasattr(cache, 'adelete_if'):
+        await cache.adelete_if(lock_key, token)
+    elif await cache.aget(lock_key) == token:
+        await cache.adelete(lock_key)
+
+
+# return an error envelope
+def error_response(code, message, headers=None):
+    return Response(
+        {"status": "error", "code": code, "message": message, "data": None},
+        status=code,
+        headers=headers,
+        )
+
+
+# return the error of a key that cannot be used, or None
+def check_idempotency_key(request):
+    key = request.headers[IDEMPOTENCY_HEADER]
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return error_response(
+            status.HTTP_400_BAD_REQUEST,
+            f"The {IDEMPOTENCY_HEADER} header must have 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters",
+            )
+    return None
+
+
+# return the response to send again for a stored entry, or a 422 error if the key was used with another body
+def replay_response(stored, fingerprint):
+    stored_fingerprint, status_code, data, headers = stored
+    if stored_fingerprint != fingerprint:
+        return error_response(
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            f"This {IDEMPOTENCY_HEADER} was already used with a different request",
+            )
+    return Response(data, status=status_code, headers={**headers, 'Idempotent-Replayed': 'true'})
+
+
+# return the 409 error of a duplicate that waited too long for the first request
+def in_progress_response():
+    return error_response(
+        status.HTTP_409_CONFLICT,
+        f"A request with this {IDEMPOTENCY_HEADER} is still being processed, retry later",
+        headers={'Retry-After': '1'},
+        )
+
+
+# return the entry to store for a response, or None if it is not stored
+def get_stored_entry(response, fingerprint):
+    if not status.is_success(response.status_code) or getattr(response, 'data', None) is None:
+        return None
+    headers = {header: value for header, value in response.items() if header == 'Location'}
+    return fingerprint, response.status_code, response.data, headers
+
+
+# decorate a BookViewSet action that creates books to make it idempotent with the Idempotency-Key header
+# - requests without the header run the action as usual
+# - async actions (AsyncBookViewSet) get an async wrapper that uses the cache's async methods
+def idempotent(action):
+    if iscoroutinefunction(action):
+        return aidempotent(action)
+
+    @functools.wraps(action)
+    def wrapper(view, request, *args, **kwargs):
+        keys = get_idempotency_keys(view, request)
+        if keys is None:
+            return action(view, request, *args, **kwargs)
+        error = check_idempotency_key(request)
+        if error is not None:
+            return error
+        response_key, lock_key = keys
+        fingerprint = get_request_fingerprint(request)
+        token = uuid.uuid4().hex
+
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT
+        while True:
+            stored = cache.get(response_key)
+            if stored is not None:
+                return replay_response(stored, fingerprint)
+
+            # run the action if no other request with this key is running
+            if cache.add(lock_key, token, IDEMPOTENCY_LOCK_TIMEOUT):
+                break
+            if time.monotonic() > deadline:
+                return in_progress_response()
+            time.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+        try:
+            # the first request may have finished between the check & the lock
+            stored = cache.get(response_key)
+            if stored is not None:
+                return replay_response(stored, fingerprint)
+
+            response = action(view, request, *args, **kwargs)
+            entry = get_stored_entry(response, fingerprint)
+            if entry is not None:
+                cache.set(response_key, entry, IDEMPOTENCY_TIMEOUT)
+            return response
+        finally:
+            release_lock(lock_key, token)
+
+    return wrapper
+
+
+def aidempotent(action):
+    @functools.wraps(action)
+    async def wrapper(view, request, *args, **kwargs):
+        keys = get_idempotency_keys(view, request)
+        if keys is None:
+            return await action(view, request, *args, **kwargs)
+        error = check_idempotency_key(request)
+        if error is not None:
+            return error
+        response_key, lock_key = keys
+        fingerprint = get_request_fingerprint(request)
+        token = uuid.uuid4().hex
+
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT
+        while True:
+            stored = await cache.aget(response_key)
+            if stored is not None:
+                return replay_response(stored, fingerprint)
+
+            if await cache.aadd(lock_key, token, IDEMPOTENCY_LOCK_TIMEOUT):
+                break
+            if time.monotonic() > deadline:
+                return in_progress_response()
+            await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+        try:
+            stored = await cache.aget(response_key)
+            if stored is not None:
+                return replay_response(stored, fingerprint)
+
+            response = await action(view, request, *args, **kwargs)
+            entry = get_stored_entry(response, fingerprint)
+            if entry is not None:
+                await cache.aset(response_key, entry, IDEMPOTENCY_TIMEOUT)
+            return response
+        finally:
+            await arelease_lock(lock_key, token)
+
+    return wrapper
@@ -0,0 +1,64 @@
+# import connection & transaction to run the conditional updates & record the loans in one transaction
+# https://docs.djangoproject.com/en/5.1/topics/db/transactions/
+from django.db import connection, transaction
+
+# import timezone to set the time of the loans
+from django.utils import timezone
+
+# import models
+from .models import Book, Loan
+
+#########################################################################################################
+
+# checkout & return of books, safe under concurrent requests
+# reading a book, checking its availability & saving it (what a PATCH does) lets two clients both read True
+# & both check the book out, the second save silently overwriting the first (a lost update)
+# here each checkout is a single conditional UPDATE ... WHERE availability = 1:
+# - the database applies the check & the change together, so of any number of concurrent checkouts of a book
+#   exactly one changes the row, & the others see that no row changed
+# - RETURNING gives the ids that did change, so a batch of ids needs a single UPDATE too
+# - the loans of the books that changed are inserted in the same transaction
+# returns are the same UPDATE the other way round, closing the open loans
+# https://www.sqlite.org/lang_returning.html
+
+BOOK_TABLE = Book._meta.db_table
+
+# the most books checked out or returned in a request (SQLite allows 32766 parameters per statement)
+LOAN_BATCH_MAX = 500
+
+
+# set the availability of the books of `ids` that have the opposite availability,
+# returns the sorted ids of the books that changed
+def set_availability(ids, available, now):
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE "{BOOK_TABLE}" SET availability = %s, updated_at = %s '
+            f'WHERE id IN ({placeholders}) AND availability = %s RETURNING id',
+            [available, connection.ops.adapt_datetimefield_value(now), *ids, not available],
+        )
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+# check out the available books of `ids` for `borrower`, returns the ids of the books checked out
+# - the other books were already checked out or do not exist
+def checkout_books(ids, borrower=''):
+    ids = list(dict.fromkeys(ids))
+    now = timezone.now()
+    with transaction.atomic():
+        checked_out = set_availability(ids, False, now)
+        if checked_out:
+            Loan.objects.bulk_create([Loan(book_id=id, borrower=borrower, checked_out_at=now) for id in checked_out])
+    return checked_out
+
+
+# return the checked out books of `ids`, returns the ids of the books returned
+# - the other books were not checked out or do not exist
+def return_books(ids):
+    ids = list(dict.fromkeys(ids))
+    now = timezone.now()
+    with transaction.atomic():
+        returned = set_availability(ids, True, now)
+        if returned:
+            Loan.objects.filter(book_id__in=returned, returned_at__isnull=True).update(returned_at=now)
+    return returned
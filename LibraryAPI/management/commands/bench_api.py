@@ -0,0 +1,101 @@
+# import json to read & write the baselines
+import json
+
+# import tempfile to run against a scratch copy of the catalogue
+import tempfile
+
+# import BaseCommand & CommandError to create a custom management command that can fail
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand, CommandError
+
+# import settings to find the default mix
+from django.conf import settings
+
+# import the benchmark suite
+from LibraryAPI.benchmarking import (
+    parse_count, get_catalogue, bench_environment, load_mix, replay, summarize,
+    describe_environment, find_regressions,
+)
+
+#########################################################################################################
+
+# benchmark the books API with a recorded request mix against a seeded synthetic catalogue
+# - the catalogue (e.g. --books 1k, 100k or 1M) is seeded once into benchmarks/catalogues/ & copied for every run,
+#   so the writes of one run never change the next one
+# - the requests go through the whole middleware stack with django's test client (no network),
+#   one at a time, in the same seeded order on every run
+# - the report shows the requests, throughput, p50/p95/p99 latency & errors of each request in the mix
+# store a baseline:      python manage.py bench_api --books 100k --save-baseline benchmarks/baseline-100k.json
+# check a change/upgrade: python manage.py bench_api --books 100k --compare benchmarks/baseline-100k.json
+# the comparison fails (exit code 1) if a latency grows or the throughput drops by more than --tolerance
+# baselines are only comparable on the same machine, with the same catalogue, mix & number of requests
+class Command(BaseCommand):
+    help = "Benchmark the books API with a request mix & compare the results with a baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', default='1k', help="Catalogue size, e.g. 1k, 100k or 1M")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the catalogue & the request sequence")
+        parser.add_argument('--mix', default=str(settings.BASE_DIR / 'benchmarks' / 'default.jsonl'),
+                            help="JSONL file of weighted requests")
+        parser.add_argument('--requests', type=int, default=3000, help="Number of timed requests")
+        parser.add_argument('--warmup', type=int, default=300, help="Number of untimed requests sent first")
+        parser.add_argument('--save-baseline', help="Write the results to this JSON file")
+        parser.add_argument('--compare', help="Compare the results with this baseline JSON file")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed slowdown before the comparison fails (0.2 = 20%%)")
+
+    def handle(self, *args, **options):
+        books = parse_count(options['books'])
+        mix = load_mix(options['mix'])
+        environment = describe_environment(books, options['requests'], options['mix'])
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = json.load(file)
+            self.check_comparable(baseline['environment'], environment)
+
+        catalogue = get_catalogue(books, seed=options['seed'], progress=self.report_seeding)
+        with tempfile.TemporaryDirectory() as directory:
+            with bench_environment(catalogue, directory):
+                results = replay(mix, books, options['requests'], warmup=options['warmup'], seed=options['seed'])
+        summary = summarize(results)
+        self.report(summary, environment)
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w', encoding='utf-8') as file:
+                json.dump({'environment': environment, 'results': summary}, file, indent=2)
+            self.stdout.write(f"baseline saved to {options['save_baseline']}")
+
+        if baseline is not None:
+            regressions = find_regressions(summary, baseline['results'], options['tolerance'])
+            for name, metric, before, after, change in regressions:
+                self.stdout.write(self.style.ERROR(
+                    f"{name}: {metric} {before:,.2f} → {after:,.2f} ({change:+.0%})"
+                ))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regression(s) compared with {options['compare']}")
+            self.stdout.write(self.style.SUCCESS(f"no regressions compared with {options['compare']}"))
+
+    def report_seeding(self, added):
+        if added % 100000 == 0:
+            self.stdout.write(f"seeded {added:,} books")
+
+    # refuse to compare results measured under different conditions
+    def check_comparable(self, before, after):
+        for key in ('books', 'requests', 'mix'):
+            if before.get(key) != after.get(key):
+                raise CommandError(f"The baseline was measured with {key}={before.get(key)}, not {after.get(key)}")
+        for key in ('python', 'django', 'djangorestframework', 'sqlite_profile', 'machine'):
+            if before.get(key) != after.get(key):
+                self.stdout.write(self.style.WARNING(f"{key} changed: {before.get(key)} → {after.get(key)}"))
+
+    def report(self, summary, environment):
+        self.stdout.write(f"{environment['books']:,} books, {environment['requests']:,} requests from {environment['mix']}")
+        self.stdout.write(f"{'request':<16} {'count':>6} {'req/sec':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                          f"{'errors':>7} {'skipped':>8}")
+        for name, result in summary.items():
+            self.stdout.write(
+                f"{name:<16} {result['requests']:>6,} {result['rps']:>9,.0f} {result['p50_ms']:>8.2f} "
+                f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['errors']:>7,} {result['skipped']:>8,}"
+            )
@@ -0,0 +1,76 @@
+# import multiprocessing to run several worker processes against the same cache
+import multiprocessing
+
+# import time to measure throughput
+import time
+
+# import BaseCommand to create a custom management command
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand
+
+# import caches to build the benchmarked backends from settings
+from django.core.cache import caches
+
+#########################################################################################################
+
+# count & read in a loop, like a throttle does for each request, then report how long it took
+def worker(alias, key, operations, barrier, results):
+    cache = caches.create_connection(alias)
+    barrier.wait()
+
+    start = time.perf_counter()
+    for i in range(operations):
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, 3600):
+                cache.incr(key)
+        cache.get(f'{key}_{i % 100}')
+    results.put(time.perf_counter() - start)
+
+
+# measure how the default cache behaves when several processes hit the same key at once
+# - every increment from every process should be counted exactly once in a shared cache
+# run with: python manage.py bench_cache --processes 8
+class Command(BaseCommand):
+    help = "Benchmark the default cache under multi-process contention"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help="Number of worker processes")
+        parser.add_argument('--operations', type=int, default=2000, help="Increments per worker process")
+        parser.add_argument('--alias', default='default', help="Cache alias from settings.CACHES to benchmark")
+
+    def handle(self, *args, **options):
+        alias, processes, operations = options['alias'], options['processes'], options['operations']
+        cache = caches[alias]
+        key = 'bench_cache_counter'
+        cache.delete(key)
+
+        # start the workers together so they contend for the same key
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(processes)
+        results = context.Queue()
+        workers = [
+            context.Process(target=worker, args=(alias, key, operations, barrier, results))
+            for _ in range(processes)
+        ]
+        for process in workers:
+            process.start()
+        durations = [results.get() for _ in workers]
+        for process in workers:
+            process.join()
+
+        # every increment is visible to this process only if the cache is shared & incr() is atomic
+        expected = processes * operations
+        counted = cache.get(key, 0)
+        slowest = max(durations)
+        self.stdout.write(f"backend:      {cache.__class__.__name__}")
+        self.stdout.write(f"processes:    {processes}")
+        self.stdout.write(f"throughput:   {expected * 2 / slowest:,.0f} operations/sec (incr + get)")
+        self.stdout.write(f"counted:      {counted:,} of {expected:,} increments")
+
+        cache.delete(key)
+        if counted != expected:
+            self.stdout.write(self.style.WARNING("Increments were lost or not shared between processes"))
+        else:
+            self.stdout.write(self.style.SUCCESS("All increments were counted"))
@@ -0,0 +1,109 @@
+# import logging to leave out the warning django logs for each missing book
+import logging
+
+# import random & time to pick the ids & measure the requests
+import random
+import time
+
+# import tempfile to run against a scratch copy of the catalogue
+import tempfile
+
+# import median to combine the rounds
+from statistics import median
+
+# import BaseCommand & CommandError to create a custom management command that can fail
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand, CommandError
+
+# import the cache to start each round with an empty response cache
+from django.core.cache import cache
+
+# import the test client to send requests through the whole middleware stack without a network
+from django.test import Client
+
+# import models
+from LibraryAPI.models import Book
+
+# import the benchmark suite
+from LibraryAPI.benchmarking import parse_count, get_catalogue, bench_environment
+
+#########################################################################################################
+
+
+# fetch the books of `ids` one request at a time, returns the envelope of each
+def fetch_one_by_one(client, ids):
+    return [client.get(f'/api/v1/books/{id}/').json() for id in ids]
+
+
+# fetch the books of `ids` with GET /books/?ids=, returns the envelope of each
+def fetch_with_get(client, ids):
+    return client.get('/api/v1/books/', {'ids': ','.join(map(str, ids))}).json()['data']
+
+
+# fetch the books of `ids` with POST /books/fetch/, returns the envelope of each
+def fetch_with_post(client, ids):
+    return client.post('/api/v1/books/fetch/', {'ids': ids}, content_type='application/json').json()['data']
+
+
+METHODS = (
+    ("one by one", fetch_one_by_one),
+    ("GET ?ids=", fetch_with_get),
+    ("POST /fetch/", fetch_with_post),
+)
+
+
+# compare fetching a list of books with a request per book against a single multi-get request
+# - each round picks random ids (a few of them missing) & fetches them with each method, with an empty response cache
+# - the books each method returns are checked against each other: the multi-get must return, in order,
+#   the envelope a retrieve of each id returns
+# - the report shows the median time to fetch the whole list with each method
+# run with: python manage.py bench_multi_get --books 100k --sizes 10,50,200
+class Command(BaseCommand):
+    help = "Compare fetching books with a request per book against a single multi-get request"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', default='1k', help="Catalogue size, e.g. 1k, 100k or 1M")
+        parser.add_argument('--sizes', default='10,50,200', help="Comma separated numbers of ids fetched at once")
+        parser.add_argument('--rounds', type=int, default=20, help="Number of lists fetched for each size")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        catalogue = get_catalogue(parse_count(options['books']))
+        rng = random.Random(0)
+
+        self.stdout.write(f"{'ids':>5} " + ''.join(f"{name:>16}" for name, _ in METHODS) + f"{'speedup':>10}")
+        with tempfile.TemporaryDirectory() as directory:
+            with bench_environment(catalogue, directory):
+                client = Client()
+                # the missing ids are expected here
+                logging.getLogger('django.request').setLevel(logging.ERROR)
+                ids = list(Book.objects.values_list('id', flat=True))
+                missing = max(ids) + 1
+
+                for size in sizes:
+                    times = {name: [] for name, _ in METHODS}
+                    for _ in range(options['rounds']):
+                        # one id in ten is not in the catalogue
+                        picked = [missing if rng.random() < 0.1 else id for id in rng.sample(ids, size)]
+                        results = {}
+                        for name, fetch in METHODS:
+                            cache.clear()
+                            start = time.perf_counter()
+                            results[name] = fetch(client, picked)
+                            times[name].append(time.perf_counter() - start)
+                        self.check_results(picked, results)
+
+                    medians = [median(times[name]) for name, _ in METHODS]
+                    self.stdout.write(
+                        f"{size:>5} " + ''.join(f"{elapsed * 1000:>13.1f} ms" for elapsed in medians)
+                        + f"{medians[0] / min(medians[1:]):>9.1f}x"
+                    )
+
+    # check that every method returned the same books
+    def check_results(self, ids, results):
+        expected = [{key: value for key, value in envelope.items() if key != 'headers'}
+                    for envelope in results["one by one"]]
+        for name, _ in METHODS[1:]:
+            items = [{key: value for key, value in item.items() if key != 'id'} for item in results[name]]
+            if items != expected or [item['id'] for item in results[name]] != ids:
+                raise CommandError(f"{name} did not return the books a retrieve of each id returns")
@@ -0,0 +1,153 @@
+# import random & time to build synthetic books & measure throughput
+import random
+import time
+
+# import Decimal, which DRF writes as a float
+from decimal import Decimal
+
+# import datetime to give the synthetic books a created_at & updated_at
+from datetime import datetime, timedelta, timezone
+
+# import BaseCommand & CommandError to create a custom management command that can fail
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand, CommandError
+
+# import DRF's JSON renderer, the reference output, & its error details
+from rest_framework.renderers import JSONRenderer
+from rest_framework.exceptions import ErrorDetail
+
+# import the renderer being checked & the float of the search results
+from LibraryAPI.renderers import EnvelopeJSONRenderer, JSONFloat, orjson
+
+# import the fast read serializer to build the envelopes like the views
+from LibraryAPI.serializers import BookReadSerializer
+
+# import the synthetic books of the benchmarks
+from LibraryAPI.benchmarking import make_book
+
+#########################################################################################################
+
+# text that JSON encoders tend to write differently: quotes, escapes, control characters, non-ASCII & the
+# line & paragraph separators DRF escapes for javascript
+AWKWARD_TEXT = 'He said "hi" \\ back/forth\ttab\x00\x1f\x7f café naïve 東京 😀    '
+
+
+# return `count` books as the rows of the list view (id, created_at & updated_at included)
+# - every `awkward`th book has AWKWARD_TEXT as its summary (none if 0)
+def make_rows(count, seed=0, awkward=7):
+    rng = random.Random(seed)
+    created_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(count):
+        book = make_book(rng, i)
+        added = created_at + timedelta(seconds=i, microseconds=i * 7919 % 1000000)
+        rows.append({
+            'id': i + 1,
+            'title': book.title,
+            'author': book.author,
+            'edition': book.edition,
+            'published_date': book.published_date,
+            'genre': book.genre,
+            'summary': AWKWARD_TEXT if awkward and i % awkward == 0 else book.summary,
+            'created_at': added,
+            'updated_at': added + timedelta(days=i % 3, microseconds=i * 104729 % 1000000),
+            'availability': book.availability,
+        })
+    return rows
+
+
+# return the envelopes the views send: (description, data)
+def make_envelopes(rows):
+    serializer = BookReadSerializer()
+    rate_limit = {"X-RateLimit-Limit": 100, "X-RateLimit-Remaining": 99, "X-RateLimit-Reset": 1767225600}
+    return [
+        ("list page", {
+            "status": "success", "code": 200, "message": "Successfully retrieved all Books",
+            "data": serializer.many(rows), "next": "http://testserver/api/v1/books/?cursor=cD0xMA%3D%3D",
+            "previous": None, "headers": rate_limit,
+        }),
+        ("empty list", {
+            "status": "success", "code": 200, "message": "There are no Books in the library", "data": [],
+            "next": None, "previous": None,
+        }),
+        ("search results", {
+            "status": "success", "code": 200, "message": f"Found {len(rows)} Books matching the search",
+            "data": [{**book, "search": {"rank": JSONFloat(-1.98e-06 * (i + 1) ** 3),
+                                         "title": f"<mark>{book['title']}</mark>"}}
+                     for i, book in enumerate(serializer.many(rows))],
+        }),
+        ("single book", {
+            "status": "success", "code": 200, "message": "Successfully retrieved Book",
+            "data": serializer.to_representation(rows[0]),
+        }),
+        ("validation errors", {
+            "title": [ErrorDetail("This field is required.", code='required')],
+            "non_field_errors": [ErrorDetail("This book by this author already exists.", code='unique')],
+        }),
+        ("not found", {"detail": ErrorDetail("Not found.", code='not_found')}),
+        ("large integers & keys", {"data": {1: 2 ** 70}}),
+        ("decimals", {"data": [Decimal('0.00001'), Decimal('1E+16')]}),
+    ]
+
+
+# check that EnvelopeJSONRenderer writes the same bytes as DRF's JSONRenderer & compare their speed
+# - parity: the envelopes of the views (list pages, search, a book, errors) with awkward text, compact & indented,
+#   with orjson & without
+# - throughput: responses/sec for list pages of each --page-sizes (of ordinary books), rendered by each renderer
+# run with: python manage.py bench_renderer --page-sizes 10,100
+class Command(BaseCommand):
+    help = "Check EnvelopeJSONRenderer matches DRF's JSONRenderer & benchmark both"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-sizes', default='10,100', help="Comma separated numbers of books per page")
+        parser.add_argument('--repeat', type=int, default=2000, help="Number of responses rendered per timed run")
+
+    def handle(self, *args, **options):
+        page_sizes = [int(size) for size in options['page_sizes'].split(',')]
+        renderers = self.get_renderers()
+
+        failures = 0
+        reference = JSONRenderer()
+        for size in page_sizes:
+            for description, data in make_envelopes(make_rows(size)):
+                for media_type in ('application/json', 'application/json; indent=4'):
+                    expected = reference.render(data, media_type)
+                    for name, renderer in renderers[1:]:
+                        if renderer.render(data, media_type) != expected:
+                            failures += 1
+                            self.stdout.write(self.style.WARNING(
+                                f"{name} renders the {description} ({size}, {media_type}) differently"
+                            ))
+        if failures:
+            raise CommandError(f"{failures} envelope(s) rendered differently")
+        self.stdout.write(self.style.SUCCESS("EnvelopeJSONRenderer matches JSONRenderer"))
+        if orjson is None:
+            self.stdout.write(self.style.WARNING("orjson is not installed, only the standard library encoder is used"))
+
+        for size in page_sizes:
+            data = make_envelopes(make_rows(size, awkward=0))[0][1]
+            for name, renderer in renderers:
+                best = self.time(renderer, data, options['repeat'])
+                self.stdout.write(f"{name:<28} {size:>4} books: {best / options['repeat'] * 1e6:8.1f} µs/response "
+                                  f"({options['repeat'] / best:,.0f} responses/sec)")
+
+    # return the renderers to compare, DRF's first
+    def get_renderers(self):
+        renderers = [("JSONRenderer", JSONRenderer())]
+        standard = EnvelopeJSONRenderer()
+        standard.use_orjson = False
+        renderers.append(("EnvelopeJSONRenderer (json)", standard))
+        if orjson is not None:
+            renderers.append(("EnvelopeJSONRenderer (orjson)", EnvelopeJSONRenderer()))
+        return renderers
+
+    # return the fastest of 5 runs rendering the envelope `repeat` times
+    def time(self, renderer, data, repeat):
+        best = None
+        for _ in range(5):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                renderer.render(data, 'application/json')
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,109 @@
+# import time to measure throughput
+import time
+
+# import date & timedelta to build synthetic books
+from datetime import date, timedelta
+
+# import BaseCommand & CommandError to create a custom management command that can fail
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand, CommandError
+
+# import transaction to roll back the synthetic books
+from django.db import transaction
+
+# import models
+from LibraryAPI.models import Book
+
+# import serializers
+from LibraryAPI.serializers import BookSerializer, BookReadSerializer
+
+#########################################################################################################
+
+# raised to roll back the synthetic books once the benchmark is done
+class Rollback(Exception):
+    pass
+
+
+# compare BookReadSerializer with BookSerializer
+# - parity: every row must serialize to exactly the same dict (for all fields & for the list's compact projection)
+#   (SerializerParityTests in LibraryAPI/tests.py runs the same check with the tests)
+# - throughput: rows/sec for pages of --page-size rows, model instances + BookSerializer vs .values() + BookReadSerializer
+# if the table has fewer than --rows books, synthetic books are added in a transaction that is rolled back afterwards
+# run with: python manage.py bench_serializer --rows 10000
+class Command(BaseCommand):
+    help = "Check BookReadSerializer matches BookSerializer & benchmark both"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help="Minimum number of books to serialize")
+        parser.add_argument('--page-size', type=int, default=10000, help="Rows serialized per page")
+        parser.add_argument('--repeat', type=int, default=3, help="Number of timed runs (the fastest is reported)")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(options['rows'])
+                failures = self.check_parity()
+                self.benchmark(options['page_size'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        if failures:
+            raise CommandError(f"{failures} row(s) serialized differently")
+        self.stdout.write(self.style.SUCCESS("BookReadSerializer matches BookSerializer"))
+
+    # add synthetic books until the table has at least `rows` books
+    def seed(self, rows):
+        missing = rows - Book.objects.count()
+        if missing <= 0:
+            return
+        self.stdout.write(f"adding {missing:,} synthetic books (rolled back afterwards)")
+        Book.objects.bulk_create(
+            [
+                Book(
+                    title=f"Benchmark Book {i}",
+                    author=f"Author {i % 500}",
+                    edition=str(i % 5 + 1),
+                    published_date=date(1950, 1, 1) + timedelta(days=i % 25000),
+                    genre=f"Genre {i % 20}",
+                    summary=f"A synthetic summary for benchmark book {i} — café, naïve, 東京.",
+                    availability=i % 3 != 0,
+                )
+                for i in range(missing)
+            ],
+            batch_size=2000,
+        )
+
+    # serialize every row with both serializers & count the rows that differ
+    def check_parity(self):
+        failures = 0
+        for fields in (None, [name for name in BookSerializer().fields if name != 'summary']):
+            reference = BookSerializer(fields=fields)
+            fast = BookReadSerializer(fields)
+            rows = Book.objects.order_by('id').values(*fast.fields)
+            for book, row in zip(Book.objects.order_by('id').iterator(), rows.iterator()):
+                expected = reference.to_representation(book)
+                actual = fast.to_representation(row)
+                if expected != actual or list(expected) != list(actual):
+                    failures += 1
+                    if failures <= 5:
+                        self.stdout.write(self.style.WARNING(f"book {book.id}: {actual} != {expected}"))
+        return failures
+
+    # time both read paths on the first page & report rows/sec
+    def benchmark(self, page_size, repeat):
+        def drf():
+            return BookSerializer(list(Book.objects.order_by('id')[:page_size]), many=True).data
+
+        def fast():
+            serializer = BookReadSerializer()
+            return serializer.many(Book.objects.order_by('id').values(*serializer.fields)[:page_size])
+
+        for name, run in (("BookSerializer", drf), ("BookReadSerializer", fast)):
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                count = len(run())
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write(f"{name:<20} {count:,} rows in {best * 1000:,.1f} ms ({count / best:,.0f} rows/sec)")
@@ -0,0 +1,151 @@
+# import multiprocessing to run several worker processes against the same database
+import multiprocessing
+
+# import os & tempfile to benchmark a scratch database file
+import os
+import tempfile
+
+# import time to measure throughput & latency
+import time
+
+# import date to build books
+from datetime import date
+
+# import BaseCommand & CommandError to create a custom management command that can fail
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand, CommandError
+
+# import settings to read the SQLite profiles
+from django.conf import settings
+
+# import connections & transaction to run the workload on the scratch database
+from django.db import connections, transaction, OperationalError
+
+# import models
+from LibraryAPI.models import Book
+
+#########################################################################################################
+
+# alias of the scratch database in django.db.connections
+ALIAS = 'bench_sqlite'
+
+
+# run one kind of request in a loop until the deadline & report the operations, errors & latencies
+# - the connection is closed after each request like django does when CONN_MAX_AGE is 0
+def worker(kind, number, duration, rows, barrier, results):
+    barrier.wait()
+    deadline = time.perf_counter() + duration
+    connection = connections[ALIAS]
+    books = Book.objects.using(ALIAS)
+    latencies = []
+    errors = 0
+    count = 0
+
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if kind == 'read':
+                # a list page
+                list(books.order_by('-id')[:20])
+            elif count % 2:
+                # an update that reads the book before writing it (what PUT & PATCH do)
+                with transaction.atomic(using=ALIAS):
+                    book = books.get(id=1 + (number * 7919 + count) % rows)
+                    book.availability = not book.availability
+                    book.save(update_fields=['availability'])
+            else:
+                # a POST
+                books.create(
+                    title=f"Book {number}-{count}", author="Bench Author", edition="1",
+                    published_date=date(2000, 1, 1), genre="Bench", summary="A benchmark book summary.",
+                )
+            latencies.append(time.perf_counter() - start)
+        except OperationalError:
+            errors += 1
+        count += 1
+        connection.close_if_unusable_or_obsolete()
+
+    connection.close()
+    results.put((kind, latencies, errors))
+
+
+# return the value below which `share` of the sorted latencies fall
+def percentile(latencies, share):
+    if not latencies:
+        return 0.0
+    return latencies[min(int(len(latencies) * share), len(latencies) - 1)]
+
+
+# run the same concurrent read/write workload on a scratch copy of each SQLite profile in settings.SQLITE_PROFILES
+# - readers fetch list pages, writers alternate between POST-like inserts & PUT-like read-then-update transactions
+# - the report shows operations/sec, errors ("database is locked") & p50/p99 latency for reads & writes
+# run with: python manage.py bench_sqlite --readers 4 --writers 4 --duration 10
+class Command(BaseCommand):
+    help = "Benchmark concurrent reads & writes on each SQLite profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4, help="Number of reader processes")
+        parser.add_argument('--writers', type=int, default=4, help="Number of writer processes")
+        parser.add_argument('--duration', type=float, default=10, help="Seconds to run each profile")
+        parser.add_argument('--rows', type=int, default=10000, help="Books in the scratch database")
+        parser.add_argument('--profile', action='append', help="Profile to benchmark (default: all of them)")
+
+    def handle(self, *args, **options):
+        profiles = options['profile'] or list(settings.SQLITE_PROFILES)
+        unknown = set(profiles) - set(settings.SQLITE_PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profile(s): {', '.join(sorted(unknown))}")
+
+        self.stdout.write(f"{options['readers']} readers, {options['writers']} writers, {options['duration']:g}s per profile")
+        self.stdout.write(f"{'profile':<8} {'kind':<6} {'ops/sec':>9} {'errors':>7} {'p50 ms':>8} {'p99 ms':>8}")
+        for profile in profiles:
+            with tempfile.TemporaryDirectory() as directory:
+                self.setup_database(profile, os.path.join(directory, 'bench.sqlite3'), options['rows'])
+                try:
+                    self.run_profile(profile, options)
+                finally:
+                    connections[ALIAS].close()
+                    del connections[ALIAS]
+                    del connections.settings[ALIAS]
+
+    # add a scratch database using the profile's settings & fill it with books
+    def setup_database(self, profile, path, rows):
+        database = {**settings.SQLITE_PROFILES[profile], 'NAME': path}
+        databases = connections.configure_settings({'default': settings.DATABASES['default'], ALIAS: database})
+        connections.settings[ALIAS] = databases[ALIAS]
+
+        with connections[ALIAS].schema_editor() as editor:
+            editor.create_model(Book)
+        Book.objects.using(ALIAS).bulk_create(
+            [
+                Book(title=f"Seed {i}", author=f"Author {i % 100}", edition="1", published_date=date(2000, 1, 1),
+                     genre="Seed", summary="A seeded benchmark book.")
+                for i in range(rows)
+            ],
+            batch_size=1000,
+        )
+        # the workers open their own connections after the fork
+        connections[ALIAS].close()
+
+    def run_profile(self, profile, options):
+        kinds = ['read'] * options['readers'] + ['write'] * options['writers']
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(len(kinds))
+        results = context.Queue()
+        workers = [
+            context.Process(target=worker, args=(kind, number, options['duration'], options['rows'], barrier, results))
+            for number, kind in enumerate(kinds)
+        ]
+        for process in workers:
+            process.start()
+        reports = [results.get() for _ in workers]
+        for process in workers:
+            process.join()
+
+        for kind in ('read', 'write'):
+            latencies = sorted(latency for report_kind, values, _ in reports if report_kind == kind for latency in values)
+            errors = sum(count for report_kind, _, count in reports if report_kind == kind)
+            self.stdout.write(
+                f"{profile:<8} {kind:<6} {len(latencies) / options['duration']:>9,.0f} {errors:>7,} "
+                f"{percentile(latencies, 0.50) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f}"
+            )
@@ -0,0 +1,91 @@
+# import time to measure how long each throttle takes
+import time
+
+# import BaseCommand to create a custom management command
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand
+
+# import LocMemCache to give each benchmark run its own empty cache
+from django.core.cache.backends.locmem import LocMemCache
+
+# import RequestFactory to build requests without running a server
+from django.test import RequestFactory
+
+# import DRF's default anonymous throttle to compare against
+from rest_framework.throttling import AnonRateThrottle
+
+# import the sliding window throttle
+from LibraryAPI.throttling import SlidingWindowAnonRateThrottle
+
+#########################################################################################################
+
+# replay the previous accounting: DRF's throttle followed by the old fetch_rate_limit_info
+# - the old function re-read, trimmed, prepended to & rewrote the same history list after the throttle had done so
+def legacy_request(throttle_class, request):
+    throttle = throttle_class()
+    throttle.allow_request(request, None)
+
+    history = throttle.cache.get(throttle.key, [])
+    now_ts = throttle.timer()
+    while history and history[-1] <= now_ts - throttle.duration:
+        history.pop()
+    history.insert(0, now_ts)
+    throttle.cache.set(throttle.key, history, throttle.duration)
+    return {
+        "X-RateLimit-Limit": throttle.num_requests,
+        "X-RateLimit-Remaining": max(throttle.num_requests - len(history), 0),
+        "X-RateLimit-Reset": int(now_ts + throttle.duration),
+    }
+
+
+# count & return the headers with the sliding window throttle
+def sliding_window_request(throttle_class, request):
+    throttle_class().allow_request(request, None)
+    return request.rate_limit_info
+
+
+# compare the request accounting of the previous throttle with the sliding window throttle
+# run with: python manage.py bench_throttle
+class Command(BaseCommand):
+    help = "Benchmark the rate limit accounting at 100/hour & 10000/min"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000, help="Number of requests to simulate per run")
+        parser.add_argument('--rates', nargs='+', default=['100/hour', '10000/min'], help="Throttle rates to benchmark")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'rate':<12}{'implementation':<18}{'requests/sec':>14}{'us/request':>12}")
+
+        for rate in options['rates']:
+            for name, base_class, run in (
+                ('legacy', AnonRateThrottle, legacy_request),
+                ('sliding-window', SlidingWindowAnonRateThrottle, sliding_window_request),
+            ):
+                elapsed = self.run(base_class, run, rate, options['requests'])
+                per_second = options['requests'] / elapsed
+                self.stdout.write(
+                    f"{rate:<12}{name:<18}{per_second:>14,.0f}{elapsed / options['requests'] * 1e6:>12.1f}"
+                    )
+
+    # time `count` requests from a single client against a fresh cache
+    def run(self, base_class, run, rate, count):
+        # use a throttle with its own cache & rate so the benchmark does not touch the real cache
+        throttle_class = type('BenchThrottle', (base_class,), {
+            'cache': LocMemCache(f'bench-throttle-{base_class.__name__}-{rate}', {'OPTIONS': {'MAX_ENTRIES': 100000}}),
+            'rate': rate,
+        })
+
+        # spread the requests evenly across one throttle duration so the history fills up to the limit
+        num_requests, duration = throttle_class().parse_rate(rate)
+        clock = [time.time()]
+        step = duration / max(num_requests, 1)
+        throttle_class.timer = staticmethod(lambda: clock[0])
+
+        request = RequestFactory().get('/api/v1/books/')
+        request.user = None
+
+        start = time.perf_counter()
+        for _ in range(count):
+            clock[0] += step
+            run(throttle_class, request)
+        return time.perf_counter() - start
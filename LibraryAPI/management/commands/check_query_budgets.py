@@ -0,0 +1,151 @@
+# import json to encode the request bodies
+import json
+
+# import tempfile to run against a scratch database & cache
+import tempfile
+
+# import async_to_sync to call the async views
+from asgiref.sync import async_to_sync
+
+# import BaseCommand & CommandError to create a custom management command that can fail
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand, CommandError
+
+# import connection & CaptureQueriesContext to count the queries of each request
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+# import the cache to measure the uncached requests
+from django.core.cache import cache
+
+# import DRF's request factory to call the views directly
+# https://www.django-rest-framework.org/api-guide/testing/#apirequestfactory
+from rest_framework.test import APIRequestFactory
+
+# import django's async request factory for the async views
+from django.test import AsyncRequestFactory
+
+# import models
+from LibraryAPI.models import Book
+
+# import both viewsets
+from LibraryAPI.views import BookViewSet
+from LibraryAPI.async_views import AsyncBookViewSet
+
+# import the budget error
+from LibraryAPI.query_budget import QueryBudgetExceeded
+
+# import the scratch environment & the synthetic catalogue of the benchmarks
+from LibraryAPI.benchmarking import api_sandbox, use_database, seed_catalogue
+
+#########################################################################################################
+
+# the number of books seeded in the scratch database
+CATALOGUE_SIZE = 50
+
+# a book that is not in the seeded catalogue
+NEW_BOOK = {
+    'title': "Query Budgets", 'author': "A. Checker", 'edition': "1st", 'published_date': '2001-01-01',
+    'genre': "Reference", 'summary': "A book added by check_query_budgets", 'availability': True,
+}
+
+
+# return the requests to check: (name, method, viewset actions, path, data, view kwargs)
+# - each write changes a different book, so the requests can run in any order
+# - `available` & `checked_out` are two more books of each availability, for the checkouts & returns
+def get_checked_requests(books, available, checked_out):
+    first, second, third, fourth = books[:4]
+    return [
+        ("list", 'get', {'get': 'list'}, '/api/v1/books/', None, {}),
+        ("list filtered", 'get', {'get': 'list'}, f'/api/v1/books/?genre={first.genre}&ordering=-published_date', None, {}),
+        ("search", 'get', {'get': 'list'}, f'/api/v1/books/?q={first.title.split()[0]}', None, {}),
+        ("retrieve", 'get', {'get': 'retrieve'}, f'/api/v1/books/{first.id}/', None, {'pk': first.id}),
+        ("multi-get", 'get', {'get': 'list'}, f'/api/v1/books/?ids={first.id},{second.id},{10 ** 9}', None, {}),
+        ("fetch", 'post', {'post': 'fetch'}, '/api/v1/books/fetch/', {'ids': [third.id, first.id, fourth.id]}, {}),
+        ("create", 'post', {'post': 'create'}, '/api/v1/books/', NEW_BOOK, {}),
+        ("update", 'put', {'put': 'update'}, f'/api/v1/books/{second.id}/',
+         {**NEW_BOOK, 'title': "Query Budgets, updated"}, {'pk': second.id}),
+        ("partial update", 'patch', {'patch': 'partial_update'}, f'/api/v1/books/{third.id}/',
+         {'availability': not third.availability}, {'pk': third.id}),
+        ("destroy", 'delete', {'delete': 'destroy'}, f'/api/v1/books/{fourth.id}/', None, {'pk': fourth.id}),
+        ("changes", 'get', {'get': 'changes'}, '/api/v1/books/changes/?since=1', None, {}),
+        ("stats", 'get', {'get': 'stats'}, '/api/v1/books/stats/', None, {}),
+        ("checkout", 'post', {'post': 'checkout'}, f'/api/v1/books/{available[0].id}/checkout/',
+         {'borrower': "A. Checker"}, {'pk': available[0].id}),
+        ("return", 'post', {'post': 'return_book'}, f'/api/v1/books/{checked_out[0].id}/return/', None,
+         {'pk': checked_out[0].id}),
+        ("checkout many", 'post', {'post': 'checkout_many'}, '/api/v1/books/checkout/',
+         {'ids': [available[1].id, checked_out[0].id]}, {}),
+        ("return many", 'post', {'post': 'return_many'}, '/api/v1/books/return/',
+         {'ids': [checked_out[1].id, available[0].id]}, {}),
+    ]
+
+
+# build the request of a checked request with a request factory
+def make_request(factory, method, path, data):
+    if data is None:
+        return getattr(factory, method)(path)
+    return getattr(factory, method)(path, json.dumps(data), content_type='application/json')
+
+
+# call a view with a request
+def call_view(view, request, kwargs):
+    return view(request, **kwargs)
+
+
+async def acall_view(view, request, kwargs):
+    return await view(request, **kwargs)
+
+
+# check that every BookViewSet action (sync & async) stays within its query budget (see LibraryAPI/query_budget.py)
+# - runs each action once against a scratch database seeded with a small synthetic catalogue,
+#   with an empty response cache, & reports the queries it ran
+# - fails (exit code 1) if an action goes over its budget, e.g. after adding a field that is loaded per book
+# - QueryBudgetTests in LibraryAPI/tests.py runs the same requests with the tests & checks their exact query counts
+# - run it in CI with the other checks: python manage.py check_query_budgets
+class Command(BaseCommand):
+    help = "Check that the BookViewSet actions stay within their query budgets"
+
+    def handle(self, *args, **options):
+        failures = []
+        with tempfile.TemporaryDirectory() as directory:
+            with api_sandbox(directory), override_settings(QUERY_BUDGET_MODE='raise'):
+                for viewset, factory, call in (
+                    (BookViewSet, APIRequestFactory(), call_view),
+                    (AsyncBookViewSet, AsyncRequestFactory(), async_to_sync(acall_view)),
+                ):
+                    # a new database for each viewset, so both run the same requests
+                    with use_database(f'{directory}/{viewset.__name__}.sqlite3'):
+                        for _ in seed_catalogue(CATALOGUE_SIZE):
+                            pass
+                        failures += self.check_viewset(viewset, factory, call)
+
+        if failures:
+            raise CommandError(f"{len(failures)} actions failed their query budget check")
+
+    def check_viewset(self, viewset, factory, call):
+        failures = []
+        books = list(Book.objects.order_by('id')[:4])
+        others = Book.objects.exclude(id__in=[book.id for book in books]).order_by('id')
+        available = list(others.filter(availability=True)[:2])
+        checked_out = list(others.filter(availability=False)[:2])
+        for name, method, actions, path, data, kwargs in get_checked_requests(books, available, checked_out):
+            cache.clear()
+            view = viewset.as_view(actions)
+            request = make_request(factory, method, path, data)
+
+            description = f"{viewset.__name__} {name}"
+            try:
+                with CaptureQueriesContext(connection) as queries:
+                    response = call(view, request, kwargs)
+            except QueryBudgetExceeded as error:
+                failures.append(description)
+                self.stdout.write(self.style.ERROR(f"FAIL {error}"))
+                continue
+
+            if response.status_code >= 400:
+                failures.append(description)
+                self.stdout.write(self.style.ERROR(f"FAIL {description}: status {response.status_code}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"ok   {description}: {len(queries)} queries"))
+        return failures
@@ -0,0 +1,88 @@
+# import BaseCommand & CommandError to create a custom management command that can fail
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand, CommandError
+
+# import connection to check which database is used
+from django.db import connection
+
+# import Q to build the keyset pagination condition
+from django.db.models import Q
+
+# import models
+from LibraryAPI.models import Book, BookChange, CatalogueStat
+
+#########################################################################################################
+
+# the queries the API relies on being index backed, with the index (or index lookup) each plan should show
+# - SQLite names the index of a unique constraint sqlite_autoindex_*, so check for the lookup instead
+# - filter(availability=True) compiles to a bare "WHERE availability" that cannot use an index,
+#   so the API filters booleans with availability__in=[True] to get "availability=?"
+def get_checked_queries():
+    return [
+        ("unique title & author check", 'title=? AND author=?',
+         Book.objects.filter(title='title', author='author')),
+        ("batched unique title & author check", 'title=? AND author=?',
+         Book.objects.filter(title__in=['a', 'b'], author__in=['c', 'd'])),
+        ("filter by author, newest first", 'book_author_published_idx',
+         Book.objects.filter(author='author').order_by('-published_date')),
+        ("filter by genre, newest first", 'book_genre_published_idx',
+         Book.objects.filter(genre='genre').order_by('-published_date')),
+        ("filter by availability, newest first", 'book_available_published_idx',
+         Book.objects.filter(availability__in=[True]).order_by('-published_date')),
+        ("published date range", 'book_published_idx',
+         Book.objects.filter(published_date__gte='2000-01-01', published_date__lte='2010-12-31')),
+        ("sort by published date", 'book_published_idx',
+         Book.objects.order_by('published_date')),
+        ("sort by created_at", 'book_created_idx',
+         Book.objects.order_by('-created_at')),
+        ("keyset page filtered by genre", 'published_date<?',
+         Book.objects.filter(genre='genre', published_date__lte='2000-01-01')
+         .filter(Q(published_date__lt='2000-01-01') | Q(id__lt=100))
+         .order_by('-published_date', '-id')),
+        ("page of the change feed", 'INTEGER PRIMARY KEY (rowid>?)',
+         BookChange.objects.filter(revision__gt=100).order_by('revision').values('revision', 'book__title')[:101]),
+        ("catalogue statistics by genre & year", 'dimension=?',
+         CatalogueStat.objects.filter(dimension__in=['total', 'genre', 'year']).order_by('dimension', 'value')),
+    ]
+
+
+# return what is wrong with the query plan of a queryset that should use `index`, an empty list if nothing is
+def get_plan_problems(queryset, index):
+    plan = queryset.explain()
+    table = Book._meta.db_table
+
+    problems = []
+    # a full table scan reads every row
+    if any(line.strip().endswith(f'SCAN {table}') for line in plan.splitlines()):
+        problems.append("full table scan")
+    if 'TEMP B-TREE' in plan:
+        problems.append("sorts without an index")
+    if index not in plan:
+        problems.append(f"does not use {index}")
+    return problems
+
+
+# check that SQLite's query planner uses the Book indexes for the API's common queries
+# - the same checks run with the tests (QueryPlanTests in LibraryAPI/tests.py)
+# - fails (exit code 1) if a query scans the whole table, sorts in a temporary b-tree or uses a different index
+# - run after migrating, e.g. in CI: python manage.py check_query_plans
+# https://www.sqlite.org/eqp.html
+class Command(BaseCommand):
+    help = "Check that the common Book queries use their indexes (EXPLAIN QUERY PLAN)"
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("check_query_plans only understands SQLite query plans")
+
+        failures = []
+        for description, index, queryset in get_checked_queries():
+            problems = get_plan_problems(queryset, index)
+            if problems:
+                failures.append(description)
+                self.stdout.write(self.style.ERROR(f"FAIL {description}: {', '.join(problems)}"))
+                self.stdout.write(queryset.explain())
+            else:
+                self.stdout.write(self.style.SUCCESS(f"ok   {description}"))
+
+        if failures:
+            raise CommandError(f"{len(failures)} queries do not use their indexes")
@@ -0,0 +1,91 @@
+# import json & os to read & write the checkpoint file
+import json
+import os
+
+# import time to report the export speed
+import time
+
+# import BaseCommand & CommandError to create a custom management command that can fail
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand, CommandError
+
+# import the streaming export
+from LibraryAPI.transfer import TRANSFER_FORMATS, EXPORT_BATCH_SIZE, export_lines
+
+#########################################################################################################
+
+# export the whole catalogue to an NDJSON or CSV file, streaming the rows so memory stays flat at any table size
+# - the format is taken from the file extension (.ndjson / .csv) unless --format is given
+# - every --checkpoint-every books the file is flushed & <output>.checkpoint records the last id & the file size,
+#   so an interrupted export continues with --resume (the file is cut back to the checkpoint first)
+# - the checkpoint is removed once the export is complete
+# run with: python manage.py export_books books.ndjson
+# resume:   python manage.py export_books books.ndjson --resume
+class Command(BaseCommand):
+    help = "Stream every book to an NDJSON or CSV file, resumable from a checkpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="File to write")
+        parser.add_argument('--format', choices=TRANSFER_FORMATS, help="Export format (default: from the file extension)")
+        parser.add_argument('--resume', action='store_true', help="Continue an interrupted export from its checkpoint")
+        parser.add_argument('--checkpoint-every', type=int, default=EXPORT_BATCH_SIZE,
+                            help="Books written between checkpoints")
+
+    def handle(self, *args, **options):
+        output = options['output']
+        format = options['format'] or get_format(output)
+        checkpoint_path = f'{output}.checkpoint'
+
+        after_id, offset = 0, 0
+        if options['resume']:
+            if not os.path.exists(checkpoint_path):
+                raise CommandError(f"No checkpoint found at {checkpoint_path}, run the export without --resume")
+            with open(checkpoint_path) as file:
+                checkpoint = json.load(file)
+            after_id, offset = checkpoint['last_id'], checkpoint['offset']
+
+        start = time.perf_counter()
+        written = 0
+        last_id = after_id
+        with open(output, 'r+' if options['resume'] else 'w', encoding='utf-8', newline='') as file:
+            # drop anything written after the checkpoint
+            file.seek(offset)
+            file.truncate()
+
+            for book_id, line in export_lines(format, after_id=after_id, header=not options['resume']):
+                file.write(line)
+                if book_id is None:
+                    continue
+                last_id = book_id
+                written += 1
+                if written % options['checkpoint_every'] == 0:
+                    save_checkpoint(checkpoint_path, file, last_id)
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {written:,} books to {output} ({format}) in {elapsed:.1f}s "
+            f"({written / elapsed if elapsed else 0:,.0f} books/sec)"
+        ))
+
+
+# return the format of a file from its extension
+def get_format(path):
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    if extension == 'jsonl':
+        return 'ndjson'
+    if extension not in TRANSFER_FORMATS:
+        raise CommandError(f"Cannot tell the format of {path}, use --format ({' or '.join(TRANSFER_FORMATS)})")
+    return extension
+
+
+# flush the file & record how far the export got
+# - the checkpoint is written to a temporary file & renamed, so it is never left half written
+def save_checkpoint(path, file, last_id):
+    file.flush()
+    os.fsync(file.fileno())
+    with open(f'{path}.tmp', 'w') as checkpoint:
+        json.dump({"last_id": last_id, "offset": file.tell()}, checkpoint)
+    os.replace(f'{path}.tmp', path)
@@ -0,0 +1,87 @@
+# import json & os to read & write the checkpoint & error files
+import json
+import os
+
+# import time to report the import speed
+import time
+
+# import BaseCommand & CommandError to create a custom management command that can fail
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand, CommandError
+
+# import the streaming import
+from LibraryAPI.transfer import TRANSFER_FORMATS, read_records, import_records
+
+# import the format detection of the export command
+from .export_books import get_format
+
+#########################################################################################################
+
+# import books from an NDJSON or CSV file (e.g. one written by export_books), streaming the records so memory stays flat
+# - the records are validated with BookSerializer's rules & written in chunks with bulk_create (like /books/bulk/)
+# - ids & created_at are not imported, & books that already exist are reported as duplicates
+# - after each chunk <input>.checkpoint records how many records were processed,
+#   so an interrupted import continues with --resume instead of starting again
+# - the errors of the failed records (with their record number) can be written to an NDJSON file with --errors
+# run with: python manage.py import_books books.ndjson --errors failed.ndjson
+# resume:   python manage.py import_books books.ndjson --resume
+class Command(BaseCommand):
+    help = "Stream books from an NDJSON or CSV file into the catalogue, resumable from a checkpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="File to read")
+        parser.add_argument('--format', choices=TRANSFER_FORMATS, help="Import format (default: from the file extension)")
+        parser.add_argument('--resume', action='store_true', help="Continue an interrupted import from its checkpoint")
+        parser.add_argument('--errors', help="NDJSON file to write the errors of the failed records to")
+
+    def handle(self, *args, **options):
+        path = options['input']
+        format = options['format'] or get_format(path)
+        checkpoint_path = f'{path}.checkpoint'
+
+        skip = 0
+        if options['resume']:
+            if not os.path.exists(checkpoint_path):
+                raise CommandError(f"No checkpoint found at {checkpoint_path}, run the import without --resume")
+            with open(checkpoint_path) as file:
+                skip = json.load(file)['processed']
+
+        errors_file = None
+        if options['errors']:
+            errors_file = open(options['errors'], 'a' if options['resume'] else 'w', encoding='utf-8')
+
+        start = time.perf_counter()
+        processed = skip
+        created = failed = 0
+        try:
+            with open(path, encoding='utf-8', newline='') as file:
+                for processed, results in import_records(read_records(format, file), skip=skip):
+                    for result in results:
+                        if result["status"] == "created":
+                            created += 1
+                            continue
+                        failed += 1
+                        if errors_file is not None:
+                            errors_file.write(json.dumps(result, ensure_ascii=False) + '\n')
+                    save_checkpoint(checkpoint_path, processed)
+        finally:
+            if errors_file is not None:
+                errors_file.close()
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed - skip:,} records from {path} ({format}) in {elapsed:.1f}s: "
+            f"{created:,} created, {failed:,} failed "
+            f"({(processed - skip) / elapsed if elapsed else 0:,.0f} records/sec)"
+        ))
+
+
+# record how many records were processed
+# - the checkpoint is written to a temporary file & renamed, so it is never left half written
+def save_checkpoint(path, processed):
+    with open(f'{path}.tmp', 'w') as checkpoint:
+        json.dump({"processed": processed}, checkpoint)
+    os.replace(f'{path}.tmp', path)
@@ -0,0 +1,161 @@
+# import asyncio to keep many connections open from a single process
+import asyncio
+
+# import itertools to cycle through the request paths
+import itertools
+
+# import resource to raise the open file limit for 1000s of sockets
+import resource
+
+# import time to measure latency
+import time
+
+# import urlsplit to read the target URLs
+from urllib.parse import urlsplit
+
+# import BaseCommand & CommandError to create a custom management command that can fail
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand, CommandError
+
+#########################################################################################################
+
+# the requests sent by default: list pages, a filtered & sorted page & single books
+DEFAULT_PATHS = [
+    '/api/v1/books/?page_size=20',
+    '/api/v1/books/?genre=Fantasy&ordering=-published_date',
+    '/api/v1/books/1/',
+    '/api/v1/books/2/?fields=id,title',
+]
+
+
+# read one HTTP/1.1 response & return its status code & whether the server closes the connection
+# - the body is read with Content-Length or chunked transfer encoding (streamed lists)
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() == 'close'
+
+
+# send requests over one keep-alive connection until the deadline, reconnecting if the server closes it
+async def connection_worker(host, port, paths, deadline, stats):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+
+            path = next(paths)
+            request = f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nAccept: application/json\r\n\r\n'
+            start = time.perf_counter()
+            writer.write(request.encode('latin-1'))
+            await writer.drain()
+            status, closed = await read_response(reader)
+            stats['latencies'].append(time.perf_counter() - start)
+            stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+
+            if closed:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as error:
+            stats['errors'][type(error).__name__] = stats['errors'].get(type(error).__name__, 0) + 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            # back off a little so a refused connection does not spin
+            await asyncio.sleep(0.05)
+
+    if writer is not None:
+        writer.close()
+
+
+# run `connections` workers against one server for `duration` seconds
+async def run_load(url, paths, connections, duration):
+    parts = urlsplit(url)
+    if parts.scheme != 'http' or not parts.hostname:
+        raise CommandError(f"Only http:// URLs are supported, got {url!r}")
+    host, port = parts.hostname, parts.port or 80
+
+    stats = {'latencies': [], 'statuses': {}, 'errors': {}}
+    path_cycle = itertools.cycle(paths)
+    start = time.perf_counter()
+    deadline = start + duration
+    workers = [
+        asyncio.create_task(connection_worker(host, port, path_cycle, deadline, stats))
+        for _ in range(connections)
+    ]
+
+    # stop at the deadline, dropping the requests still waiting for a response
+    _, pending = await asyncio.wait(workers, timeout=duration)
+    for worker in pending:
+        worker.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    stats['elapsed'] = time.perf_counter() - start
+    return stats
+
+
+# return the value below which `share` of the sorted latencies fall
+def percentile(latencies, share):
+    if not latencies:
+        return 0.0
+    return latencies[min(int(len(latencies) * share), len(latencies) - 1)]
+
+
+# compare the throughput & tail latency of servers under the same load, e.g. WSGI vs ASGI
+# start each server first (both with the same number of worker processes), then run:
+#   gunicorn LibraryManagement.wsgi -w 4 --threads 8 -b 127.0.0.1:8000
+#   uvicorn LibraryManagement.asgi:application --workers 4 --port 8001
+#   python manage.py loadtest --target wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001 --connections 1000
+# - raise ANON_THROTTLE_RATE (e.g. 1000000/min) on the servers, or most requests are answered with 429
+# - every connection is kept alive & sends its next request as soon as the previous response arrives
+class Command(BaseCommand):
+    help = "Load test running API servers with many concurrent keep-alive connections"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True,
+                            help="name=http://host:port of a running server (repeat to compare servers)")
+        parser.add_argument('--connections', type=int, default=1000, help="Number of concurrent connections")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds to run against each target")
+        parser.add_argument('--path', action='append', help="Request path to send (repeat for a mix)")
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            name, _, url = target.rpartition('=')
+            targets.append((name or url, url))
+        paths = options['path'] or DEFAULT_PATHS
+
+        # each connection needs a file descriptor
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = options['connections'] + 100
+        if soft < wanted:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+        self.stdout.write(f"{'target':<10} {'requests':>9} {'req/sec':>9} {'p50 ms':>8} {'p90 ms':>8} "
+                          f"{'p99 ms':>8} {'max ms':>8}  statuses / errors")
+        for name, url in targets:
+            stats = asyncio.run(run_load(url, paths, options['connections'], options['duration']))
+            latencies = sorted(stats['latencies'])
+            statuses = ', '.join(f"{code}: {count}" for code, count in sorted(stats['statuses'].items()))
+            errors = ', '.join(f"{error}: {count}" for error, count in sorted(stats['errors'].items()))
+            self.stdout.write(
+                f"{name:<10} {len(latencies):>9,} {len(latencies) / stats['elapsed']:>9,.0f} "
+                f"{percentile(latencies, 0.50) * 1000:>8.1f} {percentile(latencies, 0.90) * 1000:>8.1f} "
+                f"{percentile(latencies, 0.99) * 1000:>8.1f} {(latencies[-1] if latencies else 0) * 1000:>8.1f}"
+                f"  {statuses}{' / ' + errors if errors else ''}"
+            )
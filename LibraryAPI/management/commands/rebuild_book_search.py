@@ -0,0 +1,21 @@
+# import BaseCommand to create a custom management command
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand, CommandError
+
+# import the search helpers
+from LibraryAPI.search import rebuild_search_index, search_supported
+
+#########################################################################################################
+
+# recreate the full text search table & triggers, then re-index every book
+# - use it if the index was lost, e.g. after restoring the Book table from a backup
+# run with: python manage.py rebuild_book_search
+class Command(BaseCommand):
+    help = "Rebuild the full text search index of the books"
+
+    def handle(self, *args, **options):
+        if not search_supported():
+            raise CommandError("Full text search needs SQLite with FTS5")
+
+        rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS("Rebuilt the book search index"))
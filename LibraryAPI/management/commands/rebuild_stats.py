@@ -0,0 +1,63 @@
+# import BaseCommand & CommandError to create a custom management command that can fail
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand, CommandError
+
+# import transaction to read the statistics & count the books in the same snapshot
+from django.db import transaction
+
+# import the statistics helpers
+from LibraryAPI.stats import (TOTAL, stats_supported, create_stats_triggers, rebuild_stats, read_stats,
+                              count_stats)
+
+# import the response cache helpers, so cached statistics are not served after a rebuild
+from LibraryAPI.caching import bump_catalogue_generation
+
+#########################################################################################################
+
+
+# describe the books of a group, or its absence
+def describe(stat):
+    return "missing" if stat is None else f"{stat[0]} books, {stat[1]} available"
+
+
+# recreate the statistics triggers & count every book again, or check the statistics against a full recount
+# - use it if the statistics were lost or changed by hand, e.g. after restoring the Book table from a backup
+# - with --check nothing is changed: each group that differs from the recount is listed & it fails (exit code 1)
+# run with: python manage.py rebuild_stats --check
+class Command(BaseCommand):
+    help = "Rebuild the catalogue statistics, or check them against a full recount of the books"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only compare the statistics with a full recount")
+
+    def handle(self, *args, **options):
+        if not stats_supported():
+            raise CommandError("The catalogue statistics need SQLite triggers")
+
+        if options['check']:
+            self.check_stats()
+            return
+
+        create_stats_triggers()
+        rebuild_stats()
+        bump_catalogue_generation()
+        books = read_stats([])[(TOTAL, '')][0]
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the catalogue statistics of {books} books"))
+
+    def check_stats(self):
+        # a single transaction, so no book is written between reading the statistics & counting the books
+        with transaction.atomic():
+            kept = read_stats()
+            counted = count_stats()
+
+        differences = [group for group in sorted(kept.keys() | counted.keys()) if kept.get(group) != counted.get(group)]
+        for dimension, value in differences:
+            self.stdout.write(self.style.ERROR(
+                f"{dimension} {value!r}: {describe(kept.get((dimension, value)))} in the statistics, "
+                f"{describe(counted.get((dimension, value)))} counted"
+            ))
+        if differences:
+            raise CommandError(f"{len(differences)} groups differ from a full recount, run: python manage.py rebuild_stats")
+        self.stdout.write(self.style.SUCCESS(
+            f"The statistics of {counted[(TOTAL, '')][0]} books in {len(counted) - 1} groups match a full recount"
+        ))
@@ -0,0 +1,45 @@
+# import BaseCommand to create a custom management command
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand
+
+# import connection to empty the table
+from django.db import connection
+
+# import models
+from LibraryAPI.models import Book
+
+# import the synthetic catalogue of the benchmark suite
+from LibraryAPI.benchmarking import parse_count, seed_catalogue
+
+# import the response cache
+from LibraryAPI.caching import bump_catalogue_generation
+
+#########################################################################################################
+
+# add synthetic books to the database, e.g. to try the API with a large catalogue
+# - the books are the ones bench_api benchmarks with: the same count & seed always give the same books
+# - the books are numbered after the ones already in the table, so seeding twice does not add duplicates
+# run with: python manage.py seed_books 100k
+class Command(BaseCommand):
+    help = "Add synthetic books to the database (e.g. 1k, 100k or 1M)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', help="Number of books to add, e.g. 1000, 100k or 1M")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic books")
+        parser.add_argument('--clear', action='store_true', help="Delete every book first")
+
+    def handle(self, *args, **options):
+        count = parse_count(options['count'])
+        if options['clear']:
+            # delete with a single statement, QuerySet.delete() would load every book to send the delete signals
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {Book._meta.db_table}')
+                self.stdout.write(f"deleted {cursor.rowcount:,} books")
+
+        start = Book.objects.count()
+        for added in seed_catalogue(count, seed=options['seed'], start=start):
+            if added % 100000 == 0:
+                self.stdout.write(f"added {added:,} books")
+        # bulk_create does not send the Book signals, so invalidate the cached responses here
+        bump_catalogue_generation()
+        self.stdout.write(self.style.SUCCESS(f"Added {count:,} books ({start + count:,} in total)"))
@@ -0,0 +1,191 @@
+# import json, os, re, shutil, subprocess & sys to start fresh Python processes & read their timings
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+# import tempfile to run against a scratch copy of the catalogue & a scratch cache
+import tempfile
+
+# import median to combine the runs
+from statistics import median
+
+# import defaultdict to sum the import times of each package
+from collections import defaultdict
+
+# import BaseCommand & CommandError to create a custom management command that can fail
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand, CommandError
+
+# import settings to find the project directory
+from django.conf import settings
+
+# import the synthetic catalogues of the benchmarks
+from LibraryAPI.benchmarking import get_catalogue
+
+#########################################################################################################
+
+# the script each fresh process runs: load the app like a WSGI server (wsgi.py, with its warm-up), then send
+# list & book requests & print their times as JSON
+# - every database setting points at the scratch catalogue before the app is loaded
+# - the line written to stderr after the app is loaded separates its imports from the script's
+# - each list request follows the cursor to the next page & each book request asks for another book,
+#   so none of them is answered from the response cache
+CHILD_SCRIPT = '''
+import json, os, sys, time
+start = time.perf_counter()
+from django.conf import settings
+for database in settings.DATABASES.values():
+    database['NAME'] = os.environ['STARTUP_REPORT_DATABASE']
+import LibraryManagement.wsgi
+loaded = time.perf_counter()
+sys.stderr.write('startup_report: loaded\\n')
+sys.stderr.flush()
+
+from django.test import Client
+client = Client(SERVER_NAME='localhost', HTTP_ACCEPT='application/json')
+
+def timed(path):
+    start = time.perf_counter()
+    response = client.get(path)
+    if response.status_code != 200:
+        raise SystemExit(f"GET {path} returned {response.status_code}")
+    return (time.perf_counter() - start) * 1000, response
+
+times = {'list': [], 'retrieve': []}
+ids = []
+path = '/api/v1/books/'
+for number in range(int(os.environ['STARTUP_REPORT_REQUESTS'])):
+    if path is None:
+        raise SystemExit(f"The catalogue has fewer than {number + 1} pages")
+    elapsed, response = timed(path)
+    times['list'].append(elapsed)
+    envelope = response.json()
+    ids += [book['id'] for book in envelope['data']]
+    path = envelope['next']
+    times['retrieve'].append(timed(f'/api/v1/books/{ids[number]}/')[0])
+print(json.dumps({'load_ms': (loaded - start) * 1000, 'requests': times}))
+'''
+
+LOADED_MARKER = 'startup_report: loaded'
+
+# a line of python -X importtime: self & cumulative microseconds, then the module indented by its depth
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+# return the import times of a process's stderr, up to the marker: {module: (self ms, cumulative ms)}
+def parse_import_times(stderr):
+    times = {}
+    for line in stderr.splitlines():
+        if line == LOADED_MARKER:
+            break
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            times[match.group(4)] = (int(match.group(1)) / 1000, int(match.group(2)) / 1000)
+    return times
+
+
+# return the self time of the modules of each top-level package
+def sum_packages(import_times):
+    packages = defaultdict(float)
+    for module, (self_ms, _) in import_times.items():
+        packages[module.split('.')[0]] += self_ms
+    return packages
+
+
+# report what a new worker spends its time on before it is as fast as a warm one
+# - starts fresh Python processes that load the app through wsgi.py, without & with the warm-up (LIBRARY_WARMUP),
+#   against a scratch copy of a seeded catalogue & a scratch cache
+# - import times: the packages & modules imported until the warm app is ready (python -X importtime),
+#   the self time of LibraryManagement.wsgi is the work it does itself: building the app & the warm-up
+# - startup: the time to load the app, & of the first list & book requests against the next ones (the median)
+# run with: python manage.py startup_report --runs 5
+# https://docs.python.org/3/using/cmdline.html#cmdoption-X
+class Command(BaseCommand):
+    help = "Report the import times & first request latency of a new worker, without & with the warm-up"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help="Number of fresh processes for each setting")
+        parser.add_argument('--requests', type=int, default=20, help="Number of requests of each kind per process")
+        parser.add_argument('--books', type=int, default=1000, help="Size of the seeded catalogue")
+        parser.add_argument('--top', type=int, default=15, help="Number of packages & modules listed")
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1 or options['requests'] < 2:
+            raise CommandError("--runs must be at least 1 & --requests at least 2")
+        catalogue = get_catalogue(options['books'])
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            database = os.path.join(directory, 'startup.sqlite3')
+            shutil.copyfile(catalogue, database)
+            for warmup in (False, True):
+                results[warmup] = [self.start_worker(database, directory, warmup, options)
+                                   for _ in range(options['runs'])]
+
+        self.report_imports([import_times for import_times, _ in results[True]], options['top'])
+        self.report_startup({warmup: [timings for _, timings in runs] for warmup, runs in results.items()})
+
+    # start a fresh process & return its import times & timings
+    def start_worker(self, database, directory, warmup, options):
+        environment = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'LibraryManagement.settings',
+            'LIBRARY_WARMUP': '1' if warmup else '0',
+            'LIBRARY_ASYNC_VIEWS': '0',
+            'DB_REPLICAS': '',
+            'CACHE_LOCATION': os.path.join(directory, 'cache.sqlite3'),
+            'ANON_THROTTLE_RATE': '1000000000/min',
+            'QUERY_BUDGET_MODE': 'off',
+            'STARTUP_REPORT_DATABASE': database,
+            'STARTUP_REPORT_REQUESTS': str(options['requests']),
+        }
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT],
+            cwd=settings.BASE_DIR, env=environment, capture_output=True, text=True,
+        )
+        if process.returncode != 0:
+            errors = [line for line in process.stderr.splitlines() if not line.startswith('import time:')]
+            raise CommandError("The worker failed:\n" + '\n'.join(errors[-20:]))
+        return parse_import_times(process.stderr), json.loads(process.stdout.splitlines()[-1])
+
+    def report_imports(self, runs, top):
+        self.stdout.write(f"Imports until the app is warm (median of {len(runs)} processes, ms)")
+        packages = defaultdict(list)
+        for import_times in runs:
+            for package, self_ms in sum_packages(import_times).items():
+                packages[package].append(self_ms)
+        totals = {package: median(times) for package, times in packages.items()}
+        self.stdout.write(f"  {'all modules':<40} {sum(totals.values()):8.1f}")
+        for package, total in sorted(totals.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(f"  {package:<40} {total:8.1f}")
+
+        self.stdout.write(f"{'Slowest modules (ms)':<42} {'self':>8} {'with its imports':>17}")
+        modules = defaultdict(list)
+        for import_times in runs:
+            for module, times in import_times.items():
+                modules[module].append(times)
+        slowest = sorted(
+            ((module, median(self_ms for self_ms, _ in times), median(cumulative for _, cumulative in times))
+             for module, times in modules.items()),
+            key=lambda item: -item[1],
+        )
+        for module, self_ms, cumulative in slowest[:top]:
+            self.stdout.write(f"  {module:<40} {self_ms:8.1f} {cumulative:17.1f}")
+
+    def report_startup(self, timings):
+        title = f"Startup (median of {len(timings[False])} processes, ms)"
+        self.stdout.write(f"{title:<42} {'without warm-up':>16} {'with warm-up':>13}")
+        rows = [("load the app", [[run['load_ms']] for run in timings[False]], [[run['load_ms']] for run in timings[True]])]
+        for kind in ('list', 'retrieve'):
+            rows.append((f"first {kind} request",
+                         [run['requests'][kind][:1] for run in timings[False]],
+                         [run['requests'][kind][:1] for run in timings[True]]))
+            rows.append((f"next {kind} requests",
+                         [run['requests'][kind][1:] for run in timings[False]],
+                         [run['requests'][kind][1:] for run in timings[True]]))
+        for name, cold, warm in rows:
+            cold = median(time for run in cold for time in run)
+            warm = median(time for run in warm for time in run)
+            self.stdout.write(f"  {name:<40} {cold:16.1f} {warm:13.1f}")
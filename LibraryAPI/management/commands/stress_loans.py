@@ -0,0 +1,167 @@
+# import logging to leave out the warning django logs for each 409
+import logging
+
+# import multiprocessing to run several client processes against the same database
+import multiprocessing
+
+# import random & time to pick the requests & measure throughput & latency
+import random
+import time
+
+# import tempfile to run against a scratch database & cache
+import tempfile
+
+# import Counter to count the responses & the loans of each book
+from collections import Counter
+
+# import BaseCommand & CommandError to create a custom management command that can fail
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand, CommandError
+
+# import connection to close it before the workers are forked
+from django.db import connection
+
+# import the test client to send requests through the whole middleware stack without a network
+from django.test import Client
+
+# import models
+from LibraryAPI.models import Book, Loan
+
+# import the scratch environment, the synthetic catalogue & the percentiles of the benchmarks
+from LibraryAPI.benchmarking import api_sandbox, use_database, seed_catalogue, percentile
+
+#########################################################################################################
+
+# share of the requests that are batch checkouts or returns (the rest are for a single book)
+BATCH_SHARE = 0.1
+
+# number of books in a batch request
+BATCH_SIZE = 3
+
+
+# send checkouts & returns of random books until the deadline
+# & report the status codes, the books each client was given & returned, & the latencies
+def worker(number, ids, duration, barrier, results):
+    rng = random.Random(number)
+    # a server error is reported as a response, not raised in the worker
+    client = Client(raise_request_exception=False)
+    # most requests lose the race for their book, which is expected here
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    statuses = Counter()
+    checked_out = Counter()
+    returned = Counter()
+    latencies = []
+
+    barrier.wait()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        kind = rng.choice(('checkout', 'return'))
+        start = time.perf_counter()
+        if rng.random() < BATCH_SHARE:
+            batch = rng.sample(ids, min(BATCH_SIZE, len(ids)))
+            response = client.post(f'/api/v1/books/{kind}/', {'ids': batch, 'borrower': f"client {number}"},
+                                   content_type='application/json')
+            changed = []
+            if response.status_code in (200, 207):
+                changed = response.json()['data']['checked_out' if kind == 'checkout' else 'returned']
+        else:
+            book_id = rng.choice(ids)
+            response = client.post(f'/api/v1/books/{book_id}/{kind}/', {'borrower': f"client {number}"},
+                                   content_type='application/json')
+            changed = [book_id] if response.status_code == 200 else []
+        latencies.append(time.perf_counter() - start)
+
+        statuses[response.status_code] += 1
+        (checked_out if kind == 'checkout' else returned).update(changed)
+
+    connection.close()
+    results.put((statuses, checked_out, returned, latencies))
+
+
+# return the problems found in the loans & availability of the books against what the clients were told
+# - every checkout a client was told succeeded has its own loan, & every return closed one
+# - a book has at most one open loan, its latest, & is unavailable exactly while it has one
+def find_double_allocations(ids, checked_out, returned):
+    problems = []
+    loans = {book_id: [] for book_id in ids}
+    for book_id, returned_at in Loan.objects.filter(book_id__in=ids).order_by('id').values_list('book_id', 'returned_at'):
+        loans[book_id].append(returned_at)
+    availability = dict(Book.objects.filter(id__in=ids).values_list('id', 'availability'))
+
+    for book_id in ids:
+        history = loans[book_id]
+        open_loans = sum(returned_at is None for returned_at in history)
+        if len(history) != checked_out[book_id]:
+            problems.append(f"book {book_id}: {checked_out[book_id]} successful checkouts but {len(history)} loans")
+        if len(history) - open_loans != returned[book_id]:
+            problems.append(f"book {book_id}: {returned[book_id]} successful returns but {len(history) - open_loans} returned loans")
+        if any(returned_at is None for returned_at in history[:-1]):
+            problems.append(f"book {book_id}: checked out again before it was returned")
+        if availability[book_id] != (open_loans == 0):
+            problems.append(f"book {book_id}: available={availability[book_id]} with {open_loans} open loans")
+    return problems
+
+
+# check that concurrent checkouts & returns never give the same book to two clients
+# - worker processes send checkouts & returns (single & batch) of a few books through the API as fast as they can,
+#   against a scratch database & cache, so most requests race for the same books
+# - then every response a client got is checked against the loans & availability of the books
+# - fails (exit code 1) on a double allocation, a lost return or a server error
+# - the test suite races threads for a single book the same way (ConcurrentCheckoutTests in LibraryAPI/tests.py)
+# run with: python manage.py stress_loans --workers 16 --books 5 --duration 10
+class Command(BaseCommand):
+    help = "Check that concurrent checkouts & returns never give a book out twice"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="Number of client processes")
+        parser.add_argument('--books', type=int, default=5, help="Number of books the clients compete for")
+        parser.add_argument('--duration', type=float, default=10, help="Seconds to send requests for")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            with api_sandbox(directory), use_database(f'{directory}/stress.sqlite3'):
+                for _ in seed_catalogue(options['books']):
+                    pass
+                Book.objects.update(availability=True)
+                ids = list(Book.objects.order_by('id').values_list('id', flat=True))
+                reports = self.run_workers(ids, options)
+
+                statuses = sum((report[0] for report in reports), Counter())
+                checked_out = sum((report[1] for report in reports), Counter())
+                returned = sum((report[2] for report in reports), Counter())
+                latencies = sorted(latency for report in reports for latency in report[3])
+                problems = find_double_allocations(ids, checked_out, returned)
+
+        total = sum(statuses.values())
+        self.stdout.write(
+            f"{total:,} requests from {options['workers']} clients for {options['books']} books: "
+            f"{total / options['duration']:,.0f} requests/sec, p50 {percentile(latencies, 0.50) * 1000:.2f} ms, "
+            f"p99 {percentile(latencies, 0.99) * 1000:.2f} ms"
+        )
+        self.stdout.write("responses: " + ', '.join(f"{code} x {count:,}" for code, count in sorted(statuses.items())))
+        self.stdout.write(f"{sum(checked_out.values()):,} checkouts & {sum(returned.values()):,} returns succeeded")
+
+        errors = sum(count for code, count in statuses.items() if code >= 500 or code in (400, 404))
+        for problem in problems:
+            self.stdout.write(self.style.ERROR(problem))
+        if problems or errors:
+            raise CommandError(f"{len(problems)} problems & {errors} failed requests")
+        self.stdout.write(self.style.SUCCESS("No book was given out twice"))
+
+    # run the client processes & return their reports
+    def run_workers(self, ids, options):
+        # the workers open their own connections after the fork
+        connection.close()
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(options['workers'])
+        results = context.Queue()
+        workers = [
+            context.Process(target=worker, args=(number, ids, options['duration'], barrier, results))
+            for number in range(options['workers'])
+        ]
+        for process in workers:
+            process.start()
+        reports = [results.get() for _ in workers]
+        for process in workers:
+            process.join()
+        return reports
@@ -0,0 +1,77 @@
+# import sqlite3 to copy the database with SQLite's online backup API
+# https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection.backup
+import sqlite3
+
+# import time to time the copies & wait between them
+import time
+
+# import BaseCommand & CommandError to create a custom management command that can fail
+# https://docs.djangoproject.com/en/5.1/howto/custom-management-commands/
+from django.core.management.base import BaseCommand, CommandError
+
+# import settings & cache to find the replicas & record their sync state
+from django.conf import settings
+from django.core.cache import cache
+
+# import the catalogue generation, which tells which writes a copy includes
+from LibraryAPI.caching import get_catalogue_generation
+
+# import the replica state key & status
+from LibraryAPI.db_routers import REPLICA_STATE_KEY, get_replica_status
+
+#########################################################################################################
+
+# keep local SQLite read replicas in sync with the primary (a stand-in for real database replication)
+# - each sync copies a consistent snapshot of the primary into the replica file with the backup API
+# - the catalogue generation is read before copying, so the replica has at least every write of that generation
+# run once:             python manage.py sync_replica
+# keep them in sync:    python manage.py sync_replica --interval 1
+# report the lag:       python manage.py sync_replica --status
+class Command(BaseCommand):
+    help = "Copy the primary database to the read replicas & report their replication lag"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Seconds between syncs, 0 to sync once & exit")
+        parser.add_argument('--status', action='store_true', help="Only report the lag of each replica")
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas are configured, set DB_REPLICAS (e.g. DB_REPLICAS=replica.sqlite3)")
+
+        if options['status']:
+            self.report_status()
+            return
+
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                self.sync(alias)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    # copy the primary into a replica & record the generation it includes
+    def sync(self, alias):
+        generation = get_catalogue_generation()
+        start = time.perf_counter()
+
+        source = sqlite3.connect(str(settings.DATABASES['default']['NAME']))
+        target = sqlite3.connect(str(settings.DATABASES[alias]['NAME']))
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+        cache.set(REPLICA_STATE_KEY % alias, {"generation": generation, "synced_at": time.time()}, None)
+        self.stdout.write(f"{alias}: copied generation {generation} in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def report_status(self):
+        for alias, status in get_replica_status().items():
+            if status is None:
+                self.stdout.write(self.style.WARNING(f"{alias}: never synced, reads use the primary"))
+                continue
+            usable = status['lag'] <= settings.REPLICA_MAX_LAG
+            line = (f"{alias}: generation {status['generation']}, "
+                    f"{'behind the primary' if status['behind'] else 'up to date'}, lag {status['lag']:.1f}s")
+            self.stdout.write(self.style.SUCCESS(line) if usable else self.style.WARNING(f"{line} (not used)"))
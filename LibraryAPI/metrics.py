@@ -0,0 +1,215 @@
+# import bisect to find the bucket of a value
+import bisect
+
+# import threading to update the histograms from several threads
+import threading
+
+# import perf_counter to time the phases of a request
+from time import perf_counter
+
+# import ContextVar to collect the timings of the current request (works in threads & async tasks)
+from contextvars import ContextVar
+
+# import HttpResponse to serve the metrics
+from django.http import HttpResponse
+
+#########################################################################################################
+
+# request metrics kept in process memory & served at /metrics in the Prometheus text format
+# - MetricsMiddleware (see middleware.py) times each request & records it under its endpoint (the URL name)
+#   & its BookViewSet action (list, retrieve, bulk...)
+# - the phases of a request add their time to the request's timings with `with timed('phase'):`
+#   (serializer, throttle & cache), & every query adds to 'db' through a connection execute wrapper
+# - nothing is recorded unless LIBRARY_METRICS is on, timed() then only reads a context variable
+# each process keeps its own histograms, so with several worker processes Prometheus scrapes each of them
+# (or sums what it gets from the load balancer)
+# https://prometheus.io/docs/instrumenting/exposition_formats/
+# https://docs.djangoproject.com/en/5.1/topics/db/instrumentation/
+
+# the upper bounds of the histogram buckets
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# the histograms recorded for each request: name → (help, buckets, timing it observes)
+REQUEST_HISTOGRAMS = {
+    'library_db_queries': ("Database queries per request", COUNT_BUCKETS, 'db_queries'),
+    'library_db_duration_seconds': ("Time spent in database queries per request", DURATION_BUCKETS, 'db'),
+    'library_serializer_duration_seconds': ("Time spent serializing books per request", DURATION_BUCKETS, 'serializer'),
+    'library_throttle_duration_seconds': ("Time spent checking the rate limit per request", DURATION_BUCKETS, 'throttle'),
+    'library_cache_duration_seconds': ("Time spent reading & writing the response cache per request", DURATION_BUCKETS, 'cache'),
+}
+
+# the timings of the current request, or None when it is not recorded
+current_timings = ContextVar('current_timings', default=None)
+
+
+# define a histogram with cumulative buckets, like Prometheus's
+# the last count is for values above the largest bucket (+Inf)
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# define the store of every histogram & counter, keyed by (name, labels)
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.help = {}
+
+    def observe(self, name, help, buckets, labels, value):
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = Histogram(buckets)
+                self.help[name] = help
+            histogram.observe(value)
+
+    def increment(self, name, help, labels, amount=1):
+        with self.lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + amount
+            self.help[name] = help
+
+    # return every metric in the Prometheus text format
+    def render(self):
+        with self.lock:
+            histograms = {key: (list(h.counts), h.sum, h.count, h.buckets) for key, h in self.histograms.items()}
+            counters = dict(self.counters)
+            help = dict(self.help)
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f'# HELP {name} {help[name]}')
+            lines.append(f'# TYPE {name} counter')
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f'# HELP {name} {help[name]}')
+            lines.append(f'# TYPE {name} histogram')
+            for (metric, labels), (counts, total, count, buckets) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip((*buckets, '+Inf'), counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{format_labels((*labels, ("le", format_value(bound))))} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {format_value(total)}')
+                lines.append(f'{name}_count{format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+# return labels as {name="value",...}, escaping the values
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# return a number the way Prometheus writes it
+def format_value(value):
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# the metrics of this process
+registry = MetricsRegistry()
+
+
+# add the time of a block of code to a phase of the current request, e.g. `with timed('serializer'):`
+class timed:
+    __slots__ = ('phase', 'timings', 'start')
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.timings = current_timings.get()
+        if self.timings is not None:
+            self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings[self.phase] = self.timings.get(self.phase, 0.0) + perf_counter() - self.start
+
+
+# count & time every query of the current request
+# installed on each database connection by install_query_recorder()
+def record_query(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings['db'] += perf_counter() - start
+        timings['db_queries'] += 1
+
+
+# add record_query to a new database connection (connected to the connection_created signal in apps.py)
+# https://docs.djangoproject.com/en/5.1/ref/signals/#connection-created
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# start recording the timings of a request, returns them & a token for current_timings.reset()
+def start_request():
+    timings = {'db': 0.0, 'db_queries': 0}
+    return timings, current_timings.set(timings)
+
+
+# return the endpoint (URL name) & BookViewSet action of a request
+# DRF's viewsets keep the action of each method on the view function
+def get_request_labels(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched', ''
+    actions = getattr(match.func, 'actions', None) or {}
+    return match.view_name, actions.get(request.method.lower(), '')
+
+
+# record a finished request
+# - the size of streamed responses is unknown, & their rows are read after the request is recorded
+def record_request(request, response, elapsed, timings):
+    endpoint, action = get_request_labels(request)
+    labels = (('endpoint', endpoint), ('action', action))
+
+    registry.increment(
+        'library_requests_total', "Requests answered",
+        (*labels, ('method', request.method), ('status', response.status_code)),
+    )
+    registry.observe('library_request_duration_seconds', "Request wall time", DURATION_BUCKETS,
+                     (*labels, ('method', request.method)), elapsed)
+    for name, (help, buckets, phase) in REQUEST_HISTOGRAMS.items():
+        if phase in timings:
+            registry.observe(name, help, buckets, labels, timings[phase])
+    if not response.streaming:
+        registry.observe('library_response_size_bytes', "Response body size", SIZE_BUCKETS, labels, len(response.content))
+
+
+# serve the metrics of this process (added to the URLs when LIBRARY_METRICS is on)
+# restrict /metrics to the Prometheus server at the proxy, it is not throttled or authenticated
+def metrics_view(request):
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,132 @@
+# import the helpers that move between async & sync code
+# https://docs.djangoproject.com/en/5.1/topics/http/middleware/#asynchronous-support
+from asgiref.sync import sync_to_async, iscoroutinefunction, markcoroutinefunction
+
+# import os, random & re to profile a sample of the requests & save the slow ones
+# (cProfile is imported by the first profiled request)
+import os
+import random
+import re
+
+# import threading to profile one request at a time
+import threading
+
+# import perf_counter to time the requests
+from time import perf_counter, strftime
+
+# import settings to read the profiling options
+from django.conf import settings
+
+# import the request metrics
+from .metrics import start_request, current_timings, record_request, get_request_labels
+
+# import whitenoise's middleware to extend it
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+#########################################################################################################
+
+# define a WhiteNoise middleware that also supports async requests
+# whitenoise 6.8 only supports sync requests, & a single sync-only middleware makes Django run the whole
+# request (including async views) in a thread under ASGI
+# this version passes async requests straight to the next middleware & only uses a thread to serve a static file
+# https://whitenoise.readthedocs.io/en/stable/django.html
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        # finding a file may read the disk when autorefresh is on (DEBUG)
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+# define a middleware that records the time, queries & response size of every request (see metrics.py)
+# it is only added to settings.MIDDLEWARE when LIBRARY_METRICS is on, so it costs nothing when it is off
+# profiling: set METRICS_PROFILE_RATE to the share of requests to run under cProfile (e.g. 0.01),
+# profiled requests slower than METRICS_PROFILE_SLOW_MS are saved to METRICS_PROFILE_DIR
+# (open them with `python -m pstats <file>` or snakeviz)
+# - cProfile only sees the thread it runs in: under ASGI that is the event loop, so the work done in
+#   sync_to_async threads is missing & other requests running on the loop at the same time are included
+# - only one request is profiled at a time in each process
+# https://docs.python.org/3/library/profile.html
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    # held while a request is profiled
+    profile_lock = threading.Lock()
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        timings, token = start_request()
+        profiler = self.start_profiler()
+        start = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, perf_counter() - start, timings, profiler)
+
+    async def __acall__(self, request):
+        timings, token = start_request()
+        profiler = self.start_profiler()
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, perf_counter() - start, timings, profiler)
+
+    # start profiling a sample of the requests, returns the profiler or None
+    def start_profiler(self):
+        rate = settings.METRICS_PROFILE_RATE
+        if not rate or random.random() >= rate or not self.profile_lock.acquire(blocking=False):
+            return None
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    # record the request & save the profile of a slow one
+    def finish(self, request, response, elapsed, timings, profiler):
+        if profiler is not None:
+            profiler.disable()
+            self.profile_lock.release()
+            if elapsed * 1000 >= settings.METRICS_PROFILE_SLOW_MS:
+                self.save_profile(request, profiler, elapsed)
+
+        record_request(request, response, elapsed, timings)
+        return response
+
+    # save a profile as <time>-<endpoint>-<action>-<ms>ms-<pid>.prof
+    def save_profile(self, request, profiler, elapsed):
+        endpoint, action = get_request_labels(request)
+        name = re.sub(r'[^\w.-]+', '_', f'{endpoint}-{action or request.method.lower()}')
+        os.makedirs(settings.METRICS_PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(
+            os.path.join(settings.METRICS_PROFILE_DIR, f'{strftime("%Y%m%d-%H%M%S")}-{name}-{elapsed * 1000:.0f}ms-{os.getpid()}.prof')
+        )
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibraryAPI', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author', 'published_date'], name='book_author_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['genre', 'published_date'], name='book_genre_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['availability', 'published_date'], name='book_available_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['published_date'], name='book_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['created_at'], name='book_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.UniqueConstraint(fields=('title', 'author'), name='unique_book_title_author'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# create the SQLite FTS5 search table for Book & index the existing books
+# - the SQL is frozen here, so changing LibraryAPI/search.py later does not change what this migration does
+# https://docs.djangoproject.com/en/5.1/ref/migration-operations/#runsql
+
+from django.db import migrations
+
+CREATE_SEARCH_TABLE = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS "LibraryAPI_book_search" USING fts5(
+    title, author, summary,
+    content='LibraryAPI_book', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+)
+'''
+
+# also created again by 0004, whose new column rebuilds the Book table & drops its triggers
+CREATE_SEARCH_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS "LibraryAPI_book_search_insert" AFTER INSERT ON "LibraryAPI_book" BEGIN
+        INSERT INTO "LibraryAPI_book_search" (rowid, title, author, summary) VALUES (new.id, new.title, new.author, new.summary);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS "LibraryAPI_book_search_delete" AFTER DELETE ON "LibraryAPI_book" BEGIN
+        INSERT INTO "LibraryAPI_book_search" ("LibraryAPI_book_search", rowid, title, author, summary)
+        VALUES ('delete', old.id, old.title, old.author, old.summary);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS "LibraryAPI_book_search_update" AFTER UPDATE OF title, author, summary ON "LibraryAPI_book" BEGIN
+        INSERT INTO "LibraryAPI_book_search" ("LibraryAPI_book_search", rowid, title, author, summary)
+        VALUES ('delete', old.id, old.title, old.author, old.summary);
+        INSERT INTO "LibraryAPI_book_search" (rowid, title, author, summary) VALUES (new.id, new.title, new.author, new.summary);
+    END
+    ''',
+]
+
+# index the books that already exist
+# https://www.sqlite.org/fts5.html#the_rebuild_command
+INDEX_EXISTING_BOOKS = 'INSERT INTO "LibraryAPI_book_search" ("LibraryAPI_book_search") VALUES (\'rebuild\')'
+
+DROP_SEARCH = [
+    'DROP TRIGGER IF EXISTS "LibraryAPI_book_search_insert"',
+    'DROP TRIGGER IF EXISTS "LibraryAPI_book_search_delete"',
+    'DROP TRIGGER IF EXISTS "LibraryAPI_book_search_update"',
+    'DROP TABLE IF EXISTS "LibraryAPI_book_search"',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibraryAPI', '0002_book_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL([CREATE_SEARCH_TABLE, *CREATE_SEARCH_TRIGGERS, INDEX_EXISTING_BOOKS], DROP_SEARCH),
+    ]
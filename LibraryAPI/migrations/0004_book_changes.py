@@ -0,0 +1,94 @@
+# add the time of the last change to each book & the BookChange table of the change feed
+# - the SQL is frozen here, so changing LibraryAPI/changes.py later does not change what this migration does
+# https://docs.djangoproject.com/en/5.1/ref/migration-operations/#runsql
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+# the existing books were last changed when they were created, as far as anyone knows
+def copy_created_at(apps, schema_editor):
+    Book = apps.get_model('LibraryAPI', 'Book')
+    Book.objects.using(schema_editor.connection.alias).update(updated_at=F('created_at'))
+
+
+# adding updated_at rebuilds the Book table, which drops the search triggers of 0003, so create them again
+CREATE_SEARCH_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS "LibraryAPI_book_search_insert" AFTER INSERT ON "LibraryAPI_book" BEGIN
+        INSERT INTO "LibraryAPI_book_search" (rowid, title, author, summary) VALUES (new.id, new.title, new.author, new.summary);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS "LibraryAPI_book_search_delete" AFTER DELETE ON "LibraryAPI_book" BEGIN
+        INSERT INTO "LibraryAPI_book_search" ("LibraryAPI_book_search", rowid, title, author, summary)
+        VALUES ('delete', old.id, old.title, old.author, old.summary);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS "LibraryAPI_book_search_update" AFTER UPDATE OF title, author, summary ON "LibraryAPI_book" BEGIN
+        INSERT INTO "LibraryAPI_book_search" ("LibraryAPI_book_search", rowid, title, author, summary)
+        VALUES ('delete', old.id, old.title, old.author, old.summary);
+        INSERT INTO "LibraryAPI_book_search" (rowid, title, author, summary) VALUES (new.id, new.title, new.author, new.summary);
+    END
+    ''',
+]
+
+# REPLACE deletes the book's previous row (book_id is unique) & inserts one with the next revision
+CREATE_CHANGE_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS "LibraryAPI_bookchange_insert" AFTER INSERT ON "LibraryAPI_book" BEGIN
+        INSERT OR REPLACE INTO "LibraryAPI_bookchange" (book_id, deleted_at) VALUES (new.id, NULL);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS "LibraryAPI_bookchange_update" AFTER UPDATE ON "LibraryAPI_book" BEGIN
+        INSERT OR REPLACE INTO "LibraryAPI_bookchange" (book_id, deleted_at) SELECT old.id, strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE old.id != new.id;
+        INSERT OR REPLACE INTO "LibraryAPI_bookchange" (book_id, deleted_at) VALUES (new.id, NULL);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS "LibraryAPI_bookchange_delete" AFTER DELETE ON "LibraryAPI_book" BEGIN
+        INSERT OR REPLACE INTO "LibraryAPI_bookchange" (book_id, deleted_at) VALUES (old.id, strftime('%Y-%m-%d %H:%M:%f', 'now'));
+    END
+    ''',
+]
+
+# give every existing book a revision, in id order
+RECORD_EXISTING_BOOKS = (
+    'INSERT INTO "LibraryAPI_bookchange" (book_id) SELECT id FROM "LibraryAPI_book" '
+    'WHERE id NOT IN (SELECT book_id FROM "LibraryAPI_bookchange") ORDER BY id'
+)
+
+DROP_CHANGE_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS "LibraryAPI_bookchange_insert"',
+    'DROP TRIGGER IF EXISTS "LibraryAPI_bookchange_update"',
+    'DROP TRIGGER IF EXISTS "LibraryAPI_bookchange_delete"',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibraryAPI', '0003_book_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunSQL(CREATE_SEARCH_TRIGGERS, migrations.RunSQL.noop),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='BookChange',
+            fields=[
+                ('revision', models.AutoField(primary_key=True, serialize=False)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('book', models.OneToOneField(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='LibraryAPI.book')),
+            ],
+        ),
+        migrations.RunSQL([*CREATE_CHANGE_TRIGGERS, RECORD_EXISTING_BOOKS], DROP_CHANGE_TRIGGERS),
+    ]
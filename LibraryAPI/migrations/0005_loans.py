@@ -0,0 +1,27 @@
+# Generated by Django 5.1.5 on 2026-10-18 20:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibraryAPI', '0004_book_changes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Loan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('borrower', models.CharField(blank=True, max_length=100)),
+                ('checked_out_at', models.DateTimeField()),
+                ('returned_at', models.DateTimeField(blank=True, null=True)),
+                ('book', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='loans', to='LibraryAPI.book')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('returned_at__isnull', True)), fields=('book',), name='one_open_loan_per_book')],
+            },
+        ),
+    ]
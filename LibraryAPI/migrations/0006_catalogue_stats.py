@@ -0,0 +1,93 @@
+# add the CatalogueStat table of the catalogue statistics & the triggers that keep it up to date
+# - the SQL is frozen here, so changing LibraryAPI/stats.py later does not change what this migration does
+# https://docs.djangoproject.com/en/5.1/ref/migration-operations/#runsql
+
+from django.db import migrations, models
+
+# add (+) or take away (-) a book from its total, genre, author & year rows, & remove the groups left empty
+# (see LibraryAPI/stats.py)
+ADD_NEW_BOOK = '''
+        INSERT INTO "LibraryAPI_cataloguestat" (dimension, value, books, available) VALUES
+            ('total', '', +1, +new.availability), ('genre', new.genre, +1, +new.availability),
+            ('author', new.author, +1, +new.availability), ('year', substr(new.published_date, 1, 4), +1, +new.availability)
+        ON CONFLICT (dimension, value) DO UPDATE SET books = books + excluded.books, available = available + excluded.available;
+'''
+
+TAKE_AWAY_OLD_BOOK = '''
+        INSERT INTO "LibraryAPI_cataloguestat" (dimension, value, books, available) VALUES
+            ('total', '', -1, -old.availability), ('genre', old.genre, -1, -old.availability),
+            ('author', old.author, -1, -old.availability), ('year', substr(old.published_date, 1, 4), -1, -old.availability)
+        ON CONFLICT (dimension, value) DO UPDATE SET books = books + excluded.books, available = available + excluded.available;
+'''
+
+REMOVE_EMPTY_GROUPS = '''
+        DELETE FROM "LibraryAPI_cataloguestat" WHERE dimension = 'genre' AND value = old.genre AND books = 0;
+        DELETE FROM "LibraryAPI_cataloguestat" WHERE dimension = 'author' AND value = old.author AND books = 0;
+        DELETE FROM "LibraryAPI_cataloguestat" WHERE dimension = 'year' AND value = substr(old.published_date, 1, 4) AND books = 0;
+'''
+
+CREATE_STATS_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS "LibraryAPI_cataloguestat_insert" AFTER INSERT ON "LibraryAPI_book" BEGIN
+        {ADD_NEW_BOOK}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS "LibraryAPI_cataloguestat_update" AFTER UPDATE OF genre, author, published_date, availability ON "LibraryAPI_book"
+    WHEN old.genre IS NOT new.genre OR old.author IS NOT new.author OR old.published_date IS NOT new.published_date
+        OR old.availability IS NOT new.availability BEGIN
+        {TAKE_AWAY_OLD_BOOK}
+        {ADD_NEW_BOOK}
+        {REMOVE_EMPTY_GROUPS}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS "LibraryAPI_cataloguestat_delete" AFTER DELETE ON "LibraryAPI_book" BEGIN
+        {TAKE_AWAY_OLD_BOOK}
+        {REMOVE_EMPTY_GROUPS}
+    END
+    ''',
+]
+
+# count the books that already exist
+COUNT_EXISTING_BOOKS = [
+    '''INSERT INTO "LibraryAPI_cataloguestat" (dimension, value, books, available)
+    SELECT 'total', '', count(*), coalesce(sum(availability), 0) FROM "LibraryAPI_book"''',
+    '''INSERT INTO "LibraryAPI_cataloguestat" (dimension, value, books, available)
+    SELECT 'genre', genre, count(*), sum(availability) FROM "LibraryAPI_book" GROUP BY genre''',
+    '''INSERT INTO "LibraryAPI_cataloguestat" (dimension, value, books, available)
+    SELECT 'author', author, count(*), sum(availability) FROM "LibraryAPI_book" GROUP BY author''',
+    '''INSERT INTO "LibraryAPI_cataloguestat" (dimension, value, books, available)
+    SELECT 'year', substr(published_date, 1, 4), count(*), sum(availability) FROM "LibraryAPI_book"
+    GROUP BY substr(published_date, 1, 4)''',
+]
+
+DROP_STATS_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS "LibraryAPI_cataloguestat_insert"',
+    'DROP TRIGGER IF EXISTS "LibraryAPI_cataloguestat_update"',
+    'DROP TRIGGER IF EXISTS "LibraryAPI_cataloguestat_delete"',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibraryAPI', '0005_loans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(max_length=10)),
+                ('value', models.CharField(blank=True, max_length=100)),
+                ('books', models.IntegerField(default=0)),
+                ('available', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'value'), name='one_stat_per_group')],
+            },
+        ),
+        migrations.RunSQL([*CREATE_STATS_TRIGGERS, *COUNT_EXISTING_BOOKS], DROP_STATS_TRIGGERS),
+    ]
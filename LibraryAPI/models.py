@@ -14,9 +14,90 @@ class Book(models.Model):
     summary = models.TextField()
     # save the time each time a book updates, not just when it was created
     created_at = models.DateTimeField(auto_now_add=True)
+    # save the time of the last change to the book (sent as Last-Modified by the API)
+    # - set by save() & the bulk endpoint, QuerySet.update() & raw SQL must set it themselves
+    updated_at = models.DateTimeField(auto_now=True)
     # if the book is available use bool
     availability = models.BooleanField(default=True)
 
+    # add indexes for the queries the API runs most
+    # https://docs.djangoproject.com/en/5.1/ref/models/options/#constraints
+    # https://docs.djangoproject.com/en/5.1/ref/models/indexes/
+    class Meta:
+        # make the author & title combination unique in the database
+        # - its index turns the serializer's uniqueness check into an index lookup instead of a full table scan
+        constraints = [
+            models.UniqueConstraint(fields=['title', 'author'], name='unique_book_title_author'),
+        ]
+
+        # index the filter & sort combinations used by the list
+        # - each filter column is followed by published_date so filtering & sorting by date use the same index
+        indexes = [
+            models.Index(fields=['author', 'published_date'], name='book_author_published_idx'),
+            models.Index(fields=['genre', 'published_date'], name='book_genre_published_idx'),
+            models.Index(fields=['availability', 'published_date'], name='book_available_published_idx'),
+            models.Index(fields=['published_date'], name='book_published_idx'),
+            models.Index(fields=['created_at'], name='book_created_idx'),
+        ]
+
     # return the title
     def __str__(self):
         return self.title
+
+
+# create a model for the latest change of each book, read by the /books/changes/ feed (see changes.py)
+# - SQLite triggers write it on every insert, update & delete of a book, including bulk_create, bulk_update,
+#   QuerySet.update() & raw SQL, so there is no write path that can forget it
+# - the revision orders the changes: it is an AUTOINCREMENT key assigned inside the write transaction,
+#   so it grows in commit order & is never reused, unlike a timestamp taken before waiting for the write lock
+# - each book has a single row, replaced with a new revision on every change
+# - a deleted book keeps its row as a tombstone, with the time it was deleted
+class BookChange(models.Model):
+    revision = models.AutoField(primary_key=True)
+    # the book may no longer exist, so there is no foreign key constraint (the join is still used to read it)
+    book = models.OneToOneField(Book, null=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.book_id} {'deleted' if self.deleted_at else 'changed'} at revision {self.revision}"
+
+
+# create a model for the loans of the books, written by the checkout & return actions (see loans.py)
+# - a loan is open until the book is returned
+# - a book has at most one open loan: the partial unique index rejects a second one even if the
+#   conditional UPDATE of the checkout were bypassed, & finds the open loan of a returned book
+# - the history is kept when a book is deleted, so there is no foreign key constraint
+class Loan(models.Model):
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, related_name='loans')
+    borrower = models.CharField(max_length=100, blank=True)
+    checked_out_at = models.DateTimeField()
+    returned_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book'], condition=models.Q(returned_at__isnull=True),
+                                    name='one_open_loan_per_book'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} {'returned' if self.returned_at else 'checked out'} ({self.checked_out_at:%Y-%m-%d})"
+
+
+# create a model for the catalogue statistics served at /books/stats/ (see stats.py)
+# - one row per group of books: the number of books & of available books of a genre, an author or a publication year,
+#   & a 'total' row for the whole catalogue
+# - SQLite triggers update the groups of a book on every insert, update & delete (like BookChange), so the
+#   statistics are read from one row per group instead of counting every book
+class CatalogueStat(models.Model):
+    dimension = models.CharField(max_length=10)
+    value = models.CharField(max_length=100, blank=True)
+    books = models.IntegerField(default=0)
+    available = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'value'], name='one_stat_per_group'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension} {self.value}: {self.books} books, {self.available} available"
@@ -0,0 +1,184 @@
+# import json to store the position of the last book in the cursor
+import json
+
+# import Q to build the "after this book" condition
+from django.db.models import Q
+
+# import CursorPagination for keyset (seek) pagination
+# https://www.django-rest-framework.org/api-guide/pagination/#cursorpagination
+from rest_framework.pagination import CursorPagination, Cursor
+
+# import NotFound for cursors that cannot be read
+from rest_framework.exceptions import NotFound
+
+# import the error raised by model fields for values they cannot read
+from django.core.exceptions import ValidationError, EmptyResultSet
+
+# import hashlib to shorten the cache keys of the counts
+import hashlib
+
+# import django's paginator & cached_property for the admin's page numbers
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+# import cache (the shared SQLite cache configured in settings)
+from django.core.cache import cache
+
+#########################################################################################################
+
+# define a keyset pagination class for the book list
+# - each page is fetched with WHERE (sort key, id) > (last sort key, last id) ORDER BY sort key, id LIMIT page_size + 1
+# - unlike page numbers there is no OFFSET or COUNT(*), so every page costs the same however big the table gets
+# DRF's CursorPagination only keys on the first ordering field & skips ties with an offset (capped at 1000),
+# which breaks when many books share a published_date, so the id is always added as a tie breaker instead
+class BookCursorPagination(CursorPagination):
+    # order on the primary key by default: it is unique, indexed & increases with created_at
+    ordering = ('id',)
+
+    # let clients choose a page size with ?page_size=, but cap it so a single page stays small
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        return self.set_page(list(queryset))
+
+    # the same for the async views, fetching the page with async iteration
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        return self.set_page([row async for row in queryset])
+
+    # return the query for the requested page
+    def get_page_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+
+        # sort on the requested key, then on the id in the same direction
+        order = self.get_ordering(request, queryset, view)[0]
+        self.model_field = queryset.model._meta.get_field(order.lstrip('-'))
+        self.field = order.lstrip('-')
+        self.descending = order.startswith('-')
+
+        self.cursor = self.decode_cursor(request)
+        self.reverse = self.cursor is not None and self.cursor.reverse
+
+        # fetch the page (backwards from the cursor when going to the previous page)
+        queryset = queryset.order_by(*self.get_order_by(self.reverse))
+        if self.cursor is not None:
+            queryset = queryset.filter(self.get_after_condition(self.cursor.position, self.reverse))
+
+        # fetch 1 extra book to find out if there is another page
+        return queryset[:self.page_size + 1]
+
+    # keep the page from the fetched books & work out which links to show
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if self.reverse:
+            # the books were fetched backwards, so put them back in order
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        # display page controls in the browsable API if there is more than one page
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    # return the order_by arguments, flipped when fetching backwards
+    def get_order_by(self, reverse=False):
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        if self.field == 'id':
+            return (f'{prefix}id',)
+        return (f'{prefix}{self.field}', f'{prefix}id')
+
+    # return the condition that selects the books after `position` in the (possibly flipped) sort order
+    # - written as "key >= value AND (key > value OR id > last id)" rather than "key > value OR (key = value AND id > last id)"
+    #   because SQLite can only seek the index to the start of the page with the first form
+    def get_after_condition(self, position, reverse=False):
+        value, book_id = position
+        lookup = 'lt' if self.descending != reverse else 'gt'
+        if self.field == 'id':
+            return Q(**{f'id__{lookup}': book_id})
+        return Q(**{f'{self.field}__{lookup}e': value}) & (
+            Q(**{f'{self.field}__{lookup}': value}) | Q(**{f'id__{lookup}': book_id})
+        )
+
+    # return the (sort key, id) position of a book
+    def get_position(self, instance):
+        value = instance[self.field] if isinstance(instance, dict) else getattr(instance, self.field)
+        book_id = instance['id'] if isinstance(instance, dict) else instance.id
+        return (str(value), book_id)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=json.dumps(self.get_position(self.page[-1]))))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=json.dumps(self.get_position(self.page[0]))))
+
+    # read the cursor & check its position is a [sort key, id] pair
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return None
+
+        try:
+            value, book_id = json.loads(cursor.position)
+            position = (self.model_field.to_python(value), int(book_id))
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=cursor.reverse, position=position)
+
+    # check if the client asked for a page beyond the first one
+    def has_cursor(self):
+        return getattr(self, 'cursor', None) is not None
+
+    # return the next & previous links to embed in the response envelope
+    def get_links(self):
+        return {
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+        }
+
+
+# define a page number paginator for the admin's book list, which cannot use a cursor because it links to page numbers
+# - the number of books (with the filters & search applied) is cached for count_timeout seconds, so loading a page
+#   does not run COUNT(*) over the whole table every time (the count can be that many seconds out of date)
+# - a page first reads the ids of its rows from the index of the sort order, then fetches only those rows
+#   (a deferred join), so the OFFSET skips index entries rather than whole rows, & the filters run once
+# https://docs.djangoproject.com/en/5.1/ref/paginator/
+class CachedCountPaginator(Paginator):
+    count_timeout = 60
+
+    @cached_property
+    def count(self):
+        try:
+            query = str(self.object_list.query)
+        except EmptyResultSet:
+            return 0
+        key = f'paginator_count_{hashlib.md5(query.encode("utf-8"), usedforsecurity=False).hexdigest()}'
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, self.count_timeout)
+        return count
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        ids = self.object_list.values('pk')[bottom:bottom + self.per_page]
+        # the filters (e.g. a search) are applied by the subquery, so the rows are only looked up by id
+        rows = self.object_list.all()
+        rows.query.clear_where()
+        return self._get_page(rows.filter(pk__in=ids), number, self)
@@ -0,0 +1,31 @@
+# import json to decode each line
+import json
+
+# import DRF's parser base class & the error raised for malformed bodies
+# https://www.django-rest-framework.org/api-guide/parsers/#custom-parsers
+from rest_framework.parsers import BaseParser
+from rest_framework.exceptions import ParseError
+
+#########################################################################################################
+
+# define a parser for newline delimited JSON (one JSON value per line)
+# - used by the bulk & import endpoints so large batches can be sent without wrapping them in one JSON array
+# - blank lines are skipped
+class NDJSONParser(BaseParser):
+    media_type = 'application/x-ndjson'
+
+    # return the lines of the request body as a list of python objects
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8')
+
+        items = []
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line.decode(encoding)))
+            except ValueError as exc:
+                raise ParseError(f"NDJSON parse error on line {number} - {exc}")
+        return items
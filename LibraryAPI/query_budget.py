@@ -0,0 +1,114 @@
+# import functools to keep the wrapped action's name
+import functools
+
+# import logging to report the actions that go over their budget
+import logging
+
+# import ContextVar to count the queries of the current action (works in threads & async tasks)
+from contextvars import ContextVar
+
+# import iscoroutinefunction to tell async actions apart
+from asgiref.sync import iscoroutinefunction
+
+# import settings to read the mode
+from django.conf import settings
+
+#########################################################################################################
+
+# query budgets: the most queries an action may run, e.g. 1 for a list page
+# - decorate an action with @query_budget(1), or wrap a block of code in `with query_budget(1, 'name'):`
+# - settings.QUERY_BUDGET_MODE chooses what happens when an action runs more queries than its budget:
+#   'log' (the default with DEBUG) logs a warning with the queries, 'raise' raises QueryBudgetExceeded
+#   (the default for `manage.py test`), 'off' does not count the queries
+# - the queries are counted by a connection execute wrapper, so those run in sync_to_async threads count too
+# - rows read by a streamed response after the action returns are not counted
+# - check every budget with `python manage.py check_query_budgets`
+# https://docs.djangoproject.com/en/5.1/topics/db/instrumentation/
+
+logger = logging.getLogger(__name__)
+
+# the budget of the code running now, or None
+current_budget = ContextVar('current_budget', default=None)
+
+
+# raised in 'raise' mode when an action runs more queries than its budget
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+# define the budget of an action & the queries it ran
+class QueryBudget:
+    def __init__(self, limit, name):
+        self.limit = limit
+        self.name = name
+        self.queries = []
+
+    # report the queries if there are more than the budget allows
+    def check(self, mode):
+        if len(self.queries) <= self.limit:
+            return
+        message = (f"{self.name} ran {len(self.queries)} queries, its budget is {self.limit}:\n"
+                   + '\n'.join(f'  {sql}' for sql in self.queries))
+        if mode == 'raise':
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+# count a query in the current budget
+# installed on each database connection by install_budget_counter()
+def count_query(execute, sql, params, many, context):
+    budget = current_budget.get()
+    if budget is not None:
+        budget.queries.append(sql)
+    return execute(sql, params, many, context)
+
+
+# add count_query to a new database connection (connected to the connection_created signal in apps.py)
+# https://docs.djangoproject.com/en/5.1/ref/signals/#connection-created
+def install_budget_counter(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+# limit the queries of a block of code or of a (sync or async) view action
+# - a budget inside another one also counts its queries in the outer budget
+class query_budget:
+    def __init__(self, limit, name=None):
+        self.limit = limit
+        self.name = name
+
+    def __enter__(self):
+        self.mode = settings.QUERY_BUDGET_MODE
+        if self.mode == 'off':
+            return None
+        self.parent = current_budget.get()
+        self.budget = QueryBudget(self.limit, self.name)
+        self.token = current_budget.set(self.budget)
+        return self.budget
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.mode == 'off':
+            return
+        current_budget.reset(self.token)
+        if self.parent is not None:
+            self.parent.queries.extend(self.budget.queries)
+        # an action that failed already reports its own error
+        if exc_type is None:
+            self.budget.check(self.mode)
+
+    # use the budget as a decorator of a view action, named after the view & the action
+    def __call__(self, action):
+        limit = self.limit
+
+        if iscoroutinefunction(action):
+            @functools.wraps(action)
+            async def async_wrapper(view, *args, **kwargs):
+                with query_budget(limit, f'{type(view).__name__}.{action.__name__}'):
+                    return await action(view, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(action)
+        def wrapper(view, *args, **kwargs):
+            with query_budget(limit, f'{type(view).__name__}.{action.__name__}'):
+                return action(view, *args, **kwargs)
+        return wrapper
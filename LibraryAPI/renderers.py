@@ -0,0 +1,138 @@
+# import csv & io to write CSV
+import csv
+import io
+
+# import json to encode NDJSON
+import json
+
+# import Decimal, which DRF's encoder writes as a float
+from decimal import Decimal
+
+# import orjson to encode the API's JSON responses faster, if it is installed (pip install orjson)
+# https://github.com/ijl/orjson
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# import DRF's renderer base classes & encoder
+# https://www.django-rest-framework.org/api-guide/renderers/#custom-renderers
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# import DRF's separators of compact JSON
+from rest_framework.compat import SHORT_SEPARATORS
+
+#########################################################################################################
+
+# the JSON renderer of the API's envelopes (DEFAULT_RENDERER_CLASSES in settings.py)
+# DRF's JSONRenderer builds a new encoder for every response, encodes the envelope to a str,
+# escapes U+2028 & U+2029 in it & then copies it into bytes
+# - with orjson, the envelope is encoded straight to bytes in a single call (about 3x faster for a page of books),
+#   dates, times & anything else orjson does not know are still formatted by DRF's JSONEncoder.default
+# - without it, a single encoder is shared by every response
+# the output is the same bytes as JSONRenderer's:
+# - values orjson cannot encode like DRF (integers over 64 bits, dict keys that are not strings) use the encoder
+# - orjson writes floats differently (e.g. 1e-5 & 0.00001 where DRF writes 1e-05), so responses with floats use the
+#   encoder: the API's floats (the rank of the search results) are JSONFloats, which orjson does not encode itself,
+#   & so are decimals. Looking for plain floats in every response would cost more than orjson saves
+# - indented responses (e.g. Accept: application/json; indent=4 or the browsable API) are rendered by JSONRenderer
+# check it & compare the speed with `python manage.py bench_renderer`
+ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS) if orjson else 0
+
+
+# a float of a response, written by the standard library encoder like JSONRenderer does (see EnvelopeJSONRenderer)
+# - orjson does not encode subclasses of float, it passes them to its default function
+class JSONFloat(float):
+    __slots__ = ()
+
+
+class EnvelopeJSONRenderer(JSONRenderer):
+    # orjson writes the compact, unicode & strict JSON of DRF's default settings
+    use_orjson = orjson is not None and not JSONRenderer.ensure_ascii and JSONRenderer.strict
+
+    # DRF creates a renderer for every request, so the encoder is shared by all of them (it keeps no state)
+    shared_encoder = JSONRenderer.encoder_class(
+        ensure_ascii=JSONRenderer.ensure_ascii,
+        allow_nan=not JSONRenderer.strict,
+        separators=SHORT_SEPARATORS,
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.is_indented(accepted_media_type, renderer_context or {}) or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if self.use_orjson:
+            try:
+                content = orjson.dumps(data, default=self.orjson_default, option=ORJSON_OPTIONS)
+            except orjson.JSONEncodeError:
+                pass
+            else:
+                # escape the line & paragraph separators like DRF, as javascript does not allow them in strings
+                # (looking for them first, as they are rare & bytes.replace() is slower than the search)
+                if b'\xe2\x80\xa8' in content:
+                    content = content.replace(b'\xe2\x80\xa8', b'\\u2028')
+                if b'\xe2\x80\xa9' in content:
+                    content = content.replace(b'\xe2\x80\xa9', b'\\u2029')
+                return content
+
+        content = self.shared_encoder.encode(data).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return content.encode()
+
+    # format the values orjson does not know with DRF's encoder, except floats & decimals (DRF writes decimals as
+    # floats): the whole response is then rendered by the encoder
+    @classmethod
+    def orjson_default(cls, value):
+        if isinstance(value, (float, Decimal)):
+            raise TypeError(f"{type(value).__name__} is rendered by the standard library encoder")
+        return cls.shared_encoder.default(value)
+
+    # return True if the response should be indented
+    # - only parse the media type when it has parameters, the indent is one of them (e.g. application/json; indent=4)
+    def is_indented(self, accepted_media_type, renderer_context):
+        if accepted_media_type and ';' in accepted_media_type:
+            return self.get_indent(accepted_media_type, renderer_context) is not None
+        return renderer_context.get('indent') is not None
+
+
+# the renderers of the /books/export/ endpoint
+# - they pick the export format from the Accept header or ?format=ndjson / ?format=csv
+# - the books themselves are streamed by the view, so these only render the envelopes of errors (e.g. 429)
+
+
+# define a renderer for newline delimited JSON: the envelope on a single line
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        line = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+        return (line + '\n').encode(self.charset)
+
+
+# define a renderer for CSV: the keys of the envelope as a header line & its values as a value line
+# - nested values (e.g. the errors of each field) are written as JSON
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, dict):
+            data = {"data": data}
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(data.keys())
+        writer.writerow([
+            json.dumps(value, cls=JSONEncoder, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+            for value in data.values()
+        ])
+        return buffer.getvalue().encode(self.charset)
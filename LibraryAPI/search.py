@@ -0,0 +1,200 @@
+# import html to escape the highlighted text
+import html
+
+# import re to split the search text into words
+import re
+
+# import connection to run the full text search SQL
+from django.db import connection, connections
+
+# import Q & RawSQL to filter querysets with the search table
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# import the errors the ORM raises for a WHERE clause that matches every row or none
+from django.core.exceptions import EmptyResultSet, FullResultSet
+
+# import models
+from .models import Book
+
+# import the float the JSON renderer writes like DRF
+from .renderers import JSONFloat
+
+#########################################################################################################
+
+# full text search over the title, author & summary of each book with SQLite FTS5
+# - the search table is an "external content" table: it only stores the index, the text stays in LibraryAPI_book
+# - triggers keep it in sync with every insert, update & delete, including bulk_create/bulk_update & raw SQL,
+#   which do not send django signals
+# https://www.sqlite.org/fts5.html#external_content_tables
+
+BOOK_TABLE = Book._meta.db_table
+SEARCH_TABLE = f'{BOOK_TABLE}_search'
+
+# weight of each column when ranking results with bm25: a match in the title counts most
+RANK_WEIGHTS = (10.0, 5.0, 1.0)
+
+# marks wrapped around the matched words in the highlighted text
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+
+# the marks SQLite writes around the matched words (characters of Unicode's private use area): the stored text
+# is HTML escaped before they are replaced with the <mark> tags, so a book's text is never returned as HTML
+MATCH_START = '\ue000'
+MATCH_END = '\ue001'
+
+CREATE_SEARCH_TABLE = f'''
+CREATE VIRTUAL TABLE IF NOT EXISTS "{SEARCH_TABLE}" USING fts5(
+    title, author, summary,
+    content='{BOOK_TABLE}', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+)
+'''
+
+# only re-index a book when a searchable column changes, not when e.g. availability flips
+CREATE_SEARCH_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS "{SEARCH_TABLE}_insert" AFTER INSERT ON "{BOOK_TABLE}" BEGIN
+        INSERT INTO "{SEARCH_TABLE}" (rowid, title, author, summary) VALUES (new.id, new.title, new.author, new.summary);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS "{SEARCH_TABLE}_delete" AFTER DELETE ON "{BOOK_TABLE}" BEGIN
+        INSERT INTO "{SEARCH_TABLE}" ("{SEARCH_TABLE}", rowid, title, author, summary)
+        VALUES ('delete', old.id, old.title, old.author, old.summary);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS "{SEARCH_TABLE}_update" AFTER UPDATE OF title, author, summary ON "{BOOK_TABLE}" BEGIN
+        INSERT INTO "{SEARCH_TABLE}" ("{SEARCH_TABLE}", rowid, title, author, summary)
+        VALUES ('delete', old.id, old.title, old.author, old.summary);
+        INSERT INTO "{SEARCH_TABLE}" (rowid, title, author, summary) VALUES (new.id, new.title, new.author, new.summary);
+    END
+    ''',
+]
+
+DROP_SEARCH = [
+    f'DROP TRIGGER IF EXISTS "{SEARCH_TABLE}_insert"',
+    f'DROP TRIGGER IF EXISTS "{SEARCH_TABLE}_delete"',
+    f'DROP TRIGGER IF EXISTS "{SEARCH_TABLE}_update"',
+    f'DROP TABLE IF EXISTS "{SEARCH_TABLE}"',
+]
+
+
+# check if full text search can be used on a database connection
+def search_supported(using_connection=connection):
+    return using_connection.vendor == 'sqlite'
+
+
+# create the search table & triggers if they do not exist
+# - the 0003 migration keeps a frozen copy of this SQL: changing it here needs a new migration,
+#   & migrations that rebuild the Book table (SQLite drops its triggers) must create the triggers again
+def create_search_index(using_connection=connection):
+    if not search_supported(using_connection):
+        return
+    with using_connection.cursor() as cursor:
+        cursor.execute(CREATE_SEARCH_TABLE)
+        for statement in CREATE_SEARCH_TRIGGERS:
+            cursor.execute(statement)
+
+
+# drop & recreate the search table, then re-index every book
+def rebuild_search_index(using_connection=connection):
+    if not search_supported(using_connection):
+        return
+    with using_connection.cursor() as cursor:
+        for statement in DROP_SEARCH:
+            cursor.execute(statement)
+    create_search_index(using_connection)
+    with using_connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO "{SEARCH_TABLE}" ("{SEARCH_TABLE}") VALUES (\'rebuild\')')
+
+
+# turn the user's text into a safe FTS5 query
+# - every word must match & the last word matches as a prefix, so results appear while the user is typing
+# - quoting each word stops characters like " * : ( ) from being read as FTS5 syntax
+def build_match_query(text):
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+# return up to `limit` books matching `text`, best match first
+# - only the books of `queryset` are returned (all of them by default), so the list's filters apply to a search:
+#   its WHERE clause is compiled by the ORM & added to the search query
+# each book has extra attributes:
+# - rank: the bm25 score (lower is a better match)
+# - title_highlight, author_highlight & summary_snippet: the matched text wrapped in MATCH_START & MATCH_END
+#   (see get_search_details)
+def search_books(text, limit, offset=0, queryset=None):
+    queryset = Book.objects.all() if queryset is None else queryset
+    match = build_match_query(text)
+    if match is None:
+        return []
+
+    # fall back to a (slow) case insensitive scan on databases without FTS5
+    if not search_supported(connections[queryset.db]):
+        queryset = queryset.filter(Q(title__icontains=text) | Q(author__icontains=text))
+        return list(queryset.order_by('id')[offset:offset + limit])
+
+    try:
+        where, where_params = queryset.query.get_compiler(using=queryset.db).compile(queryset.query.where)
+    except FullResultSet:
+        where, where_params = '', []
+    except EmptyResultSet:
+        return []
+
+    columns = ', '.join(f'"{BOOK_TABLE}"."{field.column}"' for field in Book._meta.concrete_fields)
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    sql = f'''
+        SELECT {columns},
+            bm25("{SEARCH_TABLE}", {weights}) AS rank,
+            highlight("{SEARCH_TABLE}", 0, %s, %s) AS title_highlight,
+            highlight("{SEARCH_TABLE}", 1, %s, %s) AS author_highlight,
+            snippet("{SEARCH_TABLE}", 2, %s, %s, '…', 24) AS summary_snippet
+        FROM "{SEARCH_TABLE}"
+        JOIN "{BOOK_TABLE}" ON "{BOOK_TABLE}".id = "{SEARCH_TABLE}".rowid
+        WHERE "{SEARCH_TABLE}" MATCH %s {f'AND ({where})' if where else ''}
+        ORDER BY rank
+        LIMIT %s OFFSET %s
+    '''
+    marks = [MATCH_START, MATCH_END]
+    return list(Book.objects.db_manager(queryset.db).raw(sql, marks * 3 + [match, *where_params, limit, offset]))
+
+
+# filter a queryset of books down to those matching `text` in some `columns` of the search table (all by default),
+# in any order (used by the admin's search box)
+# - the matching ids come from the search table in a subquery, so the filter does not scan the book table
+# https://www.sqlite.org/fts5.html#fts5_column_filters
+def filter_matching_books(queryset, text, columns=None):
+    match = build_match_query(text)
+    if match is None:
+        return queryset
+    if not search_supported(connections[queryset.db]):
+        return queryset.filter(Q(title__icontains=text) | Q(author__icontains=text))
+    if columns:
+        match = f'{{{" ".join(columns)}}} : ({match})'
+    return queryset.filter(id__in=RawSQL(f'SELECT rowid FROM "{SEARCH_TABLE}" WHERE "{SEARCH_TABLE}" MATCH %s', [match]))
+
+
+# return the text of a book with its matched words wrapped in <mark> tags & everything else HTML escaped
+def highlight(text):
+    if text is None:
+        return None
+    return html.escape(text).replace(MATCH_START, HIGHLIGHT_START).replace(MATCH_END, HIGHLIGHT_END)
+
+
+# return the search details of a book returned by search_books
+# - the rank is a JSONFloat, so the response is rendered like DRF's JSONRenderer (see renderers.py)
+# - the text is HTML, safe to show as it is
+def get_search_details(book):
+    rank = getattr(book, 'rank', None)
+    return {
+        "rank": None if rank is None else JSONFloat(rank),
+        "title": highlight(getattr(book, 'title_highlight', book.title)),
+        "author": highlight(getattr(book, 'author_highlight', book.author)),
+        "summary": highlight(getattr(book, 'summary_snippet', None)),
+    }
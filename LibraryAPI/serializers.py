@@ -10,6 +10,24 @@ from django.core.validators import MinLengthValidator
 # import date
 from datetime import date
 
+# import settings & timezone to format datetimes like DRF
+from django.conf import settings
+from django.utils import timezone
+
+# import timed to record the serializer time in the request metrics
+from .metrics import timed, current_timings
+
+# import the largest batch of books checked out or returned in a request
+from .loans import LOAN_BATCH_MAX
+
+# the most books fetched by id in a request (GET /books/?ids= & POST /books/fetch/),
+# SQLite allows 32766 parameters per statement but a response with more books should be a list page
+BOOK_IDS_MAX = 500
+
+# import DRF's settings to check the date & datetime output formats
+from rest_framework.settings import api_settings
+from rest_framework import ISO_8601
+
 #########################################################################################################
 
 # define a serializer class  for the book model that inherits from ModelSerializer
@@ -38,6 +56,26 @@ class BookSerializer(serializers.ModelSerializer):
             )
         ]
 
+    # accept a `fields` argument to only return some of the fields (sparse fieldsets)
+    # e.g. BookSerializer(books, many=True, fields=['id', 'title'])
+    # https://www.django-rest-framework.org/api-guide/serializers/#dynamically-modifying-fields
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        # drop any fields that were not asked for
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+    # record the time spent serializing each book in the request metrics (see metrics.py)
+    # - this runs once per book, so skip the timer entirely when the request is not recorded
+    def to_representation(self, instance):
+        if current_timings.get() is None:
+            return super().to_representation(instance)
+        with timed('serializer'):
+            return super().to_representation(instance)
+
     # validate title field
     title = serializers.CharField(
         validators=[MinLengthValidator(1, message="Title must be at least 1 character long.")]
@@ -65,3 +103,80 @@ class BookSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Published date must be before or equal to today's date.")
         return value
     
+
+
+# define a serializer for the body of the checkout & return requests of a book (see loans.py)
+# - the borrower is optional & only recorded by checkouts
+class LoanSerializer(serializers.Serializer):
+    borrower = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+
+
+# define a serializer for the checkout & return requests of a list of books
+class BatchLoanSerializer(LoanSerializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), min_length=1, max_length=LOAN_BATCH_MAX
+    )
+
+
+# define a serializer for the ids of the books fetched at once (see BookViewSet.fetch)
+class BookIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), min_length=1, max_length=BOOK_IDS_MAX
+    )
+
+
+# define a fast serializer for reading books from .values() rows
+# BookSerializer is kept for validation & writes, but on reads DRF calls get_attribute & to_representation
+# on a field object for every field of every row, which dominates the time of large list responses
+# this serializer compiles a plan once (which fields, in BookSerializer's order, & how to format each one)
+# & then turns each row dict into the output dict directly
+# - strings, integers & booleans are passed through as they are
+# - dates & datetimes are formatted exactly like DRF's DateField & DateTimeField with the ISO 8601 format
+class BookReadSerializer:
+    def __init__(self, fields=None):
+        # use the field order & formatting of BookSerializer so the output is the same
+        serializer_fields = BookSerializer().fields
+        names = [name for name in serializer_fields if fields is None or name in fields]
+
+        # the fields to read from each row & the function that formats each one (None to pass it through)
+        self.fields = tuple(names)
+        self.plan = tuple((name, self.get_formatter(serializer_fields[name])) for name in names)
+
+        # look up the current time zone once rather than once per row
+        self.timezone = timezone.get_current_timezone()
+
+    # return the function that formats a value of a DRF field, or None if the value can be returned as it is
+    def get_formatter(self, field):
+        if isinstance(field, serializers.DateTimeField):
+            if getattr(field, 'format', api_settings.DATETIME_FORMAT) != ISO_8601:
+                return field.to_representation
+            return self.format_datetime
+        if isinstance(field, serializers.DateField):
+            if getattr(field, 'format', api_settings.DATE_FORMAT) != ISO_8601:
+                return field.to_representation
+            return date.isoformat
+        if isinstance(field, (serializers.CharField, serializers.IntegerField, serializers.BooleanField)):
+            return None
+        return field.to_representation
+
+    # format a datetime like DRF: convert it to the current time zone & write UTC as 'Z'
+    def format_datetime(self, value):
+        if settings.USE_TZ and timezone.is_aware(value):
+            value = value.astimezone(self.timezone)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    # return the representation of a single row
+    def to_representation(self, row):
+        return {
+            name: row[name] if formatter is None or row[name] is None else formatter(row[name])
+            for name, formatter in self.plan
+        }
+
+    # return the representation of many rows
+    # - recorded as the serializer time in the request metrics
+    def many(self, rows):
+        with timed('serializer'):
+            return [self.to_representation(row) for row in rows]
@@ -0,0 +1,41 @@
+# import contextmanager & ContextVar to skip the invalidation during a bulk write
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# import the model signals
+# https://docs.djangoproject.com/en/5.1/topics/signals/
+from django.db.models.signals import post_save, post_delete
+
+# import receiver to connect the functions to the signals
+from django.dispatch import receiver
+
+# import models
+from .models import Book
+
+# import the response cache helpers
+from .caching import bump_catalogue_generation
+
+#########################################################################################################
+
+# True while a bulk write runs, which invalidates the cached responses once when it is done (see skip_invalidation)
+invalidation_skipped = ContextVar('invalidation_skipped', default=False)
+
+
+# invalidate the cached book responses whenever a book is saved or deleted outside the API, e.g. in the admin
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_responses(sender, instance, **kwargs):
+    if not invalidation_skipped.get():
+        bump_catalogue_generation()
+
+
+# skip the invalidation of the Book signals in the block, e.g. QuerySet.delete() sends post_delete for every book
+# of a bulk delete: the caller bumps the generation once for the whole write instead
+# - a context variable, so the writes of other threads & tasks still invalidate the cached responses
+@contextmanager
+def skip_invalidation():
+    token = invalidation_skipped.set(True)
+    try:
+        yield
+    finally:
+        invalidation_skipped.reset(token)
@@ -0,0 +1,2 @@
+# SQLite database backend with a single-writer queue
+# use it with 'ENGINE': 'LibraryAPI.sqlite_backend' (see SQLITE_PROFILES in settings.py)
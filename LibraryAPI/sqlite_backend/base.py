@@ -0,0 +1,162 @@
+# import threading to queue the writers of each process
+import threading
+
+# import os to give each process its own lock file handle
+import os
+
+# fcntl locks the queue across processes, it is not available on Windows, where only the threads of a process are queued
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# import django's SQLite backend to extend it
+# https://docs.djangoproject.com/en/5.1/ref/databases/#sqlite-notes
+from django.db.backends.sqlite3 import base
+
+#########################################################################################################
+
+# the first word of the statements that write to the database outside a transaction
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+# define a queue that lets one writer at a time into a database file
+# SQLite only allows one writer at a time anyway, but its busy handler makes waiting writers poll with growing sleeps:
+# under load they give up with "database is locked" once `timeout` runs out, in no particular order
+# this queue makes them wait in the kernel instead (a thread lock inside the process, then a file lock between processes),
+# so the next writer starts as soon as the previous one commits & the busy handler is rarely needed
+class WriteQueue:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+        self.pid = None
+
+    # return this process's handle on the lock file, reopening it after a fork
+    # - a file lock belongs to the open file, so a handle inherited from the parent process would share its lock
+    def get_file(self):
+        if self.file is None or self.pid != os.getpid():
+            self.file = open(self.path, 'a+b')
+            self.pid = os.getpid()
+        return self.file
+
+    def acquire(self):
+        self.lock.acquire()
+        if fcntl is None:
+            return
+        try:
+            fcntl.flock(self.get_file(), fcntl.LOCK_EX)
+        except BaseException:
+            self.lock.release()
+            raise
+
+    def release(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.get_file(), fcntl.LOCK_UN)
+        finally:
+            self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+# the queue of each database file, shared by the connections of every thread in the process
+write_queues = {}
+write_queues_lock = threading.Lock()
+
+
+def get_write_queue(database):
+    with write_queues_lock:
+        if database not in write_queues:
+            write_queues[database] = WriteQueue(f'{database}-writer.lock')
+        return write_queues[database]
+
+
+# define a cursor that queues the writes made outside a transaction, e.g. Model.save() & QuerySet.update()
+class QueuedCursorWrapper(base.SQLiteCursorWrapper):
+    # the database wrapper that opened the cursor
+    db = None
+
+    def get_write_queue(self, query):
+        if self.db.write_queue is None or self.db.in_atomic_block:
+            return None
+        if not query.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+            return None
+        return self.db.write_queue
+
+    def execute(self, query, params=None):
+        queue = self.get_write_queue(query)
+        if queue is None:
+            return super().execute(query, params)
+        with queue:
+            return super().execute(query, params)
+
+    def executemany(self, query, param_list):
+        queue = self.get_write_queue(query)
+        if queue is None:
+            return super().executemany(query, param_list)
+        with queue:
+            return super().executemany(query, param_list)
+
+
+# define django's SQLite backend with the write queue
+# - every transaction (atomic block) waits for its turn when it starts & gives it up when it commits or rolls back,
+#   set OPTIONS['transaction_mode'] to 'IMMEDIATE' so SQLite's write lock is also taken when the transaction starts
+# - OPTIONS['write_queue'] = False turns the queue off, it is always off for in-memory databases (the test database)
+class DatabaseWrapper(base.DatabaseWrapper):
+    write_queue = None
+    holds_write_queue = False
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        queued = kwargs.pop('write_queue', True)
+        if queued and not self.is_in_memory_db():
+            self.write_queue = get_write_queue(str(self.settings_dict['NAME']))
+        return kwargs
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=QueuedCursorWrapper)
+        cursor.db = self
+        return cursor
+
+    # wait for the queue before BEGIN
+    def _start_transaction_under_autocommit(self):
+        if self.write_queue is None:
+            return super()._start_transaction_under_autocommit()
+
+        self.write_queue.acquire()
+        self.holds_write_queue = True
+        try:
+            super()._start_transaction_under_autocommit()
+        except BaseException:
+            self.release_write_queue()
+            raise
+
+    # let the next writer in once the transaction ends, however it ends
+    def release_write_queue(self):
+        if self.holds_write_queue:
+            self.holds_write_queue = False
+            self.write_queue.release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self.release_write_queue()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self.release_write_queue()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self.release_write_queue()
@@ -0,0 +1,154 @@
+# import connection & transaction to create the statistics triggers & rebuild the statistics in one transaction
+from django.db import connection, transaction
+
+# import Count, F, Q & ExtractYear to count the books of each group from scratch
+from django.db.models import Count, F, Q
+from django.db.models.functions import ExtractYear
+
+# import models
+from .models import Book, CatalogueStat
+
+#########################################################################################################
+
+# the catalogue statistics at /books/stats/: the number of books & of available books by genre, author & year
+# - counting them from the Book table is a GROUP BY over every book, on every request
+# - instead the CatalogueStat table keeps one row per group, & SQLite triggers add & remove each book from its groups:
+#   an insert adds 1 to the book's genre, author, year & total rows (creating the ones that do not exist),
+#   a delete takes 1 away (removing the groups left empty), & an update of one of those columns does both
+# - the triggers also see bulk_create, QuerySet.update() (admin actions), the checkouts' raw UPDATE & imports,
+#   so every write path keeps the statistics right
+# - reading them is a single query on the groups, however big the catalogue is
+# the triggers are created by the 0006 migration, which keeps a frozen copy of their SQL: changing them here needs a new
+# migration, & migrations that rebuild the Book table (SQLite drops its triggers) must create them again
+# check or repair them with `python manage.py rebuild_stats --check` / `python manage.py rebuild_stats`
+# https://www.sqlite.org/lang_upsert.html
+
+BOOK_TABLE = Book._meta.db_table
+STATS_TABLE = CatalogueStat._meta.db_table
+
+# the dimension of the row counting the whole catalogue
+TOTAL = 'total'
+
+# the dimensions the books are grouped by, with the SQL of a book's group (dates are stored as YYYY-MM-DD)
+STATS_DIMENSIONS = {
+    'genre': '{row}.genre',
+    'author': '{row}.author',
+    'year': 'substr({row}.published_date, 1, 4)',
+}
+
+
+# return the SQL that adds (sign '+') or takes away (sign '-') the `row` book ('new' or 'old') from its groups
+def change_groups(row, sign):
+    groups = [f"'{TOTAL}', ''"] + [f"'{dimension}', {value.format(row=row)}" for dimension, value in STATS_DIMENSIONS.items()]
+    values = ', '.join(f"({group}, {sign}1, {sign}{row}.availability)" for group in groups)
+    return (
+        f'INSERT INTO "{STATS_TABLE}" (dimension, value, books, available) VALUES {values} '
+        f'ON CONFLICT (dimension, value) DO UPDATE SET '
+        f'books = books + excluded.books, available = available + excluded.available;'
+    )
+
+
+# return the SQL that removes the groups of the `row` book that no book is left in (the total row is kept)
+def remove_empty_groups(row):
+    return ' '.join(
+        f'DELETE FROM "{STATS_TABLE}" WHERE dimension = \'{dimension}\' AND value = {value.format(row=row)} AND books = 0;'
+        for dimension, value in STATS_DIMENSIONS.items()
+    )
+
+
+# an update only changes the statistics when it changes a column they are grouped by
+STATS_COLUMNS = ('genre', 'author', 'published_date', 'availability')
+
+CREATE_STATS_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS "{STATS_TABLE}_insert" AFTER INSERT ON "{BOOK_TABLE}" BEGIN
+        {change_groups('new', '+')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS "{STATS_TABLE}_update" AFTER UPDATE OF {', '.join(STATS_COLUMNS)} ON "{BOOK_TABLE}"
+    WHEN {' OR '.join(f'old.{column} IS NOT new.{column}' for column in STATS_COLUMNS)} BEGIN
+        {change_groups('old', '-')}
+        {change_groups('new', '+')}
+        {remove_empty_groups('old')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS "{STATS_TABLE}_delete" AFTER DELETE ON "{BOOK_TABLE}" BEGIN
+        {change_groups('old', '-')}
+        {remove_empty_groups('old')}
+    END
+    ''',
+]
+
+DROP_STATS_TRIGGERS = [
+    f'DROP TRIGGER IF EXISTS "{STATS_TABLE}_insert"',
+    f'DROP TRIGGER IF EXISTS "{STATS_TABLE}_update"',
+    f'DROP TRIGGER IF EXISTS "{STATS_TABLE}_delete"',
+]
+
+
+# check if the statistics triggers can be used on a database connection
+def stats_supported(using_connection=connection):
+    return using_connection.vendor == 'sqlite'
+
+
+# create the statistics triggers if they do not exist
+def create_stats_triggers(using_connection=connection):
+    if not stats_supported(using_connection):
+        return
+    with using_connection.cursor() as cursor:
+        for statement in CREATE_STATS_TRIGGERS:
+            cursor.execute(statement)
+
+
+# replace the statistics with a count of every book, in one transaction
+# - uses SQL only, like the 0006 migration that first counted the books
+def rebuild_stats(using_connection=connection):
+    with transaction.atomic(using=using_connection.alias), using_connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{STATS_TABLE}"')
+        cursor.execute(
+            f'INSERT INTO "{STATS_TABLE}" (dimension, value, books, available) '
+            f"SELECT '{TOTAL}', '', count(*), coalesce(sum(availability), 0) FROM \"{BOOK_TABLE}\""
+        )
+        for dimension, value in STATS_DIMENSIONS.items():
+            value = value.format(row=f'"{BOOK_TABLE}"')
+            cursor.execute(
+                f'INSERT INTO "{STATS_TABLE}" (dimension, value, books, available) '
+                f"SELECT '{dimension}', {value}, count(*), sum(availability) FROM \"{BOOK_TABLE}\" GROUP BY {value}"
+            )
+
+
+# return the statistics kept in the CatalogueStat table: {(dimension, value): (books, available)}
+def read_stats(dimensions=None):
+    stats = CatalogueStat.objects.order_by('dimension', 'value')
+    if dimensions is not None:
+        stats = stats.filter(dimension__in=[TOTAL, *dimensions])
+    return {(dimension, value): (books, available)
+            for dimension, value, books, available in stats.values_list('dimension', 'value', 'books', 'available')}
+
+
+# return the statistics counted from every book with the ORM (a GROUP BY per dimension), to check the table against
+def count_stats():
+    counts = {'books': Count('id'), 'available': Count('id', filter=Q(availability=True))}
+    total = Book.objects.aggregate(**counts)
+    stats = {(TOTAL, ''): (total['books'], total['available'])}
+    for dimension, column in (('genre', F('genre')), ('author', F('author')), ('year', ExtractYear('published_date'))):
+        for row in Book.objects.order_by().values(value=column).annotate(**counts):
+            value = f"{row['value']:04d}" if dimension == 'year' else row['value']
+            stats[(dimension, value)] = (row['books'], row['available'])
+    return stats
+
+
+# return the statistics of the `dimensions` (all of them by default) as they are sent by the API
+def get_stats(dimensions=None):
+    dimensions = list(STATS_DIMENSIONS) if dimensions is None else dimensions
+    stats = read_stats(dimensions)
+    books, available = stats.get((TOTAL, ''), (0, 0))
+    data = {"books": books, "available": available, "checked_out": books - available}
+    for dimension in dimensions:
+        data[f"by_{dimension}"] = [
+            {dimension: value, "books": group_books, "available": group_available}
+            for (group_dimension, value), (group_books, group_available) in stats.items() if group_dimension == dimension
+        ]
+    return data
@@ -1,3 +1,929 @@
-from django.test import TestCase
+# import json to write the records of an import
+import json
 
-# Create your tests here.
+# import math & random to check the rate limit at many times
+import math
+import random
+
+# import os & tempfile for scratch files & a scratch response cache
+import os
+import tempfile
+
+# import StringIO to read the output of the commands
+from io import StringIO
+
+# import threading to send concurrent checkouts
+import threading
+
+# import mock to stream in small chunks
+from unittest import mock
+
+# import SimpleNamespace to stand in for the view & request of an idempotent action
+from types import SimpleNamespace
+
+# import date to build the books of the tests
+from datetime import date
+
+# import async_to_sync to call the async views
+from asgiref.sync import async_to_sync
+
+from django.test import TestCase, TransactionTestCase, AsyncRequestFactory, override_settings
+
+# import call_command & CommandError to run the export & import commands
+from django.core.management import call_command, CommandError
+
+# import the cache to run each request with an empty response cache
+from django.core.cache import cache
+
+# import the HTTP dates of Last-Modified & If-Modified-Since
+from django.utils.http import http_date, parse_http_date
+
+# import IntegrityError & the delete signals to check the writes, & connection to close each thread's
+from django.db import IntegrityError, connection
+from django.db.models.signals import pre_delete, post_delete
+
+# import django's in-process cache, a cache without incr_window
+from django.core.cache.backends.locmem import LocMemCache
+
+# import DRF's test client
+# https://www.django-rest-framework.org/api-guide/testing/#apiclient
+from rest_framework.test import APIClient, APIRequestFactory
+
+# import Request to throttle a request
+from rest_framework.request import Request
+
+# import Response to return from the idempotent actions
+from rest_framework.response import Response
+
+# import DRF's JSON renderer, the reference of the API's renderer
+from rest_framework.renderers import JSONRenderer
+
+# import models
+from .models import Book, Loan
+
+# import the error message of a duplicate title & author
+from .bulk import DUPLICATE_MESSAGE
+
+# import the idempotency keys & the lock they take
+from .idempotency import IDEMPOTENCY_HEADER, idempotent, get_idempotency_keys
+
+# import the API's JSON renderer
+from .renderers import EnvelopeJSONRenderer
+
+# import the search details of a book & the marks of its matched words
+from .search import get_search_details, MATCH_START, MATCH_END
+
+# import the serializers compared by the parity tests & the most ids of a multi-get
+from .serializers import BookSerializer, BookReadSerializer, BOOK_IDS_MAX
+
+# import both viewsets
+from .views import BookViewSet
+from .async_views import AsyncBookViewSet
+
+# import the checkouts & returns of the loans
+from .loans import checkout_books, return_books
+
+# import the statistics kept by the triggers & their recount
+from .stats import read_stats, count_stats
+
+# import the imports of the catalogue
+from .transfer import import_records, read_records
+
+# import the shared cache & the throttle of the rate limit
+from .cache_backends import SQLiteCache
+from .throttling import SlidingWindowAnonRateThrottle
+
+# import the catalogue generation of the response cache
+from .caching import get_catalogue_generation
+
+# import the scratch response cache & raised rate limit of the benchmarks
+from .benchmarking import api_sandbox
+
+# import the queries the API relies on being index backed & the check of their plans
+from .management.commands.check_query_plans import get_checked_queries, get_plan_problems
+
+# import the requests of the query budget check
+from .management.commands.check_query_budgets import get_checked_requests, make_request, call_view, acall_view
+
+#########################################################################################################
+
+# run the tests with: python manage.py test LibraryAPI
+# https://docs.djangoproject.com/en/5.1/topics/testing/overview/
+
+
+# check that SQLite's query planner uses the Book indexes for the API's common queries (see check_query_plans)
+# - the test database is migrated like production, so the plans are the ones production gets
+# https://www.sqlite.org/eqp.html
+class QueryPlanTests(TestCase):
+    def test_common_queries_use_their_indexes(self):
+        for description, index, queryset in get_checked_queries():
+            with self.subTest(description):
+                self.assertEqual(get_plan_problems(queryset, index), [], queryset.explain())
+
+
+# return `count` books with different titles, authors, genres, years & availability
+def make_books(count):
+    return Book.objects.bulk_create([
+        Book(title=f"Book {number}", author=f"Author {number % 3}", edition="1st",
+             published_date=date(2000 + number, 1, 1), genre=f"Genre {number % 2}",
+             summary="A test book about whales", availability=number % 4 != 0)
+        for number in range(count)
+    ])
+
+
+# return the body of a new book for the API
+def book_data(title, author="Some Author", **fields):
+    return {'title': title, 'author': author, 'edition': "1st", 'published_date': '2001-01-01', 'genre': "Genre",
+            'summary': "A test book about whales", 'availability': True, **fields}
+
+
+# call the API through the whole middleware stack with an empty scratch response cache & without the rate limit
+class BookAPITestCase(TestCase):
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(api_sandbox(directory))
+        self.client = APIClient()
+
+
+# check the keyset pagination of the list (see pagination.py) & its NDJSON stream
+# - books share each published_date, so the pages only hold together if the id breaks the ties
+class PaginationTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        Book.objects.bulk_create([
+            Book(title=f"Book {number}", author=f"Author {number % 3}", edition="1st",
+                 published_date=date(2000 + number % 3, 1, 1), genre="Genre", summary="A test book about whales",
+                 availability=True)
+            for number in range(23)
+        ])
+
+    # return the ids of each page, following the `link` of each page from `url`
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            envelope = response.json()
+            pages.append([book['id'] for book in envelope['data']])
+            url = envelope[link]
+        return pages
+
+    # the next links walk every book once in order, & the previous links walk back through the same pages
+    def test_next_and_previous_with_ties(self):
+        for ordering in ('published_date', '-published_date'):
+            with self.subTest(ordering=ordering):
+                expected = list(Book.objects.order_by(ordering, ordering.replace('published_date', 'id'))
+                                .values_list('id', flat=True))
+                pages = self.walk(f'/api/v1/books/?ordering={ordering}&page_size=4', 'next')
+                self.assertEqual([book for page in pages for book in page], expected)
+                self.assertEqual([len(page) for page in pages], [4, 4, 4, 4, 4, 3])
+
+                # go back from the last page
+                last = self.client.get(f'/api/v1/books/?ordering={ordering}&page_size=4')
+                for _ in pages[1:]:
+                    last = self.client.get(last.json()['next'])
+                self.assertIsNone(last.json()['next'])
+                self.assertEqual(self.walk(last.json()['previous'], 'previous'), pages[-2::-1])
+
+    # every book is streamed exactly once, across several chunks of the query
+    def test_stream(self):
+        self.enterContext(mock.patch.object(BookViewSet, 'stream_chunk_size', 5))
+        response = self.client.get('/api/v1/books/?stream=1&ordering=-published_date')
+        self.assertEqual(response.status_code, 200)
+        ids = [json.loads(line)['id'] for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(ids, list(Book.objects.order_by('id').values_list('id', flat=True)))
+
+
+# check that the list's filters apply to a search (?q=)
+class SearchFilterTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.books = make_books(8)
+
+    def search(self, query):
+        response = self.client.get(f'/api/v1/books/?q=whales&{query}')
+        self.assertEqual(response.status_code, 200)
+        return sorted(book['id'] for book in response.json()['data'])
+
+    def test_filters_apply_to_search(self):
+        self.assertEqual(self.search('genre=Nope'), [])
+        self.assertEqual(self.search('genre=Genre 1'), [book.id for book in self.books if book.genre == "Genre 1"])
+        self.assertEqual(
+            self.search('author=Author 2&available=true&published_after=2003-01-01'),
+            [book.id for book in self.books
+             if book.author == "Author 2" and book.availability and book.published_date >= date(2003, 1, 1)],
+        )
+
+    # the text of the books is escaped, only the marks of the matched words are HTML
+    def test_highlights_are_escaped(self):
+        book = Book.objects.create(title="<img src=x onerror=alert(1)> whales", author="<b>Whales</b> & co",
+                                   edition="1st", published_date=date(2000, 1, 1), genre="Genre",
+                                   summary="<script>alert('whales')</script>", availability=True)
+        response = self.client.get('/api/v1/books/?q=whales&genre=Genre')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'][0]['search'] | {"rank": None}, {
+            "rank": None,
+            "title": "&lt;img src=x onerror=alert(1)&gt; <mark>whales</mark>",
+            "author": "&lt;b&gt;<mark>Whales</mark>&lt;/b&gt; &amp; co",
+            "summary": "&lt;script&gt;alert(&#x27;<mark>whales</mark>&#x27;)&lt;/script&gt;",
+        })
+        self.assertEqual(response.json()['data'][0]['title'], book.title)
+
+    def test_invalid_filter_is_rejected(self):
+        response = self.client.get('/api/v1/books/?q=whales&published_after=soon')
+        self.assertEqual(response.status_code, 400)
+
+    def test_offset(self):
+        self.assertEqual(len(self.client.get('/api/v1/books/?q=whales&offset=6').json()['data']), 2)
+        for offset in ('abc', '-5', ''):
+            with self.subTest(offset=offset):
+                response = self.client.get(f'/api/v1/books/?q=whales&offset={offset}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('offset', str(response.json()))
+
+
+# check that the fast read serializer returns exactly what BookSerializer returns (see bench_serializer)
+# - for every field, the list's compact projection & a sparse fieldset, in BookSerializer's field order
+class SerializerParityTests(TestCase):
+    def setUp(self):
+        make_books(6)
+        # text that must pass through unchanged
+        Book.objects.create(title="Café naïve 東京", author="Ünïcode", edition="", published_date=date(1, 1, 1),
+                            genre="", summary="", availability=False)
+
+    def assert_same_output(self):
+        for fields in (None, BookViewSet.list_fields, ['id', 'title', 'created_at']):
+            reference = BookSerializer(fields=fields)
+            fast = BookReadSerializer(fields)
+            rows = Book.objects.order_by('id').values(*fast.fields)
+            for book, row in zip(Book.objects.order_by('id'), rows, strict=True):
+                with self.subTest(fields=fields, book=book.id):
+                    expected = reference.to_representation(book)
+                    actual = fast.to_representation(row)
+                    self.assertEqual(actual, expected)
+                    self.assertEqual(list(actual), list(expected))
+
+    def test_same_output(self):
+        self.assert_same_output()
+
+    # the datetimes are converted to the current time zone like DRF does
+    @override_settings(TIME_ZONE='Asia/Kolkata')
+    def test_same_output_in_another_time_zone(self):
+        self.assert_same_output()
+
+
+# check the sparse fieldsets (?fields=) of the list & of a book
+class SparseFieldsTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = make_books(3)[0]
+
+    def get_data(self, path, fields=None):
+        response = self.client.get(path, {} if fields is None else {'fields': fields})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+    def test_requested_fields(self):
+        for book in self.get_data('/api/v1/books/', 'id, title'):
+            self.assertEqual(list(book), ['id', 'title'])
+        self.assertEqual(list(self.get_data(f'/api/v1/books/{self.book.id}/', 'author,id')), ['id', 'author'])
+
+    # a blank list is the same as no ?fields=
+    def test_blank_fields(self):
+        for path in ('/api/v1/books/', f'/api/v1/books/{self.book.id}/'):
+            for fields in ('', ',', ' ', ' , '):
+                with self.subTest(path=path, fields=fields):
+                    self.assertEqual(self.get_data(path, fields), self.get_data(path))
+
+    def test_unknown_fields(self):
+        response = self.client.get('/api/v1/books/', {'fields': 'id,nope'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('nope', str(response.json()))
+
+
+# check that the API's renderer writes the same bytes as DRF's JSONRenderer (see bench_renderer)
+class RendererParityTests(BookAPITestCase):
+    def assert_same_bytes(self, data):
+        for media_type in ('application/json', 'application/json; indent=4'):
+            with self.subTest(media_type=media_type):
+                self.assertEqual(EnvelopeJSONRenderer().render(data, media_type), JSONRenderer().render(data, media_type))
+
+    # the ranks of the results are floats, which orjson writes differently
+    def test_search_envelope(self):
+        make_books(8)
+        response = self.client.get('/api/v1/books/?q=whales')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['data']), 8)
+        self.assert_same_bytes(response.data)
+
+    def test_small_rank(self):
+        book = SimpleNamespace(rank=-1.98e-06, title="Whales", author="Author",
+                               title_highlight=f"{MATCH_START}Whales{MATCH_END}", author_highlight="Author",
+                               summary_snippet=f"A book about {MATCH_START}whales{MATCH_END}")
+        data = {"status": "success", "code": 200, "data": [{"id": 1, "search": get_search_details(book)}]}
+        self.assertIn(b'-1.98e-06', JSONRenderer().render(data))
+        self.assert_same_bytes(data)
+
+
+# check the writes of a single book
+class BookWriteTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = make_books(1)[0]
+
+    # a duplicate title & author is rejected by the unique constraint with the serializer's message
+    def test_duplicate_book_is_rejected(self):
+        response = self.client.post('/api/v1/books/', book_data(self.book.title, self.book.author), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(DUPLICATE_MESSAGE, str(response.json()))
+
+    # any other error of the database is not reported as a duplicate
+    def test_other_integrity_errors_are_raised(self):
+        error = IntegrityError('NOT NULL constraint failed: LibraryAPI_book.title')
+        with self.assertRaises(IntegrityError):
+            BookViewSet().raise_duplicate(error)
+
+    # a delete sends the delete signals of the book
+    def test_destroy_sends_delete_signals(self):
+        received = []
+
+        def receiver(signal, instance, **kwargs):
+            received.append((signal, instance.id))
+
+        pre_delete.connect(receiver, sender=Book)
+        post_delete.connect(receiver, sender=Book)
+        self.addCleanup(pre_delete.disconnect, receiver, sender=Book)
+        self.addCleanup(post_delete.disconnect, receiver, sender=Book)
+
+        response = self.client.delete(f'/api/v1/books/{self.book.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(received, [(pre_delete, self.book.id), (post_delete, self.book.id)])
+        self.assertFalse(Book.objects.filter(id=self.book.id).exists())
+        self.assertEqual(self.client.delete(f'/api/v1/books/{self.book.id}/').status_code, 404)
+
+
+# check the bulk writes at /books/bulk/: a result for every item & a status for the whole batch
+class BulkWriteTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.books = make_books(6)
+        self.book = self.books[0]
+
+    def bulk(self, method, items):
+        response = getattr(self.client, method)('/api/v1/books/bulk/', items, format='json')
+        return response.status_code, [(result['index'], result['status']) for result in response.json()['data']]
+
+    # the books that are valid are added, the duplicates of a book of the catalogue or of the batch are not
+    def test_partial_success(self):
+        code, results = self.bulk('post', [book_data("A"), book_data("A"), book_data(self.book.title, self.book.author),
+                                           {'title': "Only a title"}, book_data("B")])
+        self.assertEqual(code, 207)
+        self.assertEqual(results, [(0, "created"), (1, "error"), (2, "error"), (3, "error"), (4, "created")])
+        self.assertEqual(Book.objects.filter(title__in=["A", "B"]).count(), 2)
+
+    def test_every_item_failing_is_a_400(self):
+        self.assertEqual(self.bulk('post', [{'title': "Only a title"}, book_data(self.book.title, self.book.author)]),
+                         (400, [(0, "error"), (1, "error")]))
+        self.assertEqual(self.bulk('delete', [self.books[-1].id + 1, "x"]), (400, [(0, "error"), (1, "error")]))
+        self.assertEqual(Book.objects.count(), 6)
+
+    def test_update(self):
+        code, results = self.bulk('patch', [{'id': self.book.id, 'edition': "2nd"}, {'id': self.books[-1].id + 1}])
+        self.assertEqual((code, results), (207, [(0, "updated"), (1, "error")]))
+        self.assertEqual(Book.objects.get(id=self.book.id).edition, "2nd")
+
+    # a bulk delete invalidates the cached responses once, not once for every book (QuerySet.delete() sends the signals)
+    def test_delete_bumps_the_generation_once(self):
+        generation = get_catalogue_generation()
+        code, results = self.bulk('delete', [book.id for book in self.books[1:]] + [{'id': self.book.id}])
+        self.assertEqual((code, results), (200, [(index, "deleted") for index in range(6)]))
+        self.assertEqual(get_catalogue_generation(), generation + 1)
+        self.assertFalse(Book.objects.exists())
+
+
+# check the multi-get: GET /books/?ids= & POST /books/fetch/ (see BookViewSet.fetch)
+class MultiGetTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.books = make_books(4)
+        self.missing = self.books[-1].id + 1
+
+    # return the response of both ways of asking for the books of `ids`
+    def get_responses(self, ids):
+        return {
+            "GET": self.client.get('/api/v1/books/', {'ids': ','.join(map(str, ids))}),
+            "POST": self.client.post('/api/v1/books/fetch/', {'ids': ids}, format='json'),
+        }
+
+    # the books are in the order of the ids, each in the envelope of a retrieve, & a missing book is a 404 item
+    def test_order_and_missing_books(self):
+        first, second = self.books[2].id, self.books[0].id
+        ids = [first, self.missing, second, first]
+        for method, response in self.get_responses(ids).items():
+            with self.subTest(method=method):
+                self.assertEqual(response.status_code, 207)
+                envelope = response.json()
+                self.assertEqual((envelope['status'], envelope['code']), ("partial", 207))
+                self.assertEqual([item['id'] for item in envelope['data']], ids)
+                self.assertEqual([item['code'] for item in envelope['data']], [200, 404, 200, 200])
+                self.assertIsNone(envelope['data'][1]['data'])
+                for item in envelope['data']:
+                    if item['code'] == 200:
+                        retrieved = self.client.get(f"/api/v1/books/{item['id']}/").json()
+                        self.assertEqual(item['data'], retrieved['data'])
+
+    def test_status_of_the_whole_request(self):
+        for ids, code in (([book.id for book in self.books], 200), ([self.missing, self.missing + 1], 404)):
+            for method, response in self.get_responses(ids).items():
+                with self.subTest(ids=ids, method=method):
+                    self.assertEqual(response.status_code, code)
+                    self.assertEqual(len(response.json()['data']), len(ids))
+
+    def test_invalid_ids(self):
+        for ids in ('', 'a,1', '0', '1,,2', ','.join(['1'] * (BOOK_IDS_MAX + 1))):
+            with self.subTest(ids=ids[:20]):
+                self.assertEqual(self.client.get('/api/v1/books/', {'ids': ids}).status_code, 400)
+        for data in ({}, {'ids': []}, {'ids': 1}, {'ids': ["a"]}, {'ids': [1] * (BOOK_IDS_MAX + 1)}):
+            with self.subTest(data=str(data)[:20]):
+                self.assertEqual(self.client.post('/api/v1/books/fetch/', data, format='json').status_code, 400)
+        # the limit itself is allowed
+        self.assertEqual(self.client.get('/api/v1/books/', {'ids': ','.join(['1'] * BOOK_IDS_MAX)}).status_code, 200)
+
+
+# return the envelope of a response without the rate limit headers, which change with every request
+def get_envelope(response):
+    return {key: value for key, value in response.json().items() if key != 'headers'}
+
+
+# check the response cache of the list & the details (see caching.py)
+class ResponseCacheTests(BookAPITestCase):
+    PATHS = ('/api/v1/books/', '/api/v1/books/?genre=Genre 1&ordering=-published_date')
+
+    def setUp(self):
+        super().setUp()
+        self.books = make_books(4)
+        self.paths = [*self.PATHS, f'/api/v1/books/{self.books[0].id}/']
+
+    # a client that sends the ETag back gets an empty 304 while the catalogue has not changed
+    def test_not_modified(self):
+        for path in self.paths:
+            with self.subTest(path=path):
+                etag = self.client.get(path)['ETag']
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response['ETag'], etag)
+
+    # the cached envelope is the one the action returns, & is read without a query
+    def test_cached_envelope_matches_a_fresh_one(self):
+        for path in self.paths:
+            with self.subTest(path=path):
+                cache.clear()
+                fresh = self.client.get(path)
+                with self.assertNumQueries(0):
+                    cached = self.client.get(path)
+                self.assertEqual(cached.status_code, 200)
+                self.assertEqual(get_envelope(cached), get_envelope(fresh))
+                self.assertEqual(cached['ETag'], fresh['ETag'])
+                self.assertEqual(cached.get('Last-Modified'), fresh.get('Last-Modified'))
+
+    # every kind of write moves the catalogue to a new generation: new ETags & fresh envelopes
+    def test_writes_change_the_etag(self):
+        book = self.books[0]
+        writes = {
+            "save": lambda: Book.objects.filter(id=book.id).first().save(),
+            "create": lambda: self.client.post('/api/v1/books/', book_data("New book"), format='json'),
+            "update": lambda: self.client.patch(f'/api/v1/books/{book.id}/', {'genre': "Poetry"}, format='json'),
+            "bulk create": lambda: self.client.post('/api/v1/books/bulk/', [book_data("Bulk book")], format='json'),
+            "bulk update": lambda: self.client.patch('/api/v1/books/bulk/', [{'id': book.id, 'edition': "3rd"}],
+                                                     format='json'),
+            "bulk delete": lambda: self.client.delete('/api/v1/books/bulk/', [self.books[2].id], format='json'),
+            "delete": lambda: Book.objects.get(id=self.books[3].id).delete(),
+        }
+        for name, write in writes.items():
+            with self.subTest(write=name):
+                before = {path: self.client.get(path) for path in self.paths}
+                response = write()
+                if hasattr(response, 'status_code'):
+                    self.assertLess(response.status_code, 400, response.content)
+                for path, old in before.items():
+                    response = self.client.get(path, HTTP_IF_NONE_MATCH=old['ETag'])
+                    self.assertEqual(response.status_code, 200)
+                    self.assertNotEqual(response['ETag'], old['ETag'])
+                    cache.clear()
+                    self.assertEqual(get_envelope(response), get_envelope(self.client.get(path)))
+
+
+# check the change feed at /books/changes/ (see changes.py) & the Last-Modified dates of the details
+class ChangeFeedTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.books = make_books(5)
+
+    # return the pages of changes after `since`, checking the revisions & links of each
+    def sync(self, since, page_size=100):
+        pages = []
+        while True:
+            response = self.client.get(f'/api/v1/books/changes/?since={since}&page_size={page_size}')
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertGreaterEqual(page['revision'], since)
+            self.assertIn(f"since={page['revision']}", page['next'])
+            pages.append(page)
+            if not page['has_more']:
+                return pages
+            self.assertGreater(page['revision'], since)
+            since = page['revision']
+
+    def get_ids(self, pages, kind):
+        return [book['id'] if kind == 'updated' else book for page in pages for book in page['data'][kind]]
+
+    def test_first_sync_pages_through_every_book(self):
+        pages = self.sync(0, page_size=2)
+        self.assertEqual([len(page['data']['updated']) for page in pages], [2, 2, 1])
+        self.assertEqual([page['has_more'] for page in pages], [True, True, False])
+        self.assertEqual(self.get_ids(pages, 'updated'), [book.id for book in self.books])
+
+    # a first sync has no tombstones
+    def test_first_sync_skips_deleted_books(self):
+        Book.objects.get(id=self.books[0].id).delete()
+        pages = self.sync(0)
+        self.assertEqual(self.get_ids(pages, 'updated'), [book.id for book in self.books[1:]])
+        self.assertEqual(self.get_ids(pages, 'deleted'), [])
+
+    def test_changes_since_a_revision(self):
+        revision = self.sync(0)[-1]['revision']
+        first, second, deleted = self.books[:3]
+
+        self.client.patch(f'/api/v1/books/{second.id}/', {'genre': "Poetry"}, format='json')
+        self.client.patch(f'/api/v1/books/{first.id}/', {'genre': "Drama"}, format='json')
+        self.client.patch(f'/api/v1/books/{second.id}/', {'edition': "2nd"}, format='json')
+        self.assertEqual(self.client.delete(f'/api/v1/books/{deleted.id}/').status_code, 204)
+        new = self.client.post('/api/v1/books/', book_data("New book"), format='json').json()['data']
+
+        pages = self.sync(revision, page_size=2)
+        self.assertEqual([page['has_more'] for page in pages], [True, False])
+        # each book once, at the revision of its last change
+        self.assertEqual(self.get_ids(pages, 'updated'), [first.id, second.id, new['id']])
+        self.assertEqual(self.get_ids(pages, 'deleted'), [deleted.id])
+        updated = {book['id']: book for page in pages for book in page['data']['updated']}
+        self.assertEqual((updated[first.id]['genre'], updated[second.id]['genre'], updated[second.id]['edition']),
+                         ("Drama", "Poetry", "2nd"))
+        self.assertEqual(updated[new['id']], new)
+
+        # nothing changed since the last revision
+        last = pages[-1]['revision']
+        self.assertGreater(last, revision)
+        page = self.sync(last)[0]
+        self.assertEqual((page['data'], page['revision'], page['message']),
+                         ({"updated": [], "deleted": []}, last, "There are no changes"))
+
+    def test_invalid_since(self):
+        for since in ('-1', 'abc'):
+            with self.subTest(since=since):
+                self.assertEqual(self.client.get(f'/api/v1/books/changes/?since={since}').status_code, 400)
+
+    # a client that sends the Last-Modified date of a book back gets an empty 304 until the book changes
+    def test_details_not_modified_since(self):
+        path = f'/api/v1/books/{self.books[0].id}/'
+        last_modified = self.client.get(path)['Last-Modified']
+        for cached in (True, False):
+            with self.subTest(cached=cached):
+                if not cached:
+                    cache.clear()
+                response = self.client.get(path, HTTP_IF_MODIFIED_SINCE=last_modified)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response['Last-Modified'], last_modified)
+
+        # the book changed after the client's copy
+        earlier = http_date(parse_http_date(last_modified) - 1)
+        self.assertEqual(self.client.get(path, HTTP_IF_MODIFIED_SINCE=earlier).status_code, 200)
+        # If-None-Match takes precedence
+        self.assertEqual(self.client.get(path, HTTP_IF_MODIFIED_SINCE=last_modified,
+                                         HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+
+# check the Idempotency-Key header of POST /books (see idempotency.py)
+class IdempotencyTests(BookAPITestCase):
+    def post(self, data, key="key-1", **extra):
+        return self.client.post('/api/v1/books/', data, format='json', HTTP_IDEMPOTENCY_KEY=key, **extra)
+
+    # a retry gets the first response again, without inserting the book again
+    def test_retry_is_replayed(self):
+        first = self.post(book_data("Moby Dick"))
+        self.assertEqual(first.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', first)
+
+        with self.assertNumQueries(0):
+            retry = self.post(book_data("Moby Dick"))
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(get_envelope(retry), get_envelope(first))
+        self.assertEqual(retry.get('Location'), first.get('Location'))
+        self.assertEqual(Book.objects.filter(title="Moby Dick").count(), 1)
+
+    def test_key_reused_with_another_body_is_rejected(self):
+        self.assertEqual(self.post(book_data("Moby Dick")).status_code, 201)
+        response = self.post(book_data("Another book"))
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(Book.objects.filter(title="Another book").exists())
+
+    # each client has its own keys
+    def test_key_is_scoped_to_the_client(self):
+        self.assertEqual(self.post(book_data("Moby Dick"), REMOTE_ADDR='10.0.0.1').status_code, 201)
+        response = self.post(book_data("Another book"), REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Book.objects.count(), 2)
+
+    # an error is not stored, so the request can be fixed & sent again with the same key
+    def test_errors_are_not_stored(self):
+        self.assertEqual(self.post(book_data("Moby Dick", author="")).status_code, 400)
+        self.assertEqual(self.post(book_data("Moby Dick")).status_code, 201)
+
+    def test_invalid_key(self):
+        self.assertEqual(self.post(book_data("Moby Dick"), key="x" * 256).status_code, 400)
+        self.assertFalse(Book.objects.exists())
+
+
+# check that the statistics the triggers keep equal a count of every book after each kind of write (see stats.py)
+class StatsTests(BookAPITestCase):
+    def test_stats_match_a_recount(self):
+        books = make_books(12)
+        book = books[0]
+        lines = [json.dumps(book_data(f"Imported {number}", genre="Imported genre")) for number in range(3)]
+        writes = {
+            "bulk_create": lambda: None,
+            "create": lambda: self.client.post('/api/v1/books/', book_data("New", author="New author"), format='json'),
+            "update genre": lambda: self.client.patch(f'/api/v1/books/{book.id}/', {'genre': "Poetry"}, format='json'),
+            "update author & year": lambda: self.client.patch(
+                f'/api/v1/books/{book.id}/', {'author': "Another author", 'published_date': '1999-12-31'},
+                format='json'),
+            "update to the same group": lambda: self.client.patch(f'/api/v1/books/{books[1].id}/',
+                                                                  {'genre': "Genre 0"}, format='json'),
+            "checkout": lambda: checkout_books([books[1].id, books[2].id]),
+            "return": lambda: return_books([books[1].id]),
+            "availability update": lambda: Book.objects.filter(genre="Genre 1").update(availability=False),
+            "delete": lambda: self.client.delete(f'/api/v1/books/{books[3].id}/'),
+            "delete the last book of groups": lambda: self.client.delete(f'/api/v1/books/{book.id}/'),
+            "bulk update": lambda: self.client.patch('/api/v1/books/bulk/', [
+                {'id': books[4].id, 'genre': "Genre 1", 'availability': True},
+                {'id': books[5].id, 'author': "Author 0", 'published_date': '2020-02-02'},
+            ], format='json'),
+            "bulk delete": lambda: self.client.delete('/api/v1/books/bulk/', [books[6].id, books[7].id], format='json'),
+            "import": lambda: list(import_records(read_records('ndjson', lines))),
+        }
+        for name, write in writes.items():
+            with self.subTest(write=name):
+                response = write()
+                if hasattr(response, 'status_code'):
+                    self.assertLess(response.status_code, 300, response.content)
+                self.assertEqual(read_stats(), count_stats())
+        self.assertEqual(Book.objects.filter(genre="Imported genre").count(), 3)
+        self.assertEqual(read_stats()[('total', '')], (Book.objects.count(), Book.objects.filter(availability=True).count()))
+
+
+# check the export_books & import_books commands (see transfer.py)
+class TransferTests(BookAPITestCase):
+    FIELDS = ('title', 'author', 'edition', 'published_date', 'genre', 'summary', 'availability')
+
+    def setUp(self):
+        super().setUp()
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+
+    # return the books without the fields that are not imported (id, created_at & updated_at)
+    def get_books(self):
+        return list(Book.objects.order_by('title', 'author').values_list(*self.FIELDS))
+
+    def run_command(self, *args, **options):
+        output = StringIO()
+        call_command(*args, stdout=output, **options)
+        return output.getvalue()
+
+    # write an NDJSON file of `records` (dicts, or lines written as they are)
+    def write_ndjson(self, records):
+        path = os.path.join(self.directory, 'books.ndjson')
+        with open(path, 'w', encoding='utf-8') as file:
+            for record in records:
+                file.write((record if isinstance(record, str) else json.dumps(record)) + '\n')
+        return path
+
+    # an export imported into an empty catalogue gives back the same books
+    def test_round_trip(self):
+        make_books(6)
+        Book.objects.create(title='A "quoted", comma\nseparated title', author="Café naïve 東京", edition="1st",
+                            published_date=date(1851, 10, 18), genre="Line\u2028separator",
+                            summary="A summary with\ttabs, 'quotes' & emoji 😀", availability=False)
+        books = self.get_books()
+
+        for format in ('ndjson', 'csv'):
+            with self.subTest(format=format):
+                path = os.path.join(self.directory, f'books.{format}')
+                self.run_command('export_books', path)
+                Book.objects.all().delete()
+                self.assertIn("7 created, 0 failed", self.run_command('import_books', path))
+                self.assertEqual(self.get_books(), books)
+                self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    # a bad record is reported with its number & does not stop the import
+    def test_bad_records_are_reported(self):
+        path = self.write_ndjson([
+            book_data("First"), "{not json", {'title': "Only a title"}, book_data("First"), book_data("Last"),
+        ])
+        errors = os.path.join(self.directory, 'errors.ndjson')
+        self.assertIn("2 created, 3 failed", self.run_command('import_books', path, errors=errors))
+        self.assertEqual([book[0] for book in self.get_books()], ["First", "Last"])
+        with open(errors, encoding='utf-8') as file:
+            failed = [json.loads(line) for line in file]
+        self.assertEqual([result['index'] for result in failed], [1, 2, 3])
+        self.assertIn('author', failed[1]['errors'])
+
+    # an interrupted import continues after the records of its checkpoint
+    def test_resume(self):
+        path = self.write_ndjson([book_data(f"Book {number}") for number in range(4)])
+        with self.assertRaises(CommandError):
+            self.run_command('import_books', path, resume=True)
+
+        with open(f'{path}.checkpoint', 'w') as checkpoint:
+            json.dump({"processed": 2}, checkpoint)
+        self.assertIn("2 created, 0 failed", self.run_command('import_books', path, resume=True))
+        self.assertEqual([book[0] for book in self.get_books()], ["Book 2", "Book 3"])
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+
+# check the sliding window rate limit with a fake clock (see throttling.py)
+# - Retry-After (wait()) is exactly when the next request fits, including across the rollover of the window,
+#   & X-RateLimit-Reset is the same time
+# - with the SQLite cache (incr_window) & with a cache without it
+class SlidingWindowTests(TestCase):
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.caches = {
+            "sqlite": SQLiteCache(os.path.join(directory, 'cache.sqlite3'), {}),
+            "locmem": LocMemCache('throttle-tests', {}),
+        }
+        self.request = Request(APIRequestFactory().get('/'))
+        self.clock = 0.0
+
+    # return a throttle of 3 requests a minute reading the fake clock
+    def get_throttle_class(self, cache):
+        test = self
+
+        class Throttle(SlidingWindowAnonRateThrottle):
+            rate = '3/min'
+
+            def timer(self):
+                return test.clock
+
+        Throttle.cache = cache
+        return Throttle
+
+    # send a request at `time`, returns whether it was allowed, its wait & its rate limit information
+    def hit(self, throttle_class, time):
+        self.clock = time
+        throttle = throttle_class()
+        allowed = throttle.allow_request(self.request, None)
+        return allowed, throttle.wait(), self.request.rate_limit_info
+
+    # a rejected request waits until one more request fits: a moment earlier is still too early
+    def check_wait(self, throttle_class, time):
+        allowed, wait, info = self.hit(throttle_class, time)
+        if allowed:
+            return False
+        self.assertEqual(info['X-RateLimit-Reset'], math.ceil(time + wait))
+        if wait > 0.01:
+            self.assertFalse(self.hit(throttle_class, time + wait - 0.01)[0], (time, wait))
+        self.assertTrue(self.hit(throttle_class, time + wait + 1e-6)[0], (time, wait))
+        return True
+
+    # requests late in a window: the next one fits only after the rollover
+    def test_retry_after_across_the_rollover(self):
+        for name, cache in self.caches.items():
+            with self.subTest(cache=name):
+                throttle_class = self.get_throttle_class(cache)
+                for time in (50, 53, 56):
+                    self.assertTrue(self.hit(throttle_class, time)[0])
+                self.assertTrue(self.check_wait(throttle_class, 59))
+
+    # requests at random times: every rejected request's wait is exact
+    def test_retry_after_of_random_requests(self):
+        rng = random.Random(0)
+        for name, cache in self.caches.items():
+            with self.subTest(cache=name):
+                throttle_class = self.get_throttle_class(cache)
+                rejected = 0
+                for _ in range(100):
+                    cache.clear()
+                    start = rng.uniform(0, 1000)
+                    self.clock = start
+                    for time in sorted(start + rng.uniform(0, 150) for _ in range(rng.randint(1, 8))):
+                        # the clock never goes back before the retry of the last rejected request
+                        if time >= self.clock:
+                            rejected += self.check_wait(throttle_class, time)
+                self.assertGreater(rejected, 10)
+
+
+# check that a request only releases the idempotency lock it holds (see idempotency.py)
+# - the action stands in for a request that outlived IDEMPOTENCY_LOCK_TIMEOUT: its lock expired & a retry took it
+class IdempotencyLockTests(TestCase):
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(api_sandbox(directory))
+        self.view = SimpleNamespace(get_client_ident=lambda request: '127.0.0.1')
+        self.request = SimpleNamespace(headers={IDEMPOTENCY_HEADER: 'key'}, path='/api/v1/books/', data={})
+        _, self.lock_key = get_idempotency_keys(self.view, self.request)
+
+    def take_lock(self):
+        self.assertIsNotNone(cache.get(self.lock_key))
+        cache.set(self.lock_key, 'retry')
+        return Response(status=400)
+
+    def test_expired_lock_is_kept(self):
+        idempotent(lambda view, request: self.take_lock())(self.view, self.request)
+        self.assertEqual(cache.get(self.lock_key), 'retry')
+
+    def test_async_expired_lock_is_kept(self):
+        async def action(view, request):
+            return self.take_lock()
+
+        async_to_sync(idempotent(action))(self.view, self.request)
+        self.assertEqual(cache.get(self.lock_key), 'retry')
+
+    def test_lock_is_released(self):
+        idempotent(lambda view, request: Response(status=400))(self.view, self.request)
+        self.assertIsNone(cache.get(self.lock_key))
+
+
+# the number of queries each request of check_query_budgets runs, as assertNumQueries counts them:
+# with the BEGIN & COMMIT of the transactions
+# - the action's budget (see @query_budget in views.py) also holds, it raises over it in the tests
+QUERY_COUNTS = {
+    "list": 1, "list filtered": 1, "search": 1, "retrieve": 1, "multi-get": 1, "fetch": 1,
+    "create": 1, "update": 2, "partial update": 2, "destroy": 4, "changes": 1, "stats": 1,
+    "checkout": 4, "return": 4, "checkout many": 4, "return many": 4,
+}
+
+
+# check the number of queries of every action of both viewsets, with an empty response cache
+# - a TransactionTestCase, so the writes run their own transactions instead of savepoints in the test's
+class QueryBudgetTests(TransactionTestCase):
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(api_sandbox(directory))
+        make_books(12)
+
+    def check_viewset(self, viewset, factory, call):
+        books = list(Book.objects.order_by('id')[:4])
+        others = Book.objects.exclude(id__in=[book.id for book in books]).order_by('id')
+        available = list(others.filter(availability=True)[:2])
+        checked_out = list(others.filter(availability=False)[:2])
+        requests = get_checked_requests(books, available, checked_out)
+        self.assertEqual({name for name, *_ in requests}, set(QUERY_COUNTS))
+
+        for name, method, actions, path, data, kwargs in requests:
+            with self.subTest(viewset=viewset.__name__, request=name):
+                cache.clear()
+                request = make_request(factory, method, path, data)
+                with self.assertNumQueries(QUERY_COUNTS[name]):
+                    response = call(viewset.as_view(actions), request, kwargs)
+                self.assertLess(response.status_code, 400)
+
+    def test_sync_actions(self):
+        self.check_viewset(BookViewSet, APIRequestFactory(), call_view)
+
+    def test_async_actions(self):
+        self.check_viewset(AsyncBookViewSet, AsyncRequestFactory(), async_to_sync(acall_view))
+
+
+# check that concurrent checkouts of the same book give it out once (see stress_loans for the load test)
+# - a TransactionTestCase, so each thread's connection sees the book & the checkouts commit their own transactions
+class ConcurrentCheckoutTests(TransactionTestCase):
+    THREADS = 8
+
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(api_sandbox(directory))
+        self.book = make_books(2)[1]
+
+    def checkout(self, barrier, statuses):
+        try:
+            client = APIClient()
+            barrier.wait()
+            response = client.post(f'/api/v1/books/{self.book.id}/checkout/', {'borrower': "Reader"}, format='json')
+            statuses.append(response.status_code)
+        finally:
+            connection.close()
+
+    def test_book_is_checked_out_once(self):
+        barrier = threading.Barrier(self.THREADS)
+        statuses = []
+        threads = [threading.Thread(target=self.checkout, args=(barrier, statuses)) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [200] + [409] * (self.THREADS - 1))
+        self.assertEqual(Loan.objects.filter(book=self.book, returned_at__isnull=True).count(), 1)
+        self.assertFalse(Book.objects.get(id=self.book.id).availability)
@@ -0,0 +1,147 @@
+# import math to round the estimated request count up
+import math
+
+# import DRF's anonymous throttle to reuse its rate parsing & client identification
+# https://www.django-rest-framework.org/api-guide/throttling/#anonratethrottle
+from rest_framework.throttling import AnonRateThrottle
+
+#########################################################################################################
+
+# define a sliding window counter throttle for anonymous clients
+# DRF's default throttle keeps a list with one timestamp per request in the cache
+# - every request reads, trims, prepends to & rewrites the whole list, so the cost grows with the rate (10k/min = 10k items)
+# this throttle keeps one integer counter per fixed window instead & estimates the sliding window from two of them:
+# - estimate = previous window count * (share of the previous window still inside the sliding window) + current window count
+# - with the SQLite cache each request is a single atomic cache operation (SQLiteCache.incr_window): both windows are
+#   read & the current one is only incremented if the request is allowed, so rejected requests are never counted
+# - other caches read both windows with one get_many & increment the current one if the request is allowed
+# https://blog.cloudflare.com/counting-things-a-lot-of-different-things/
+class SlidingWindowAnonRateThrottle(AnonRateThrottle):
+    # include the window number in the cache key so each window has its own counter
+    window_format = '%(key)s_%(window)d'
+
+    # implement the check to see if the request should be throttled
+    def allow_request(self, request, view):
+        keys = self.get_window_keys(request, view)
+        if keys is None:
+            return True
+
+        current_key, previous_key = keys
+        if hasattr(self.cache, 'incr_window'):
+            allowed, self.current, self.previous = self.cache.incr_window(
+                current_key, previous_key, self.previous_weight(), self.num_requests, self.duration * 2
+            )
+        else:
+            counts = self.cache.get_many(keys)
+            self.current, self.previous = counts.get(current_key, 0), counts.get(previous_key, 0)
+            allowed = self.fits()
+            if allowed:
+                self.current = self.increment(current_key)
+        return self.finish(request, allowed)
+
+    # the same check for the async views, using the cache's async methods
+    async def aallow_request(self, request, view):
+        keys = self.get_window_keys(request, view)
+        if keys is None:
+            return True
+
+        current_key, previous_key = keys
+        if hasattr(self.cache, 'aincr_window'):
+            allowed, self.current, self.previous = await self.cache.aincr_window(
+                current_key, previous_key, self.previous_weight(), self.num_requests, self.duration * 2
+            )
+        else:
+            counts = await self.cache.aget_many(keys)
+            self.current, self.previous = counts.get(current_key, 0), counts.get(previous_key, 0)
+            allowed = self.fits()
+            if allowed:
+                self.current = await self.aincrement(current_key)
+        return self.finish(request, allowed)
+
+    # return the cache keys of the current & previous window, or None if the request is not throttled
+    def get_window_keys(self, request, view):
+        if self.rate is None:
+            return None
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return None
+
+        # work out which fixed window the request falls into & how far into it we are
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        self.window_start = window * self.duration
+
+        current_key = self.window_format % {'key': self.key, 'window': window}
+        previous_key = self.window_format % {'key': self.key, 'window': window - 1}
+        return current_key, previous_key
+
+    # return the share of the previous window still inside the sliding window
+    def previous_weight(self):
+        return (self.duration - (self.now - self.window_start)) / self.duration
+
+    # check if one more request fits in the sliding window
+    def fits(self):
+        return self.previous * self.previous_weight() + self.current + 1 <= self.num_requests
+
+    # record the rate limit information on the request so the view can return it as headers
+    def finish(self, request, allowed):
+        request.rate_limit_info = self.get_rate_limit_info()
+
+        if not allowed:
+            return self.throttle_failure()
+        return self.throttle_success()
+
+    # add 1 to a window counter & return the new value, for caches without incr_window
+    # - the counter expires once it can no longer be the current or previous window
+    def increment(self, key):
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # the counter does not exist yet, add() only succeeds for the first request in the window
+            if self.cache.add(key, 1, self.duration * 2):
+                return 1
+            return self.cache.incr(key)
+
+    async def aincrement(self, key):
+        try:
+            return await self.cache.aincr(key)
+        except ValueError:
+            if await self.cache.aadd(key, 1, self.duration * 2):
+                return 1
+            return await self.cache.aincr(key)
+
+    # the request was already counted
+    def throttle_success(self):
+        return True
+
+    # return the X-RateLimit-* values for the current client
+    # - the reset time is when the next request will be allowed, the same time as the Retry-After of a rejected request
+    def get_rate_limit_info(self):
+        count = self.previous * self.previous_weight() + self.current
+        return {
+            "X-RateLimit-Limit": self.num_requests,
+            "X-RateLimit-Remaining": max(self.num_requests - math.ceil(count), 0),
+            "X-RateLimit-Reset": math.ceil(self.now + self.wait()),
+        }
+
+    # return the number of seconds until one more request fits in the sliding window, if no other request is made
+    # - the estimate for a request made `t` seconds from now is: previous weight at t * previous + current + 1,
+    #   so solve for the smallest t that keeps it within the limit
+    def wait(self):
+        elapsed = self.now - self.window_start
+        # requests left over once the current window is counted in full
+        available = self.num_requests - 1 - self.current
+
+        # in the current window, the previous window's share shrinks over time until 1 more request fits
+        if available > 0 or (available == 0 and not self.previous):
+            if not self.previous:
+                return 0
+            return max(self.duration * (1 - available / self.previous) - elapsed, 0)
+
+        # otherwise wait for the next window: the current window becomes the previous one & its share shrinks in turn
+        # (a limit of 1 request with 1 already made waits for the window after that, when its share is 0)
+        until_next_window = self.duration - elapsed
+        if not self.current:
+            return until_next_window
+        return until_next_window + max(self.duration * (1 - (self.num_requests - 1) / self.current), 0)
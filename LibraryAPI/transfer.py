@@ -0,0 +1,155 @@
+# import csv & io to write & read CSV one line at a time
+import csv
+import io
+
+# import itertools to skip the records that were already imported
+import itertools
+
+# import json to encode & decode NDJSON lines
+import json
+
+# import reset_queries to drop the queries logged while DEBUG is on
+from django.db import reset_queries
+
+# import DRF's encoder so exported rows are encoded like the rest of the API
+from rest_framework.utils.encoders import JSONEncoder
+
+# import models
+from .models import Book
+
+# import the fast read serializer to format the exported rows like the API
+from .serializers import BookReadSerializer
+
+# import the chunked validation & bulk_create used by the bulk endpoint
+from .bulk import chunked, create_chunk
+
+# import the response cache, invalidated after each chunk that added books
+from .caching import bump_catalogue_generation
+
+#########################################################################################################
+
+# export & import the catalogue as NDJSON (one JSON object per line) or CSV (a header line, then one book per line)
+# every step is a generator, so only a batch of rows is in memory at any time whatever the size of the catalogue:
+# - exports read the table in keyset batches (id > last id), each fetched in chunks with iterator(),
+#   so a long export never holds one read transaction open for the whole table
+# - imports validate & write the records in chunks of BULK_CHUNK_SIZE with the bulk endpoint's rules
+#   (BookSerializer's field rules & 1 uniqueness query + 1 bulk_create per chunk)
+# - with DEBUG on, django logs every query of a connection (up to 9000 of them, each bulk_create is a long one),
+#   so the log is cleared after each batch & chunk
+# used by the export_books & import_books commands & the /books/export/ & /books/import/ endpoints
+# https://docs.djangoproject.com/en/5.1/ref/models/querysets/#iterator
+
+# the formats that can be exported & imported
+TRANSFER_FORMATS = ('ndjson', 'csv')
+
+# number of rows read per keyset query & per database round trip
+EXPORT_BATCH_SIZE = 10000
+EXPORT_CHUNK_SIZE = 2000
+
+
+# yield every book after `after_id` as a .values() row, in id order
+def iter_book_rows(fields, after_id=0, batch_size=EXPORT_BATCH_SIZE):
+    while True:
+        rows = (
+            Book.objects.filter(id__gt=after_id)
+            .order_by('id')
+            .values(*fields)[:batch_size]
+        )
+        count = 0
+        for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            count += 1
+            after_id = row['id']
+            yield row
+        if count < batch_size:
+            return
+        reset_queries()
+
+
+# yield (book id, line) for one book per NDJSON line
+def ndjson_lines(rows, serializer):
+    for row in rows:
+        line = json.dumps(
+            serializer.to_representation(row),
+            cls=JSONEncoder,
+            ensure_ascii=False,
+            separators=(',', ':'),
+            )
+        yield row['id'], line + '\n'
+
+
+# return a CSV cell: booleans as true/false (like JSON) & missing values as empty cells
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return value
+
+
+# yield (book id, line) for the header (id None, unless `header` is False) & one book per CSV line
+# - a single buffer is reused for every line
+def csv_lines(rows, serializer, header=True):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(values)
+        return buffer.getvalue()
+
+    if header:
+        yield None, line(serializer.fields)
+    for row in rows:
+        yield row['id'], line([csv_value(value) for value in serializer.to_representation(row).values()])
+
+
+# yield (book id, line) for every book after `after_id` in the given format
+# - resume an export by passing the id of the last book written (& header=False for CSV)
+def export_lines(format, after_id=0, header=True):
+    serializer = BookReadSerializer()
+    rows = iter_book_rows(serializer.fields, after_id=after_id)
+    if format == 'csv':
+        return csv_lines(rows, serializer, header=header)
+    return ndjson_lines(rows, serializer)
+
+
+# yield the records of NDJSON lines (bytes or str), skipping blank lines
+# - a line that is not valid JSON is yielded as None, so it is reported as a failed record instead of stopping the import
+def read_ndjson(lines, encoding='utf-8'):
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode(encoding)
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+# yield the records of CSV lines (str) as dicts keyed by the header line, skipping blank lines
+# - the id, created_at & updated_at columns of an export are read-only in BookSerializer, so they are ignored
+def read_csv(lines):
+    for record in csv.DictReader(lines):
+        yield {field: value for field, value in record.items() if field is not None}
+
+
+# return the records of lines in the given format
+def read_records(format, lines):
+    if format == 'csv':
+        return read_csv(lines)
+    return read_ndjson(lines)
+
+
+# validate & create the records in chunks, skipping the first `skip` records (already imported by an earlier run)
+# yields (number of records processed so far, results of the chunk), the index of each result is the record number
+def import_records(records, skip=0):
+    for chunk in chunked(itertools.islice(records, skip, None), start=skip):
+        results = create_chunk(chunk)
+        # bulk_create does not send the Book signals, so invalidate the cached responses here
+        if any(result["status"] == "created" for result in results):
+            bump_catalogue_generation()
+        reset_queries()
+        yield chunk[-1][0] + 1, sorted(results, key=lambda result: result["index"])
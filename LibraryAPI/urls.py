@@ -5,9 +5,15 @@ from django.urls import path, include
 # https://www.django-rest-framework.org/api-guide/viewsets/#example
 from rest_framework.routers import DefaultRouter
 
+# import settings to choose between the sync & async views
+from django.conf import settings
+
 # import the BookViewSet class from views.py
 from .views import BookViewSet
 
+# import the async version of BookViewSet for ASGI servers
+from .async_views import AsyncBookViewSet
+
 #######################################################################################
 
 # register the viewset with a router class, that automatically determines the urlconf
@@ -20,7 +26,8 @@ router = DefaultRouter()
 # the URLs will be based on the 'books' prefix
 # set base to use for the URL names that are created
 # https://www.django-rest-framework.org/api-guide/viewsets/#viewset-actions
-router.register('books', BookViewSet, basename='books')
+# - ASGI servers get the async viewset (see LIBRARY_ASYNC_VIEWS in settings.py)
+router.register('books', AsyncBookViewSet if settings.LIBRARY_ASYNC_VIEWS else BookViewSet, basename='books')
 
 # get the URLs generated by the router
 urlpatterns = router.urls
\ No newline at end of file
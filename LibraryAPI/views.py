@@ -1,8 +1,19 @@
 from django.shortcuts import render
 
+# import json to encode streamed rows
+import json
+
 # import ModelViewSet for CRUD operationss containing minimal code
 from rest_framework.viewsets import ModelViewSet
 
+# import action to add extra routes to the viewset
+# https://www.django-rest-framework.org/api-guide/viewsets/#marking-extra-actions-for-routing
+from rest_framework.decorators import action
+
+# import the JSON parser & the NDJSON parser for bulk requests
+from rest_framework.parsers import JSONParser
+from .parsers import NDJSONParser
+
 # import Response to return API responses in correct format
 from rest_framework.response import Response
 
@@ -13,17 +24,97 @@ from rest_framework import status
 from .models import Book
 
 # import serializers
-from .serializers import BookSerializer
+from .serializers import BookSerializer, BookReadSerializer, LoanSerializer, BatchLoanSerializer, BookIdsSerializer
+
+# import the bulk create/update/delete helpers & the serializer that leaves uniqueness to the database
+from .bulk import (bulk_create_books, bulk_update_books, bulk_delete_books, BulkBookSerializer, DUPLICATE_MESSAGE,
+                   is_duplicate_error)
+
+# import the query budgets of the actions
+from .query_budget import query_budget
+
+# import the Idempotency-Key handling of the creates
+from .idempotency import idempotent
+
+# import the checkout & return of books
+from .loans import checkout_books, return_books
+
+# import the change feed of the catalogue
+from .changes import get_changes, CHANGES_PAGE_SIZE, CHANGES_MAX_PAGE_SIZE
+
+# import the catalogue statistics
+from .stats import get_stats, STATS_DIMENSIONS
+
+# import the streaming export & import of the catalogue
+from .transfer import EXPORT_CHUNK_SIZE, export_lines, read_records, import_records
+
+# import the renderers of the export formats
+from .renderers import NDJSONRenderer, CSVRenderer
+
+# import the full text search
+from .search import search_books, get_search_details
+
+# import the filters
+from .filters import BookFilterBackend
+
+# import pagination
+from .pagination import BookCursorPagination
+
+# import the response cache
+from .caching import cache_book_response, bump_catalogue_generation
+
+# import the block that skips the invalidation of the Book signals during a bulk write
+from .signals import skip_invalidation
 
 # import utils functions
-from .utils import fetch_rate_limit_info
+from .utils import add_rate_limit_headers
+
+# import the read replica routing
+from .db_routers import start_replica_reads, end_replica_reads, pin_to_primary, current_replica
+
+# import timed to record the time of the rate limit check in the request metrics
+from .metrics import timed
+
+# import BaseThrottle to identify clients the same way the throttle does
+from rest_framework.throttling import BaseThrottle
 
 # import NotFound for book endpoints that do not exist
 from rest_framework.exceptions import NotFound
 
+# import ValidationError for query parameters that cannot be used
+from rest_framework.exceptions import ValidationError
+
+# import UnsupportedMediaType for imports in a format that cannot be read
+from rest_framework.exceptions import UnsupportedMediaType
+
+# import codecs to decode the lines of an import as they are read
+import codecs
+
+# import itertools to group the exported lines
+import itertools
+
 # import error for when a book ID endpoint does not exist
 from django.http import Http404
 
+# import the errors raised by the ORM for bad ids & duplicate books
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError
+
+# import DRF's settings for the name of the non field errors
+from rest_framework.settings import api_settings
+
+# import http_date to send the Last-Modified header
+from django.utils.http import http_date
+
+# import replace_query_param to build the link to the next page of changes
+from rest_framework.utils.urls import replace_query_param
+
+# import StreamingHttpResponse to send large lists without building them in memory
+from django.http import StreamingHttpResponse
+
+# import DRF's encoder so streamed rows are encoded like the rest of the API
+from rest_framework.utils.encoders import JSONEncoder
+
 ########################################################################
 
 # Create your views here.
@@ -37,6 +128,115 @@ class BookViewSet(ModelViewSet):
     queryset = Book.objects.all()
     # specify the serializer class for this viewset
     serializer_class = BookSerializer
+    # paginate the list with a keyset cursor instead of page numbers
+    pagination_class = BookCursorPagination
+    # filter & sort the list on the server with the query parameters
+    filter_backends = [BookFilterBackend]
+    # number of rows fetched per database round trip when streaming
+    stream_chunk_size = 2000
+
+    # fields returned by the list unless ?fields= asks for others
+    # - the summary can be long, so it is only sent for a single book or when asked for
+    list_fields = ('id', 'title', 'author', 'edition', 'published_date', 'genre', 'created_at', 'updated_at', 'availability')
+
+    # return the fields the client asked for with ?fields=id,title,author (sparse fieldsets)
+    # or None to return every field
+    def get_requested_fields(self):
+        if self.action not in ('list', 'retrieve', 'fetch'):
+            return None
+
+        # a blank list (e.g. ?fields=, or ?fields=%20) is the same as no ?fields=
+        requested = self.request.query_params.get('fields', '')
+        fields = [field.strip() for field in requested.split(',') if field.strip()]
+        if not fields:
+            return self.list_fields if self.action == 'list' and not self.is_multi_get() else None
+
+        # check every requested field exists
+        known = [field.name for field in Book._meta.concrete_fields]
+        unknown = [field for field in fields if field not in known]
+        if unknown:
+            raise ValidationError(
+                {"fields": [f"Unknown field(s): {', '.join(unknown)}. Choose from: {', '.join(known)}."]}
+            )
+        return fields
+
+    # return the columns to load from the database for the requested fields, or None to load every column
+    # - the id & the sort key are always loaded because the pagination cursor needs them
+    # - a single book always loads updated_at for its Last-Modified header
+    def get_query_columns(self):
+        fields = self.get_requested_fields()
+        if fields is None:
+            return None
+
+        columns = {'id', *fields}
+        if self.action == 'retrieve':
+            columns.add('updated_at')
+        ordering = self.request.query_params.get(BookFilterBackend.ordering_param, 'id').lstrip('-')
+        if ordering in BookFilterBackend.ordering_fields:
+            columns.add(ordering)
+        return sorted(columns)
+
+    # only load the requested columns from the database, not just drop them after serializing
+    # https://docs.djangoproject.com/en/5.1/ref/models/querysets/#only
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        columns = self.get_query_columns()
+        if columns is None:
+            return queryset
+        return queryset.only(*columns)
+
+    # write with the serializer without BookSerializer's UniqueTogetherValidator, which runs a query per write:
+    # the unique constraint on (title, author) rejects duplicates in the INSERT/UPDATE itself (see raise_duplicate)
+    def get_serializer_class(self):
+        if self.action in ('create', 'update', 'partial_update'):
+            return BulkBookSerializer
+        return super().get_serializer_class()
+
+    # raise the same error as BookSerializer's UniqueTogetherValidator if a write broke the title & author
+    # unique constraint, otherwise raise the database's error again
+    def raise_duplicate(self, error):
+        if not is_duplicate_error(error):
+            raise error
+        raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [DUPLICATE_MESSAGE]})
+
+    # pass the requested fields to the serializer
+    def get_serializer(self, *args, **kwargs):
+        if self.action in ('list', 'retrieve'):
+            kwargs.setdefault('fields', self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    # return the client's IP address (behind NUM_PROXIES proxies), like the throttle
+    def get_client_ident(self, request):
+        return BaseThrottle().get_ident(request)
+
+    # time the rate limit check for the request metrics (see metrics.py)
+    def check_throttles(self, request):
+        with timed('throttle'):
+            super().check_throttles(request)
+
+    # send the reads of list & retrieve to a read replica once the request is allowed in (see db_routers.py)
+    # https://www.django-rest-framework.org/api-guide/views/#initialself-request-args-kwargs
+    replica_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in ('list', 'retrieve', 'fetch'):
+            self.replica_token = start_replica_reads(self.get_client_ident(request))
+
+    # add the rate limit info recorded by the throttle to every response, including errors & throttled requests
+    # & say which replica answered & how far behind the primary it may be
+    # https://www.django-rest-framework.org/api-guide/views/#finalize_responseself-request-response-args-kwargs
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+
+        replica = current_replica.get()
+        if replica is not None:
+            response['X-Read-Replica'] = replica[0]
+            response['X-Replica-Lag'] = f'{replica[1]:.3f}'
+        end_replica_reads(self.replica_token)
+        self.replica_token = None
+
+        return add_rate_limit_headers(request, response)
 
     # override the get_object to customise 404 handling
     # - it enables error response formatting in the retrieve() method
@@ -50,75 +250,202 @@ class BookViewSet(ModelViewSet):
             raise NotFound()    
 
     # override the list method to handle GET requests with a custom message
+    # - the default mode returns one keyset page inside the usual envelope
+    # - ?stream=1 sends every book as NDJSON without loading the table into memory
+    # - ?ids=1,2,3 returns those books (see fetch)
+    # cache the response until the catalogue changes
+    # - a page (or a search, or a list of ids) is a single query
+    @cache_book_response
+    @query_budget(1)
     def list(self, request, *args, **kwargs):
-        # get the queryset of all Book objects
-        queryset = self.get_queryset()
+        # return the books of a list of ids, whatever the filters
+        if self.is_multi_get():
+            ids = self.get_multi_get_ids()
+            return self.get_multi_get_response(ids, list(self.get_multi_get_rows(ids)))
 
-        # check if queryset is empty and provide a message
+        # get the queryset of the Book objects matching the filters in the query parameters
+        queryset = self.filter_queryset(self.get_queryset())
+
+        # stream the whole catalogue if the client opted in
+        if request.query_params.get('stream') in ('1', 'true'):
+            return self.stream_list(request, queryset)
+
+        # search the books matching the filters if the client sent a search query
+        if 'q' in request.query_params:
+            return self.search_list(request, queryset)
+
+        # fetch a single page of books in the requested order (by id by default)
+        # - read plain row dicts with values() instead of building a model instance per book
+        # https://www.django-rest-framework.org/api-guide/pagination/#cursorpagination
+        page = self.paginate_queryset(queryset.values(*self.get_query_columns()))
+        return self.get_list_response(page)
+
+    # return the envelope of a page of books
+    def get_list_response(self, page):
+        # check if the library is empty and provide a message
+        # - an empty first page means there are no books, so no extra exists() query is needed
         # use 200 status instead of 204 since there was a successful request & a message in the Response
-        # call utils function to fetch rate limit info
-        if not queryset.exists():
+        if not page and not self.paginator.has_cursor():
+            filtered = any(param in self.request.query_params for param in BookFilterBackend.filters)
             return Response(
                 {"status": "success",
                 "code": 200,
-                "message": "There are no Books in the library",
+                "message": "No Books match the filters" if filtered else "There are no Books in the library",
                 "data": [],
-                "headers": fetch_rate_limit_info(request, self),
+                **self.paginator.get_links(),
                 },
                 status=status.HTTP_200_OK,
                 )
 
-        # serialize the queryset using the serializer class
-        serializer = self.get_serializer(queryset, many=True)
-        # return a response with the serialized data
+        # serialize the page using the fast read serializer
+        serializer = BookReadSerializer(self.get_requested_fields())
+        # return a response with the serialized data & links to the neighbouring pages
         return Response(
             {
                 "status": "success",
                 "code": 200,
                 "message": "Successfully retrieved all Books",
-                "data": serializer.data,
-                "headers": fetch_rate_limit_info(request, self),
+                "data": serializer.many(page),
+                **self.paginator.get_links(),
             },
             status=status.HTTP_200_OK,
             )
-    
+
+    # return the books of the filtered queryset matching ?q= ranked by relevance (bm25), with the matched words highlighted
+    # - the filters (genre, author, availability & dates) apply to the search like to the list
+    # - page through the results with ?page_size= & ?offset=
+    def search_list(self, request, queryset):
+        books = search_books(**self.get_search_params(request), queryset=queryset)
+        return self.get_search_response(books)
+
+    # return the search text, page size & offset of the results (400 if the offset is not a count)
+    def get_search_params(self, request):
+        page_size = self.paginator.get_page_size(request)
+        return {"text": request.query_params['q'], "limit": page_size, "offset": self.get_count_param('offset')}
+
+    # return the envelope of the search results, adding the highlighted text to each book
+    def get_search_response(self, books):
+        serializer = self.get_serializer(books, many=True)
+        data = [
+            {**row, "search": get_search_details(book)}
+            for row, book in zip(serializer.data, books)
+        ]
+
+        # return a response with the ranked books
+        return Response(
+            {
+                "status": "success",
+                "code": 200,
+                "message": f"Found {len(data)} Books matching the search",
+                "data": data,
+            },
+            status=status.HTTP_200_OK,
+            )
+
+    # stream all books as newline delimited JSON (one book per line)
+    # - iterator() reads the rows in chunks with a server side cursor instead of caching the whole queryset
+    # https://docs.djangoproject.com/en/5.1/ref/request-response/#streaminghttpresponse-objects
+    # - the rows are read after the view returns, so fix the database (e.g. a replica) now
+    def stream_list(self, request, queryset):
+        return StreamingHttpResponse(
+            self.generate_ndjson(queryset.using(queryset.db).order_by('id')),
+            content_type='application/x-ndjson',
+            )
+
+    # yield one JSON encoded book per line
+    # reuse a single serializer instance so only the row changes on each iteration
+    def generate_ndjson(self, queryset):
+        serializer = BookReadSerializer(self.get_requested_fields())
+        rows = queryset.values(*self.get_query_columns())
+        for row in rows.iterator(chunk_size=self.stream_chunk_size):
+            yield json.dumps(
+                serializer.to_representation(row),
+                cls=JSONEncoder,
+                ensure_ascii=False,
+                separators=(',', ':'),
+                ) + '\n'
+
     # override the retrieve method to handle GET requests with a custom message
+    # cache the response until the catalogue changes
+    @cache_book_response
+    @query_budget(1)
     def retrieve(self, request, *args, **kwargs):
         # use defensive programming with try-except blocks
         try:
             # get the book instance to be retrieved
             instance = self.get_object()
-            # serialize the book instance using the serializer class
-            serializer = self.get_serializer(instance)
-
             # return a response with the serialized data
-            # call utils function to fetch rate limit info
-            return Response(
-                {
-                    "status": "success",
-                    "code": 200,
-                    "message": "Successfully retrieved Book",
-                    "data": serializer.data,
-                    "headers": fetch_rate_limit_info(request, self),
-                },
-                status=status.HTTP_200_OK,
-                )
+            return self.get_book_response(instance)
         
         except NotFound:
             # return a response with a message if the book does not exist
-            # call utils function to fetch rate limit info
             return Response(
                 {
                     "status": "error",
                     "code": 404,
                     "message": "No Book matches the given query",
                     "data": None,
-                    "headers": fetch_rate_limit_info(request, self),
                 },
                 status=status.HTTP_404_NOT_FOUND,
                 )
     
+    # return the envelope of a single book, with the time it last changed in the Last-Modified header
+    # - clients can send it back in If-Modified-Since to get an empty 304 response (see caching.py)
+    # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Last-Modified
+    def get_book_response(self, instance):
+        # serialize the book instance using the serializer class
+        serializer = self.get_serializer(instance)
+        return Response(
+            {
+                "status": "success",
+                "code": 200,
+                "message": "Successfully retrieved Book",
+                "data": serializer.data,
+            },
+            status=status.HTTP_200_OK,
+            headers={'Last-Modified': http_date(instance.updated_at.timestamp())},
+            )
+
+    # invalidate the cached book responses after each write
+    # - the Book signals also do this, but bumping here covers writes that do not send signals
+    # & read this client's next requests from the primary, so it sees its own write
+    # a duplicate title & author is rejected by the unique constraint when the book is saved
+    # https://www.django-rest-framework.org/api-guide/generic-views/#save-and-deletion-hooks
+    def perform_create(self, serializer):
+        try:
+            super().perform_create(serializer)
+        except IntegrityError as error:
+            self.raise_duplicate(error)
+        self.after_write()
+
+    def perform_update(self, serializer):
+        try:
+            super().perform_update(serializer)
+        except IntegrityError as error:
+            self.raise_duplicate(error)
+        self.after_write()
+
+    def after_write(self):
+        bump_catalogue_generation()
+        pin_to_primary(self.get_client_ident(self.request))
+
+    # delete the book of the URL without fetching it with get_object() first, returns the number of books deleted
+    # - QuerySet.delete() selects the book & deletes it in a transaction, sending the pre_delete & post_delete signals
+    # https://docs.djangoproject.com/en/5.1/ref/models/querysets/#delete
+    def delete_object(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.get_queryset().filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, DjangoValidationError):
+            return 0
+        _, deleted = queryset.delete()
+        return deleted.get(Book._meta.label, 0)
+
     # override the create method to handle POST requests with a custom message
+    # - a single INSERT
+    # - a retry with the same Idempotency-Key header gets the first response again, without a query (see idempotency.py)
+    @idempotent
+    @query_budget(1)
     def create(self, request, *args, **kwargs):
         # get the data from the request
         data = request.data
@@ -133,14 +460,12 @@ class BookViewSet(ModelViewSet):
         headers = self.get_success_headers(serializer.data)
 
         # return a response with a message if the book was created
-        # call utils function to fetch rate limit info
         return Response(
             {
                 "status": "success",
                 "code": 201,
                 "message": "Successfully added Book",
                 "data": serializer.data,
-                "headers": fetch_rate_limit_info(request, self),
             },            
             status=status.HTTP_201_CREATED, 
             # return headers since the generic modelviewset is was overwritten
@@ -152,6 +477,8 @@ class BookViewSet(ModelViewSet):
     # PUT replaces existing resource, ensuring sending the same data does not create duplicates
     # - DRF validates incoming request against the serializer, preventing unintended updates
     # - thus idempotent: the response is consistent for the same request sent multiple times
+    # - the book is fetched & then updated (2 queries)
+    @query_budget(2)
     def update(self, request, *args, **kwargs):
         # determine if the client wants a full (PUT) or partial (PATCH) update
         # partial will be True for PATCH and False for PUT
@@ -171,14 +498,12 @@ class BookViewSet(ModelViewSet):
         headers = self.get_success_headers(serializer.data)
         
         # return a response with the serialized data
-        # call utils function to fetch rate limit info
         return Response(
             {
                 "status": "success",
                 "code": 200,
                 "message": "Successfully updated Book",
                 "data": serializer.data,
-                "headers": fetch_rate_limit_info(request, self),
             }, 
             status=status.HTTP_200_OK,
             # return headers since the generic modelviewset is was overwritten
@@ -187,21 +512,394 @@ class BookViewSet(ModelViewSet):
             )
     
     # override the destroy method to handle DELETE requests with a custom message
+    # - a SELECT & a DELETE in a transaction (3 queries with its BEGIN, see delete_object)
+    @query_budget(3)
     def destroy(self, request, *args, **kwargs):
-        # get the book instance to be deleted
-        instance = self.get_object()
         # delete the book object from the database
-        self.perform_destroy(instance)
+        if not self.delete_object():
+            raise NotFound()
+        self.after_write()
         
         # return a response with a 204 status code
-        # call utils function to fetch rate limit info
         return Response(
             {
                 "status": "success",
                 "code": 204,
                 "message": "Successfully deleted Book",
-                "headers": fetch_rate_limit_info(request, self),
             },
             status=status.HTTP_204_NO_CONTENT,
             )
 
+    # handle bulk requests at /books/bulk/ with a list of books (a JSON array or NDJSON)
+    # - POST → create, PUT → full update, PATCH → partial update & DELETE → delete (a list of ids)
+    # - every item gets its own result, so one bad item does not fail the whole batch
+    # - the books are validated & written in chunks, with 1 uniqueness query & 1 transaction per chunk
+    @action(detail=False, methods=['post', 'put', 'patch', 'delete'], url_path='bulk',
+            parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request, *args, **kwargs):
+        # get the data from the request
+        items = request.data
+
+        # return an error if the data is not a list
+        if not isinstance(items, list):
+            return Response(
+                {
+                    "status": "error",
+                    "code": 400,
+                    "message": "Expected a list of Books",
+                    "data": None,
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        # run the bulk operation for the request method
+        # - bulk_create & bulk_update do not send the Book signals, but the delete sends post_delete for every book:
+        #   their invalidation is skipped & the cached responses are invalidated once for the whole batch below
+        with skip_invalidation():
+            if request.method == 'POST':
+                results, done, success_code = bulk_create_books(items), "added", status.HTTP_201_CREATED
+            elif request.method == 'DELETE':
+                results, done, success_code = bulk_delete_books(items), "deleted", status.HTTP_200_OK
+            else:
+                results = bulk_update_books(items, partial=request.method == 'PATCH')
+                done, success_code = "updated", status.HTTP_200_OK
+
+        # invalidate the cached responses once if any book was written
+        succeeded = sum(result["status"] != "error" for result in results)
+        if succeeded:
+            bump_catalogue_generation()
+            pin_to_primary(self.get_client_ident(request))
+
+        # use 207 when only some of the items succeeded & 400 when none did
+        if succeeded == len(results):
+            response_status, code = "success", success_code
+        elif succeeded:
+            response_status, code = "partial", status.HTTP_207_MULTI_STATUS
+        else:
+            response_status, code = "error", status.HTTP_400_BAD_REQUEST
+
+        # return a response with the result of each item
+        return Response(
+            {
+                "status": response_status,
+                "code": code,
+                "message": f"Successfully {done} {succeeded} of {len(results)} Books",
+                "data": results,
+            },
+            status=code,
+            )
+
+    # check out a book at /books/{id}/checkout/, optionally sending {"borrower": "name"} (see loans.py)
+    # - a single conditional UPDATE & the INSERT of the loan in a transaction (3 queries with its BEGIN),
+    #   so concurrent checkouts never give a book out twice
+    # - 409 if the book is already checked out (the book is only looked up then, to tell it from a missing one)
+    @action(detail=True, methods=['post'], url_path='checkout')
+    @query_budget(3)
+    def checkout(self, request, *args, **kwargs):
+        serializer = LoanSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        book_id = self.get_lookup_id()
+
+        if not checkout_books([book_id], serializer.validated_data['borrower']):
+            return self.get_loan_error(book_id, "Book is already checked out")
+        self.after_write()
+        return self.get_loan_response(book_id, False, "Successfully checked out Book")
+
+    # return a checked out book at /books/{id}/return/ (see loans.py)
+    # - a single conditional UPDATE & the UPDATE of its open loan
+    # - 409 if the book is not checked out
+    @action(detail=True, methods=['post'], url_path='return')
+    @query_budget(3)
+    def return_book(self, request, *args, **kwargs):
+        book_id = self.get_lookup_id()
+
+        if not return_books([book_id]):
+            return self.get_loan_error(book_id, "Book is not checked out")
+        self.after_write()
+        return self.get_loan_response(book_id, True, "Successfully returned Book")
+
+    # check out a list of books at /books/checkout/ with {"ids": [1, 2, 3], "borrower": "name"}
+    # - the available books are checked out & the others are listed as unavailable (checked out or missing)
+    # - one UPDATE for the whole list (up to 500 books) & one INSERT of the loans
+    @action(detail=False, methods=['post'], url_path='checkout')
+    @query_budget(3)
+    def checkout_many(self, request, *args, **kwargs):
+        serializer = BatchLoanSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+
+        checked_out = checkout_books(ids, serializer.validated_data['borrower'])
+        return self.get_batch_loan_response(ids, checked_out, "checked out", "checked_out", "unavailable")
+
+    # return a list of books at /books/return/ with {"ids": [1, 2, 3]}
+    # - the books that are not checked out (or missing) are listed as not_checked_out
+    @action(detail=False, methods=['post'], url_path='return')
+    @query_budget(3)
+    def return_many(self, request, *args, **kwargs):
+        serializer = BatchLoanSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+
+        returned = return_books(ids)
+        return self.get_batch_loan_response(ids, returned, "returned", "returned", "not_checked_out")
+
+    # return the id of the book of the URL, a 404 if it cannot be an id
+    def get_lookup_id(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        value = str(self.kwargs[lookup_url_kwarg])
+        if not value.isdigit():
+            raise NotFound()
+        return int(value)
+
+    # return the envelope of a book that was checked out or returned
+    def get_loan_response(self, book_id, availability, message):
+        return Response(
+            {
+                "status": "success",
+                "code": 200,
+                "message": message,
+                "data": {"id": book_id, "availability": availability},
+            },
+            status=status.HTTP_200_OK,
+            )
+
+    # return the 409 error of a book that could not be checked out or returned, or a 404 if it does not exist
+    def get_loan_error(self, book_id, message):
+        if not Book.objects.filter(id=book_id).exists():
+            raise NotFound()
+        return Response(
+            {
+                "status": "error",
+                "code": 409,
+                "message": message,
+                "data": None,
+            },
+            status=status.HTTP_409_CONFLICT,
+            )
+
+    # return the envelope of a batch checkout or return, with the ids that changed & the others
+    def get_batch_loan_response(self, ids, changed, done, changed_key, other_key):
+        if changed:
+            self.after_write()
+        changed_ids = set(changed)
+        others = [id for id in dict.fromkeys(ids) if id not in changed_ids]
+
+        # use 207 when only some of the books changed & 409 when none did
+        if not others:
+            response_status, code = "success", status.HTTP_200_OK
+        elif changed:
+            response_status, code = "partial", status.HTTP_207_MULTI_STATUS
+        else:
+            response_status, code = "error", status.HTTP_409_CONFLICT
+
+        return Response(
+            {
+                "status": response_status,
+                "code": code,
+                "message": f"Successfully {done} {len(changed)} of {len(changed) + len(others)} Books",
+                "data": {changed_key: changed, other_key: others},
+            },
+            status=code,
+            )
+
+    # return a query parameter that must be a whole number of at least 0 (e.g. ?after_id= & ?skip=)
+    def get_count_param(self, name):
+        value = self.request.query_params.get(name, '0')
+        if not value.isdigit():
+            raise ValidationError({name: ["A valid integer of at least 0 is required."]})
+        return int(value)
+
+    # return the books added, updated or deleted since a revision at /books/changes/?since=<revision> (see changes.py)
+    # - the first sync leaves out ?since= (or sends 0) & gets every book
+    # - apply the deleted ids, then the updated books, & send the returned revision as ?since= next time
+    # - follow `next` while `has_more` is true, choose the page size with ?page_size= (up to 1000)
+    # - the changes are read from the primary: a replica that is behind would hand out a revision it has not caught up to
+    @action(detail=False, methods=['get'], url_path='changes')
+    @query_budget(1)
+    def changes(self, request, *args, **kwargs):
+        since = self.get_count_param('since')
+        page_size = min(self.get_count_param('page_size') or CHANGES_PAGE_SIZE, CHANGES_MAX_PAGE_SIZE)
+        updated, deleted, revision, has_more = get_changes(since, page_size)
+
+        count = len(updated) + len(deleted)
+        return Response(
+            {
+                "status": "success",
+                "code": 200,
+                "message": f"Found {count} changes" if count else "There are no changes",
+                "data": {"updated": updated, "deleted": deleted},
+                "revision": revision,
+                "has_more": has_more,
+                "next": replace_query_param(request.build_absolute_uri(), 'since', revision),
+            },
+            status=status.HTTP_200_OK,
+            )
+
+    # return many books by id in one request, for clients that would otherwise retrieve them one by one
+    # - GET /books/?ids=1,2,3, or POST /books/fetch/ with {"ids": [1, 2, 3]} for lists too long for a URL (up to 500)
+    # - one query for every book, & one request for the rate limit
+    # - each book is reported in the order of the ids, in the envelope a retrieve of that id would return,
+    #   so a missing book is a 404 item; the response is 207 when some books are missing & 404 when they all are
+    # - every field is returned unless ?fields= asks for some of them
+    @action(detail=False, methods=['post'], url_path='fetch')
+    @query_budget(1)
+    def fetch(self, request, *args, **kwargs):
+        ids = self.get_multi_get_ids()
+        return self.get_multi_get_response(ids, list(self.get_multi_get_rows(ids)))
+
+    # check if the request asks for books by id
+    def is_multi_get(self):
+        return self.action == 'fetch' or (self.action == 'list' and 'ids' in self.request.query_params)
+
+    # return the ids of a multi-get, from ?ids= or the body of a POST
+    def get_multi_get_ids(self):
+        if self.action == 'fetch':
+            data = self.request.data
+        else:
+            data = {'ids': self.request.query_params['ids'].split(',')}
+        serializer = BookIdsSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['ids']
+
+    # return the query of the rows of the books of `ids` (without duplicates)
+    def get_multi_get_rows(self, ids):
+        return Book.objects.filter(id__in=set(ids)).values(*(self.get_query_columns() or ()))
+
+    # return the envelope of a multi-get, with an item for each id
+    def get_multi_get_response(self, ids, rows):
+        serializer = BookReadSerializer(self.get_requested_fields())
+        books = {row['id']: serializer.to_representation(row) for row in rows}
+        data = [
+            {"id": id, "status": "success", "code": 200, "message": "Successfully retrieved Book", "data": books[id]}
+            if id in books else
+            {"id": id, "status": "error", "code": 404, "message": "No Book matches the given query", "data": None}
+            for id in ids
+        ]
+
+        found = sum(id in books for id in ids)
+        if found == len(ids):
+            response_status, code = "success", status.HTTP_200_OK
+        elif found:
+            response_status, code = "partial", status.HTTP_207_MULTI_STATUS
+        else:
+            response_status, code = "error", status.HTTP_404_NOT_FOUND
+
+        return Response(
+            {
+                "status": response_status,
+                "code": code,
+                "message": f"Successfully retrieved {found} of {len(ids)} Books",
+                "data": data,
+            },
+            status=code,
+            )
+
+    # return the catalogue statistics at /books/stats/ (see stats.py): the number of books & of available books,
+    # in total & by genre, author & publication year
+    # - choose the groups with ?by=genre,year (all of them by default)
+    # - they are read from the CatalogueStat table, one row per group, & cached like the list until a book changes
+    @action(detail=False, methods=['get'], url_path='stats')
+    @cache_book_response
+    @query_budget(1)
+    def stats(self, request, *args, **kwargs):
+        return Response(
+            {
+                "status": "success",
+                "code": 200,
+                "message": "Successfully retrieved the catalogue statistics",
+                "data": get_stats(self.get_stats_dimensions()),
+            },
+            status=status.HTTP_200_OK,
+            )
+
+    # return the dimensions asked for with ?by=, all of them if it is not sent
+    def get_stats_dimensions(self):
+        value = self.request.query_params.get('by')
+        if value is None:
+            return list(STATS_DIMENSIONS)
+        dimensions = list(dict.fromkeys(dimension.strip() for dimension in value.split(',') if dimension.strip()))
+        if not dimensions or any(dimension not in STATS_DIMENSIONS for dimension in dimensions):
+            raise ValidationError({'by': [f"Choose one or more of {', '.join(STATS_DIMENSIONS)}, separated by commas."]})
+        return dimensions
+
+    # stream the whole catalogue as NDJSON or CSV at /books/export/
+    # - choose the format with the Accept header or ?format=ndjson (default) / ?format=csv
+    # - every field is exported in id order, resume an interrupted export with ?after_id=<last id received>
+    #   (a resumed CSV export has no header line)
+    # - the rows are read in keyset batches & sent as they are read, so memory stays flat whatever the size of the table
+    @action(detail=False, methods=['get'], url_path='export', renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request, *args, **kwargs):
+        after_id = self.get_count_param('after_id')
+        format = request.accepted_renderer.format
+        lines = export_lines(format, after_id=after_id, header=not after_id)
+
+        response = StreamingHttpResponse(
+            self.get_export_content(lines),
+            content_type=f'{request.accepted_renderer.media_type}; charset=utf-8',
+            )
+        response['Content-Disposition'] = f'attachment; filename="books.{format}"'
+        return response
+
+    # join the exported lines into chunks, so the server writes a chunk per EXPORT_CHUNK_SIZE books, not per book
+    def get_export_content(self, lines):
+        lines = (line for _, line in lines)
+        while chunk := ''.join(itertools.islice(lines, EXPORT_CHUNK_SIZE)):
+            yield chunk
+
+    # import books from an NDJSON (application/x-ndjson) or CSV (text/csv) body at /books/import/
+    # - the body is read line by line & written in chunks with the bulk endpoint's validation, not parsed into memory first
+    # - ids & created_at are not imported (they are read-only), & books that already exist are reported as duplicates,
+    #   so re-sending an export is safe
+    # - resume an interrupted import by sending the same body with ?skip=<processed of the last response>
+    # the response counts the processed, created & failed records & lists the first import_error_limit errors
+    import_error_limit = 100
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[NDJSONParser])
+    def import_books(self, request, *args, **kwargs):
+        skip = self.get_count_param('skip')
+
+        # read the raw body, rather than request.data which parses the whole of it
+        media_type = request.content_type.split(';')[0].strip().lower()
+        formats = {NDJSONRenderer.media_type: 'ndjson', CSVRenderer.media_type: 'csv'}
+        if media_type not in formats:
+            raise UnsupportedMediaType(media_type)
+        lines = codecs.iterdecode(request.stream or [], request.encoding or 'utf-8')
+
+        processed = skip
+        created = failed = 0
+        errors = []
+        for processed, results in import_records(read_records(formats[media_type], lines), skip=skip):
+            for result in results:
+                if result["status"] == "created":
+                    created += 1
+                else:
+                    failed += 1
+                    if len(errors) < self.import_error_limit:
+                        errors.append(result)
+
+        if created:
+            pin_to_primary(self.get_client_ident(request))
+
+        # use 207 when only some of the records were created & 400 when none were
+        if created and not failed:
+            response_status, code = "success", status.HTTP_201_CREATED
+        elif created:
+            response_status, code = "partial", status.HTTP_207_MULTI_STATUS
+        else:
+            response_status, code = "error", status.HTTP_400_BAD_REQUEST
+
+        return Response(
+            {
+                "status": response_status,
+                "code": code,
+                "message": f"Successfully imported {created} of {processed - skip} Books" if processed > skip
+                           else "There were no Books to import",
+                "data": {
+                    "processed": processed,
+                    "created": created,
+                    "failed": failed,
+                    "errors": errors,
+                },
+            },
+            status=code,
+            )
@@ -0,0 +1,120 @@
+# import gc to move the objects of the warm app out of the garbage collector's way
+import gc
+
+# import logging to report a step that failed
+import logging
+
+# import os to drop the database connections of a forked worker
+import os
+
+# import perf_counter to time each step
+from time import perf_counter
+
+# import the database connections & the cache to open them
+from django.db import connections
+from django.core.cache import cache
+
+# import the URL resolver to import the views & build the routes
+from django.urls import get_resolver, reverse
+
+# import get_template to compile the browsable API's templates
+from django.template.loader import get_template
+
+# import DRF's settings to import the classes they name
+from rest_framework.settings import api_settings
+from rest_framework.renderers import BrowsableAPIRenderer
+
+#########################################################################################################
+
+# warm up a worker before it serves its first request (see LIBRARY_WARMUP in settings.py)
+# a new worker imports the views, builds the URL resolver, the serializer fields & the database connection
+# on its first request, which is then ~30 times slower than the next ones
+# warm_up() does that work when wsgi.py/asgi.py load the app instead:
+# - with a server that loads the app before forking its workers (gunicorn --preload, uWSGI without lazy-apps)
+#   it runs once & every worker starts with the imports, routes & templates ready, & the database pages in the OS cache
+# - otherwise it runs in each worker when it starts
+# SQLite connections must not be used by two processes, so a forked worker drops the connections it inherits
+# & opens its own (without closing them, which could remove the parent's WAL files)
+# https://www.sqlite.org/howtocorrupt.html#_carrying_an_open_database_connection_across_a_fork_
+# https://docs.gunicorn.org/en/stable/settings.html#preload-app
+
+logger = logging.getLogger(__name__)
+
+# the routes resolved & reversed, so their views are imported & their patterns compiled
+WARMUP_PATHS = ('/api/v1/books/', '/api/v1/books/1/', '/api/v1/books/changes/')
+
+
+# import the views & build the URL resolver & its reverse lookups
+def warm_up_routes():
+    resolver = get_resolver()
+    for path in WARMUP_PATHS:
+        resolver.resolve(path)
+    reverse('books-list', kwargs={'version': 'v1'})
+
+
+# import the classes named in DRF's settings (renderers, parsers, throttles, versioning...)
+# & compile the browsable API's template
+def warm_up_drf():
+    for setting in api_settings.defaults:
+        getattr(api_settings, setting)
+    get_template(BrowsableAPIRenderer.template)
+
+
+# build the fields of the serializers
+def warm_up_serializers():
+    from .serializers import BookSerializer, BatchLoanSerializer, BookReadSerializer
+    from .bulk import BulkBookSerializer
+    BookSerializer().fields
+    BulkBookSerializer().fields
+    BatchLoanSerializer().fields
+    BookReadSerializer()
+
+
+# open the connection of each database & read a book, which loads the schema & the first pages,
+# & open the shared cache
+def warm_up_databases():
+    from .models import Book
+    for alias in connections:
+        Book.objects.using(alias).values_list('id', flat=True).first()
+    cache.get('warmup')
+
+
+# drop the database connections a forked worker inherits, it opens its own on its first query
+# (the cache opens a new connection after a fork itself, see cache_backends.py)
+def drop_inherited_connections():
+    for connection in connections.all(initialized_only=True):
+        connection.connection = None
+
+
+WARMUP_STEPS = (
+    ('routes', warm_up_routes),
+    ('drf', warm_up_drf),
+    ('serializers', warm_up_serializers),
+    ('databases', warm_up_databases),
+)
+
+forking_handled = False
+
+
+# run the warm-up steps, returns the milliseconds each took
+# - a step that fails is logged & skipped, the worker still starts (the first request then does that work)
+def warm_up():
+    global forking_handled
+    if not forking_handled:
+        os.register_at_fork(after_in_child=drop_inherited_connections)
+        forking_handled = True
+
+    timings = {}
+    for name, step in WARMUP_STEPS:
+        start = perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.warning("Warm-up step %r failed", name, exc_info=True)
+        timings[name] = (perf_counter() - start) * 1000
+
+    # the modules, routes & serializers stay for the life of the worker: leave them out of the garbage collections,
+    # which also keeps the pages a forked worker shares with its parent from being copied when they are collected
+    # https://docs.python.org/3/library/gc.html#gc.freeze
+    gc.freeze()
+    return timings
@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LibraryManagement.settings')
 
+# serve the books with the native async views (see LIBRARY_ASYNC_VIEWS in settings.py)
+os.environ.setdefault('LIBRARY_ASYNC_VIEWS', '1')
+
 application = get_asgi_application()
+
+# warm up the app before the first request, & before the server forks its workers if it loads the app first
+# (see LIBRARY_WARMUP in settings.py)
+from django.conf import settings
+
+if settings.LIBRARY_WARMUP:
+    from LibraryAPI.warmup import warm_up
+    warm_up()
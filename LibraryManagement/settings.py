@@ -15,19 +15,19 @@ from pathlib import Path
 # import os to access environment variables
 import os
 
+# import sys to tell when the tests are running
+import sys
+
 # import load_dotenv to load environment variables from .env file
 from dotenv import load_dotenv
 
 ########################################################################
-# Load environment variables from .env file
-load_dotenv()
-
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-# create an empty static directory if it does not exist
-if not os.path.exists(os.path.join(BASE_DIR, 'static')):
-    os.makedirs(os.path.join(BASE_DIR, 'static'))
+# Load environment variables from the .env file next to manage.py
+# the path is given, so loading the settings does not search the directories above the current one for a .env file
+load_dotenv(BASE_DIR / '.env')
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -58,7 +58,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware', # add whitenoise
+    'LibraryAPI.middleware.WhiteNoiseMiddleware', # add whitenoise (a version that also supports async requests)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -67,6 +67,28 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# record the time, database queries & size of every request & serve them at /metrics (see LibraryAPI/metrics.py)
+# - set LIBRARY_METRICS=1 to turn it on, the middleware is not installed otherwise
+# - set METRICS_PROFILE_RATE (e.g. 0.01) to run that share of the requests under cProfile,
+#   the ones slower than METRICS_PROFILE_SLOW_MS are saved in METRICS_PROFILE_DIR
+LIBRARY_METRICS = os.getenv('LIBRARY_METRICS', '0') == '1'
+METRICS_PROFILE_RATE = float(os.getenv('METRICS_PROFILE_RATE', 0))
+METRICS_PROFILE_SLOW_MS = float(os.getenv('METRICS_PROFILE_SLOW_MS', 500))
+METRICS_PROFILE_DIR = BASE_DIR / 'profiles'
+
+if LIBRARY_METRICS:
+    # first, so the time includes every other middleware
+    MIDDLEWARE.insert(0, 'LibraryAPI.middleware.MetricsMiddleware')
+
+# what to do when a BookViewSet action runs more queries than its budget (see LibraryAPI/query_budget.py)
+# - 'raise' (the default for `manage.py test`) raises QueryBudgetExceeded, 'log' (the default with DEBUG) logs a warning,
+#   'off' (the default in production) does not count the queries
+# - check every action with `python manage.py check_query_budgets`
+QUERY_BUDGET_MODE = os.getenv(
+    'QUERY_BUDGET_MODE',
+    'raise' if sys.argv[1:2] == ['test'] else 'log' if DEBUG else 'off',
+)
+
 ROOT_URLCONF = 'LibraryManagement.urls'
 
 TEMPLATES = [
@@ -87,17 +109,83 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'LibraryManagement.wsgi.application'
 
+# serve the books with the native async viewset (LibraryAPI.async_views.AsyncBookViewSet)
+# asgi.py turns this on, so ASGI servers (e.g. uvicorn) run the async views & WSGI servers keep the sync ones
+# set LIBRARY_ASYNC_VIEWS=0 to serve the sync views under ASGI too
+LIBRARY_ASYNC_VIEWS = os.getenv('LIBRARY_ASYNC_VIEWS', '0') == '1'
+
+# warm up the app when wsgi.py or asgi.py load it, so the first request of a worker is as fast as the next ones
+# (see LibraryAPI/warmup.py & `python manage.py startup_report`)
+# set LIBRARY_WARMUP=1 to turn it on, e.g. on servers that start new workers often
+LIBRARY_WARMUP = os.getenv('LIBRARY_WARMUP', '0') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# choose a SQLite profile with the SQLITE_PROFILE environment variable
+# - 'basic': django's defaults, a rollback journal & a new connection for every request
+# - 'tuned' (default): for several worker processes on one machine
+#     + WAL lets readers run alongside the writer & synchronous=NORMAL only syncs the WAL at checkpoints
+#     + mmap_size & cache_size keep the hot pages in memory (256 MB mapped, 64 MB page cache per connection)
+#     + connections are kept for DB_CONN_MAX_AGE seconds & checked before reuse instead of reopened per request
+#     + transactions take the write lock when they start (BEGIN IMMEDIATE), so they never fail half way through
+#       with "database is locked", & writers wait in LibraryAPI.sqlite_backend's queue for their turn
+#   WAL needs a local disk: use 'basic' if the database is on a network file system
+# https://docs.djangoproject.com/en/5.1/ref/databases/#sqlite-notes
+# https://www.sqlite.org/wal.html
+SQLITE_PROFILES = {
+    'basic': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    'tuned': {
+        'ENGINE': 'LibraryAPI.sqlite_backend',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA mmap_size=268435456;'
+                'PRAGMA cache_size=-65536;'
+                'PRAGMA temp_store=MEMORY'
+            ),
+            'transaction_mode': 'IMMEDIATE',
+            # seconds a writer waits for SQLite's lock before failing
+            'timeout': 20,
+            'write_queue': True,
+        },
+        # test in a file like production: an in-memory database shares its cache between connections, where a
+        # read that meets another connection's write fails with "database table is locked" instead of waiting
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    },
+}
+
+DATABASES = {
+    'default': SQLITE_PROFILES[os.getenv('SQLITE_PROFILE', 'tuned')],
 }
 
+# read replicas for the book list & book details (see LibraryAPI/db_routers.py)
+# - set DB_REPLICAS to a comma separated list of SQLite files, e.g. DB_REPLICAS=replica.sqlite3
+# - keep them in sync with the primary with `python manage.py sync_replica --interval 1`
+# - a client reads from the primary for REPLICA_PIN_SECONDS after it writes
+# - a replica is skipped when it may be more than REPLICA_MAX_LAG seconds behind the primary
+# https://docs.djangoproject.com/en/5.1/topics/db/multi-db/
+DATABASE_REPLICAS = []
+for number, replica in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica{number}'
+    # the test database of a replica is the primary's test database
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': BASE_DIR / replica.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['LibraryAPI.db_routers.ReplicaRouter']
+
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 30))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -139,8 +227,9 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 # more places for collectstatic to find static files
+# the static directory is optional, loading the settings does not create it (it is not in git while it is empty)
 STATICFILES_DIRS = [
-    os.path.join(BASE_DIR, 'static'),
+    directory for directory in [os.path.join(BASE_DIR, 'static')] if os.path.isdir(directory)
 ]
 
 # whitenoise configuration
@@ -154,10 +243,16 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # set up cache for throttling
 # https://www.django-rest-framework.org/api-guide/throttling/#setting-up-the-cache
 # https://docs.djangoproject.com/en/5.1/ref/settings/#caches
+# use a SQLite file so every worker process shares the same throttle counters & cached data
+# - LocMemCache gave each gunicorn worker its own copy, multiplying the rate limit by the number of workers
+# - set CACHE_LOCATION to put the file somewhere else, e.g. on a faster local disk
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'api-throttling',
+        'BACKEND': 'LibraryAPI.cache_backends.SQLiteCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache.sqlite3')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
     }
 }
 
@@ -173,10 +268,10 @@ CACHES = {
 # https://www.django-rest-framework.org/api-guide/versioning/#other-versioning-settings
 REST_FRAMEWORK = {
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
+        'LibraryAPI.throttling.SlidingWindowAnonRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
-        'anon': '100/hour',
+        'anon': os.getenv('ANON_THROTTLE_RATE', '100/hour'), # raise it when load testing, e.g. 1000000/min
     },
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
@@ -184,4 +279,9 @@ REST_FRAMEWORK = {
     'DEFAULT_VERSION': 'v1', # DRF expects version numbers without prefixes e.g. 'v', else it would duplicate into /api/vv1/
     'ALLOWED_VERSIONS': ['v1'],
     'VERSION_PARAM': 'version',
+    # render the JSON responses with orjson when it is installed (see LibraryAPI/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'LibraryAPI.renderers.EnvelopeJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
\ No newline at end of file
@@ -19,6 +19,10 @@ from django.contrib import admin
 # import include & re_path
 from django.urls import path, include, re_path
 
+# import settings & the metrics view to serve the request metrics when they are on
+from django.conf import settings
+from LibraryAPI.metrics import metrics_view
+
 ##################################################################
 
 # add a path to the app urls
@@ -30,3 +34,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     re_path(r'^api/(?P<version>(v1))/', include('LibraryAPI.urls')), # have to explicitly define which versions are allowed
 ]
+
+# serve the request metrics in the Prometheus text format at /metrics when LIBRARY_METRICS is on
+if settings.LIBRARY_METRICS:
+    urlpatterns.append(path('metrics', metrics_view, name='metrics'))
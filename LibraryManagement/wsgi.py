@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LibraryManagement.settings')
 
 application = get_wsgi_application()
+
+# warm up the app before the first request, & before the server forks its workers if it loads the app first
+# (see LIBRARY_WARMUP in settings.py)
+from django.conf import settings
+
+if settings.LIBRARY_WARMUP:
+    from LibraryAPI.warmup import warm_up
+    warm_up()